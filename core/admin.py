@@ -1,8 +1,106 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 
 # Register your models here.
-from .models import Profile, TherapistProfile, ClientProfile
+from .models import Profile, TherapistProfile, ClientProfile, TherapistAvailability, BlockedPeriod, OutboundEmail, AppointmentReminder, Feedback, TherapistRating, GoalProgress, ClientGoalStats, Thread, InboxEntry, Appointment, Goal, Message
+from .pagination import InvalidCursor, KeysetPaginator
+
+CURSOR_VAR = 'cursor'
+
+
+class KeysetChangeList(ChangeList):
+    """Pages the change list by seeking on `keyset_ordering` instead of counting and offsetting."""
+
+    keyset = True
+
+    def get_results(self, request):
+        paginator = KeysetPaginator(self.queryset, self.model_admin.keyset_ordering, per_page=self.list_per_page)
+        try:
+            page = paginator.page(request.keyset_cursor)
+        except InvalidCursor:
+            page = paginator.page()
+        self.keyset_page = page
+        self.keyset_previous_url = self.get_query_string({CURSOR_VAR: page.previous_cursor}) if page.has_previous else None
+        self.keyset_next_url = self.get_query_string({CURSOR_VAR: page.next_cursor}) if page.has_next else None
+        self.result_list = page.items
+        self.result_count = len(page.items)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        # The page-number paginator of the stock template is not used
+        self.multi_page = False
+        self.paginator = paginator
+
+
+class KeysetPaginationAdmin(admin.ModelAdmin):
+    keyset_ordering = ('-id',)
+    # Sorting by other columns would need a cursor over them too
+    sortable_by = ()
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def changelist_view(self, request, extra_context=None):
+        # The cursor is not a field lookup, keep it out of the change list filters
+        request.GET = request.GET.copy()
+        request.keyset_cursor = request.GET.pop(CURSOR_VAR, [None])[-1]
+        return super().changelist_view(request, extra_context)
+
+
+class AppointmentAdmin(KeysetPaginationAdmin):
+    keyset_ordering = ('-date', '-id')
+    list_display = ('date', 'client', 'therapist', 'confirmed')
+    list_select_related = ('client', 'therapist')
+
+
+class GoalAdmin(KeysetPaginationAdmin):
+    keyset_ordering = ('-start_date', '-id')
+    list_display = ('title', 'client', 'start_date', 'progress')
+    list_select_related = ('client',)
+
+
+class MessageAdmin(KeysetPaginationAdmin):
+    keyset_ordering = ('-timestamp', '-id')
+    list_display = ('subject', 'sender', 'receiver', 'timestamp', 'read')
+    list_select_related = ('sender', 'receiver')
+
+
+class FeedbackAdmin(KeysetPaginationAdmin):
+    keyset_ordering = ('-timestamp', '-id')
+    list_display = ('therapist', 'client', 'rating', 'timestamp')
+    list_select_related = ('client', 'therapist')
+
+
+class OutboundEmailAdmin(KeysetPaginationAdmin):
+    keyset_ordering = ('-created_at', '-id')
+    list_display = ('subject', 'to_email', 'status', 'attempts', 'created_at')
+
+
+class AppointmentReminderAdmin(KeysetPaginationAdmin):
+    list_display = ('appointment', 'recipient', 'lead_time', 'email', 'created_at')
+    list_select_related = ('appointment__client', 'recipient', 'email')
+
+
+class GoalProgressAdmin(KeysetPaginationAdmin):
+    keyset_ordering = ('-recorded_at', '-id')
+    list_display = ('goal', 'progress', 'recorded_at')
+
 
 admin.site.register(Profile)
 admin.site.register(TherapistProfile)
 admin.site.register(ClientProfile)
+admin.site.register(TherapistAvailability)
+admin.site.register(BlockedPeriod)
+admin.site.register(OutboundEmail, OutboundEmailAdmin)
+admin.site.register(AppointmentReminder, AppointmentReminderAdmin)
+admin.site.register(Feedback, FeedbackAdmin)
+admin.site.register(TherapistRating)
+admin.site.register(GoalProgress, GoalProgressAdmin)
+admin.site.register(ClientGoalStats)
+admin.site.register(Thread)
+admin.site.register(InboxEntry)
+admin.site.register(Appointment, AppointmentAdmin)
+admin.site.register(Goal, GoalAdmin)
+admin.site.register(Message, MessageAdmin)
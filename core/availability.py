@@ -0,0 +1,216 @@
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .fragments import invalidate_fragments
+from .metrics import APPOINTMENTS_BOOKED, APPOINTMENTS_CONFIRMED
+from .models import Appointment, BlockedPeriod, TherapistAvailability, TherapistProfile, MAX_SESSION_LENGTH, session_length_of
+
+SEARCH_HORIZON = timedelta(days=28)
+MAX_SERIES_LENGTH = 52
+# (weekday, start, end) of therapists who never set their own working hours
+DEFAULT_WORKING_HOURS = getattr(settings, 'DEFAULT_WORKING_HOURS', [(weekday, time(9), time(17)) for weekday in range(5)])
+
+
+def session_length_for(therapist):
+    return session_length_of(therapist.pk)
+
+
+class IntervalIndex:
+    """Sorted, merged busy intervals answering overlap queries with a binary search."""
+
+    def __init__(self, intervals=()):
+        merged = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.starts = [start for start, end in merged]
+        self.ends = [end for start, end in merged]
+
+    def overlaps(self, start, end):
+        # The only candidate is the last interval starting before `end`
+        i = bisect_left(self.starts, end) - 1
+        return i >= 0 and self.ends[i] > start
+
+
+class TherapistSchedule:
+    """Working hours and busy time of one therapist between `start` and `end`."""
+
+    def __init__(self, therapist, start, end, session_length=None, windows=None, busy=None):
+        self.therapist = therapist
+        self.start = start
+        self.end = end
+        self.session_length = session_length or session_length_for(therapist)
+        if windows is None:
+            windows = TherapistAvailability.objects.filter(therapist=therapist).values_list('weekday', 'start_time', 'end_time')
+        self.windows = defaultdict(list)
+        # Slot search and booking both fall back to the same default hours
+        for weekday, start_time, end_time in windows or DEFAULT_WORKING_HOURS:
+            self.windows[weekday].append((start_time, end_time))
+        if busy is None:
+            busy = busy_intervals([therapist.pk], start, end)[therapist.pk]
+        self.busy = IntervalIndex(busy)
+
+    def within_working_hours(self, start, end):
+        local_start, local_end = timezone.localtime(start), timezone.localtime(end)
+        if local_start.date() != local_end.date():
+            return False
+        return any(
+            window_start <= local_start.time() and local_end.time() <= window_end
+            for window_start, window_end in self.windows[local_start.weekday()]
+        )
+
+    def is_free(self, start, end=None):
+        end = end or start + self.session_length
+        return self.within_working_hours(start, end) and not self.busy.overlaps(start, end)
+
+    def free_slots(self, count, after=None):
+        """The next `count` bookable session starts after `after`, on the working hours grid."""
+        after = after or timezone.now()
+        slots = []
+        tz = timezone.get_current_timezone()
+        day = timezone.localtime(after).date()
+        while len(slots) < count and day <= timezone.localtime(self.end).date():
+            for window_start, window_end in self.windows[day.weekday()]:
+                slot = timezone.make_aware(datetime.combine(day, window_start), tz)
+                closing = timezone.make_aware(datetime.combine(day, window_end), tz)
+                while slot + self.session_length <= closing and len(slots) < count:
+                    if slot >= after and not self.busy.overlaps(slot, slot + self.session_length):
+                        slots.append(slot)
+                    slot += self.session_length
+            day += timedelta(days=1)
+        return slots
+
+
+def busy_intervals(therapist_ids, start, end):
+    """Appointments and blocked periods of the given therapists overlapping [start, end)."""
+    busy = defaultdict(list)
+    # Sessions are at most MAX_SESSION_LENGTH long, so the range scan on (therapist, date) stays bounded
+    appointments = Appointment.objects.filter(
+        therapist_id__in=therapist_ids,
+        date__gte=start - timedelta(minutes=MAX_SESSION_LENGTH),
+        date__lt=end,
+        ends_at__gt=start,
+    ).values_list('therapist_id', 'date', 'ends_at')
+    blocked = BlockedPeriod.objects.filter(
+        therapist_id__in=therapist_ids, start__lt=end, end__gt=start,
+    ).values_list('therapist_id', 'start', 'end')
+    for therapist_id, busy_start, busy_end in list(appointments) + list(blocked):
+        busy[therapist_id].append((busy_start, busy_end))
+    return busy
+
+
+def next_free_slots(therapist, count=5, after=None):
+    after = after or timezone.now()
+    return TherapistSchedule(therapist, after, after + SEARCH_HORIZON).free_slots(count, after)
+
+
+def therapists_free_at(start):
+    """Therapists who can take a full session starting at `start`, in three queries."""
+    profiles = TherapistProfile.objects.filter(profile__role='therapist').select_related('profile__user')
+    therapists = {profile.profile.user_id: profile for profile in profiles}
+    windows = defaultdict(list)
+    for therapist_id, weekday, start_time, end_time in TherapistAvailability.objects.filter(
+        therapist_id__in=list(therapists),
+    ).values_list('therapist_id', 'weekday', 'start_time', 'end_time'):
+        windows[therapist_id].append((weekday, start_time, end_time))
+    busy = busy_intervals(list(therapists), start, start + timedelta(minutes=MAX_SESSION_LENGTH))
+
+    free = []
+    for therapist_id, profile in therapists.items():
+        length = timedelta(minutes=profile.session_length)
+        schedule = TherapistSchedule(
+            profile.profile.user, start, start + length,
+            session_length=length, windows=windows[therapist_id], busy=busy[therapist_id],
+        )
+        if schedule.is_free(start):
+            free.append(profile.profile.user)
+    return free
+
+
+def check_not_past(date):
+    if date < timezone.now():
+        raise ValidationError('Sessions can only be booked in the future.')
+
+
+def book_appointment(client, therapist, date, notes=''):
+    """Create the appointment unless it clashes with the therapist's schedule.
+
+    The therapist row is locked for the duration of the check, so two clients racing
+    for the same slot cannot both get it.
+    """
+    check_not_past(date)
+    with transaction.atomic():
+        User.objects.select_for_update().get(pk=therapist.pk)
+        length = session_length_for(therapist)
+        schedule = TherapistSchedule(therapist, date, date + length, session_length=length)
+        if not schedule.within_working_hours(date, date + length):
+            raise ValidationError('%(therapist)s does not work at that time.', params={'therapist': therapist.username})
+        if schedule.busy.overlaps(date, date + length):
+            raise ValidationError('%(therapist)s is already booked at that time.', params={'therapist': therapist.username})
+        return Appointment.objects.create(client=client, therapist=therapist, date=date, ends_at=date + length, notes=notes)
+
+
+def series_dates(first, occurrences, interval_weeks=1):
+    """Start times of a weekly series (FREQ=WEEKLY;INTERVAL=interval_weeks;COUNT=occurrences).
+
+    The wall-clock time is kept in the local time zone, so sessions stay at the same hour
+    across daylight saving changes.
+    """
+    local = timezone.localtime(first)
+    tz = timezone.get_current_timezone()
+    return [
+        timezone.make_aware(datetime.combine(local.date() + timedelta(weeks=i * interval_weeks), local.time()), tz)
+        for i in range(occurrences)
+    ]
+
+
+def book_series(client, therapist, first, occurrences, interval_weeks=1, notes=''):
+    """Book a recurring series in one transaction, or nothing if any session clashes.
+
+    The whole series is checked against one load of the therapist's schedule and written
+    with a single bulk insert, so its length barely changes the number of queries.
+    """
+    if not 1 <= occurrences <= MAX_SERIES_LENGTH:
+        raise ValidationError('A series has between 1 and %(max)s sessions.', params={'max': MAX_SERIES_LENGTH})
+    check_not_past(first)
+    dates = series_dates(first, occurrences, interval_weeks)
+    with transaction.atomic():
+        User.objects.select_for_update().get(pk=therapist.pk)
+        length = session_length_for(therapist)
+        schedule = TherapistSchedule(therapist, dates[0], dates[-1] + length, session_length=length)
+        conflicts = [date for date in dates if not schedule.is_free(date, date + length)]
+        if conflicts:
+            raise ValidationError(
+                '%(therapist)s is not available on %(dates)s.',
+                params={'therapist': therapist.username, 'dates': ', '.join(timezone.localtime(date).strftime('%Y-%m-%d %H:%M') for date in conflicts)},
+            )
+        appointments = Appointment.objects.bulk_create([
+            Appointment(client=client, therapist=therapist, date=date, ends_at=date + length, notes=notes) for date in dates
+        ])
+        # bulk_create sends no signals, drop the cached sections the way appointment_changed would
+        invalidate_fragments([client.pk], ['appointments', 'past_appointments', 'therapist'])
+        invalidate_fragments([therapist.pk], ['appointments', 'past_appointments', 'goals', 'feedback'])
+    APPOINTMENTS_BOOKED.inc('series', amount=len(appointments))
+    return appointments
+
+
+def confirm_appointments(therapist, appointment_ids):
+    """Confirm the therapist's still unconfirmed appointments among `appointment_ids` with one UPDATE."""
+    appointments = Appointment.objects.filter(therapist=therapist, id__in=appointment_ids, confirmed=False)
+    with transaction.atomic():
+        client_ids = list(appointments.values_list('client_id', flat=True).distinct())
+        confirmed = appointments.update(confirmed=True)
+        if confirmed:
+            invalidate_fragments(client_ids, ['appointments', 'past_appointments'])
+            invalidate_fragments([therapist.pk], ['appointments', 'past_appointments'])
+    APPOINTMENTS_CONFIRMED.inc(amount=confirmed)
+    return confirmed
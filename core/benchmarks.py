@@ -0,0 +1,223 @@
+import statistics
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import Exists, OuterRef
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from .models import Appointment, Feedback, Goal, InboxEntry
+from .tokens import account_activation_token
+
+
+class Route:
+    """How to request one URL pattern; callables receive the `Subjects` to build their value."""
+
+    def __init__(self, role=None, method='get', kwargs=None, query=None, data=None):
+        self.role = role
+        self.method = method
+        self.kwargs = kwargs
+        self.query = query
+        self.data = data
+
+
+def _next_weekday_morning():
+    day = timezone.localtime() + timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day.replace(hour=10, minute=0, second=0, microsecond=0).isoformat()
+
+
+# One entry per named pattern in core/urls.py. POST routes only make changes that
+# leave the data as it was after the first request (marking read, confirming).
+ROUTES = {
+    'home': Route(),
+    'register': Route(),
+    'register_therapist': Route(),
+    'register_role': Route(kwargs=lambda s: {'user_id': s.client.pk}),
+    'activate': Route(kwargs=lambda s: {
+        'uidb64': urlsafe_base64_encode(force_bytes(s.client.pk)),
+        'token': account_activation_token.make_token(s.client),
+    }),
+    'dashboard': Route('client'),
+    'client_dashboard': Route('client'),
+    'therapist_dashboard': Route('therapist'),
+    'dashboard_section': Route('client', kwargs={'role': 'client', 'section': 'messages'}),
+    'client_dashboard_async': Route('client'),
+    'therapist_dashboard_async': Route('therapist'),
+    'schedule_appointment_async': Route('client'),
+    'message_thread': Route('client', kwargs=lambda s: {'thread_id': s.thread_id}),
+    'mark_messages_read': Route('client', method='post'),
+    'caseload_analytics': Route('therapist'),
+    'update_goal_progress': Route('client', kwargs=lambda s: {'goal_id': s.goal_id}),
+    'resource_catalog': Route('client', query={'q': 'anxiety'}),
+    'schedule_appointment': Route('client'),
+    'free_slots': Route('client', kwargs=lambda s: {'therapist_id': s.therapist.pk}),
+    'free_therapists': Route('client', query=lambda s: {'at': _next_weekday_morning()}),
+    'autocomplete_therapists': Route('client', query=lambda s: {'q': s.therapist.username[:3]}),
+    'autocomplete_receivers': Route('client', query=lambda s: {'q': s.therapist.username[:3]}),
+    'confirm_selected_appointments': Route('therapist', method='post', data=lambda s: {'appointment': [s.appointment.pk]}),
+    'confirm_appointment': Route('therapist', kwargs=lambda s: {'appointment_id': s.appointment.pk}),
+}
+# Routes that cannot be timed as a request/response
+SKIPPED_ROUTES = {
+    'message_events': 'streams until the client disconnects',
+    'request_timings': 'staff only, it reports on the other routes',
+    'metrics': 'staff or scraper only, it reports on the other routes',
+}
+
+
+def _middle(queryset):
+    ids = queryset.order_by('id').values_list('id', flat=True)
+    first, last = ids.first(), ids.last()
+    if first is None:
+        return None
+    return queryset.filter(id__gte=(first + last) // 2).order_by('id').first()
+
+
+class Subjects:
+    """The users and rows the benchmarked requests are about.
+
+    They come from the middle of the tables, so a typical client with their therapist
+    rather than the oldest or newest rows. A client who set goals and left feedback has
+    a history in every dashboard section.
+    """
+
+    def __init__(self):
+        # Goal routes need a goal of this client, not just any client's
+        feedback = _middle(
+            Feedback.objects.exclude(appointment=None).filter(Exists(Goal.objects.filter(client=OuterRef('client'))))
+            .select_related('appointment__client', 'appointment__therapist')
+        )
+        self.appointment = feedback.appointment if feedback else _middle(
+            Appointment.objects.filter(Exists(Goal.objects.filter(client=OuterRef('client')))).select_related('client', 'therapist')
+        )
+        if self.appointment is None:
+            raise LookupError('There are no appointments of clients with goals to benchmark with, run seed_data first.')
+        self.client = self.appointment.client
+        self.therapist = self.appointment.therapist
+        self.goal_id = Goal.objects.filter(client=self.client).values_list('id', flat=True).first()
+        self.thread_id = InboxEntry.objects.filter(user=self.client).values_list('thread_id', flat=True).first()
+
+    def user(self, role):
+        return {'client': self.client, 'therapist': self.therapist}[role]
+
+
+class QueryTally:
+    """Counts queries on every connection, including those of threads an async view fans out to."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def attach(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        connection_created.connect(self.attach)
+        for connection in connections.all():
+            self.attach(connection=connection)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.attach)
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+def request_host():
+    # A host the project accepts, 'localhost' is allowed while DEBUG is on and nothing is listed
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+def percentile(ordered, fraction):
+    # Nearest rank on an already sorted list
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+class RouteBenchmark:
+    def __init__(self, subjects, requests=20, warmup=2, cold=False):
+        self.subjects = subjects
+        self.requests = requests
+        self.warmup = warmup
+        self.cold = cold
+        self.clients = {}
+
+    def client_for(self, role):
+        if role not in self.clients:
+            client = Client(HTTP_HOST=request_host())
+            if role:
+                client.force_login(self.subjects.user(role))
+            self.clients[role] = client
+        return self.clients[role]
+
+    def request(self, name):
+        route = ROUTES[name]
+
+        def value(spec):
+            return spec(self.subjects) if callable(spec) else spec
+
+        kwargs = value(route.kwargs) or {}
+        if None in kwargs.values():
+            return None
+        url = reverse(name, kwargs=kwargs)
+        client = self.client_for(route.role)
+        if route.method == 'post':
+            return lambda: client.post(url, value(route.data) or {})
+        return lambda: client.get(url, value(route.query) or {})
+
+    def run_route(self, name):
+        send = self.request(name)
+        if send is None:
+            return None
+        for i in range(self.warmup):
+            send()
+        latencies, queries = [], []
+        with QueryTally() as tally:
+            for i in range(self.requests):
+                if self.cold:
+                    for cache in caches.all():
+                        cache.clear()
+                before = tally.count
+                started = time.perf_counter()
+                response = send()
+                latencies.append(time.perf_counter() - started)
+                queries.append(tally.count - before)
+        latencies.sort()
+        return {
+            'status': response.status_code,
+            'p50': statistics.median(latencies) * 1000,
+            'p95': percentile(latencies, 0.95) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            'throughput': len(latencies) / sum(latencies),
+            'queries': statistics.median(queries),
+            'max_queries': max(queries),
+        }
+
+    def run(self, names=None, report=None):
+        """Benchmark the routes one after the other, calling `report(name, result)` after each."""
+        results = {}
+        for name in names or ROUTES:
+            result = self.run_route(name)
+            results[name] = result
+            if report:
+                report(name, result)
+        return results
@@ -0,0 +1,95 @@
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Resource
+
+VERSION_KEY = 'resources:version'
+PAGE_SIZE = getattr(settings, 'RESOURCE_PAGE_SIZE', 10)
+# Deeper pages are refused, an OFFSET past what the database takes would fail the query
+MAX_CATALOG_PAGE = getattr(settings, 'RESOURCE_MAX_PAGE', 1000)
+CATALOG_TIMEOUT = getattr(settings, 'RESOURCE_CATALOG_TIMEOUT', 60 * 60 * 24)
+FTS_TABLE = 'core_resource_fts'
+
+
+def catalog_cache():
+    return caches[getattr(settings, 'RESOURCE_CATALOG_CACHE', 'default')]
+
+
+def catalog_version():
+    cache = catalog_cache()
+    cache.add(VERSION_KEY, 1, None)
+    return cache.get(VERSION_KEY, 1)
+
+
+def bump_catalog_version():
+    """Retire every cached catalog page, called whenever a resource is written."""
+    def bump():
+        cache = catalog_cache()
+        cache.add(VERSION_KEY, 1, None)
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            # The key was evicted between add() and incr(), any fresh value will do
+            cache.set(VERSION_KEY, 1, None)
+    transaction.on_commit(bump)
+
+
+def fts_available():
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def fts_query(query):
+    # Every word must match, as a prefix, and quoting keeps FTS5 operators out of user input
+    words = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _search(query, offset, limit):
+    if not query:
+        return list(Resource.objects.order_by('-id')[offset:offset + limit])
+    if fts_available():
+        match = fts_query(query)
+        if not match:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s OFFSET %s',
+                [match, limit, offset],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        found = Resource.objects.in_bulk(ids)
+        return [found[pk] for pk in ids if pk in found]
+    return list(
+        Resource.objects.filter(Q(title__icontains=query) | Q(description__icontains=query)).order_by('-id')[offset:offset + limit]
+    )
+
+
+def resource_page(query='', page=1, per_page=PAGE_SIZE):
+    """One page of the catalog, served from the cache until a resource is written."""
+    query = (query or '').strip()
+    page = min(max(int(page), 1), MAX_CATALOG_PAGE)
+    digest = hashlib.md5(query.encode()).hexdigest()
+    key = f'resources:v{catalog_version()}:{digest}:{page}:{per_page}'
+    cache = catalog_cache()
+    result = cache.get(key)
+    if result is None:
+        # One extra row tells us whether there is a next page without a COUNT(*)
+        rows = _search(query, (page - 1) * per_page, per_page + 1)
+        result = {
+            'resources': rows[:per_page],
+            'query': query,
+            'page': page,
+            'has_previous': page > 1,
+            'has_next': len(rows) > per_page,
+        }
+        cache.set(key, result, CATALOG_TIMEOUT)
+    return result
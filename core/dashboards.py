@@ -0,0 +1,314 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from .catalog import resource_page
+from .forms import PrivacySettingForm
+from .messaging import unread_count
+from .pagination import InvalidCursor, KeysetPaginator
+from .ratings import rating_summary
+from .fragments import CACHED_SECTIONS, fragment_cache, fragment_key, fragment_timeout
+from .models import Appointment, Goal, InboxEntry, PrivacySetting, TherapistProfile, Feedback
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_PAGE_SIZE = getattr(settings, 'DASHBOARD_PAGE_SIZE', 20)
+# Sections whose loaders take a cursor to the page of their list to show
+PAGINATED_SECTIONS = frozenset(['appointments', 'past_appointments', 'goals', 'messages', 'feedback'])
+
+# Blocking section loads of async views run here; each thread holds at most one open connection
+FANOUT_WORKERS = getattr(settings, 'DASHBOARD_FANOUT_WORKERS', 32)
+_fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='dashboard-fanout')
+
+
+class QueryCounter:
+    """Counts the queries executed on a database connection while active."""
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.connection = connections[using]
+        self.count = 0
+        self._wrapper = None
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = self.connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._wrapper.__exit__(exc_type, exc_value, traceback)
+
+
+def report_query_count(view):
+    """Log the number of queries a view used and expose it as a response header."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        started = time.perf_counter()
+        with QueryCounter() as queries:
+            response = view(request, *args, **kwargs)
+            # Template responses are rendered lazily, make sure the render is counted too
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info('%s used %d queries in %.1fms', view.__name__, queries.count, elapsed_ms)
+        response['X-Query-Count'] = str(queries.count)
+        return response
+    return wrapper
+
+
+# Each section loader returns the template context of one dashboard section. They are
+# independent of each other so a section can be loaded (and cached) on its own. Sections
+# split by the current time add 'expires_at', when their next appointment moves to the past.
+
+def paginate(queryset, ordering, cursor=None):
+    # Lists are read a page at a time, seeking past the previous page instead of counting rows
+    return KeysetPaginator(queryset, ordering, per_page=DASHBOARD_PAGE_SIZE).page(cursor)
+
+
+def next_appointment_at(appointments, now):
+    return appointments.filter(date__gte=now).order_by('date').values_list('date', flat=True).first()
+
+
+def client_upcoming_appointments(user, cursor=None):
+    # Appointments come with their therapist joined in, the template shows the username
+    page = paginate(
+        Appointment.objects.filter(client=user, date__gte=timezone.now()).select_related('therapist'), ('date', 'id'), cursor,
+    )
+    return {'upcoming_appointments': page, 'expires_at': page.items[0].date if page else None}
+
+
+def client_past_appointments(user, cursor=None):
+    now = timezone.now()
+    return {
+        'past_appointments': paginate(
+            Appointment.objects.filter(client=user, date__lt=now).select_related('therapist'), ('-date', '-id'), cursor,
+        ),
+        'expires_at': next_appointment_at(Appointment.objects.filter(client=user), now),
+    }
+
+
+def client_therapist(user):
+    # The client's therapist is the one of their next session, or of their latest one
+    now = timezone.now()
+    appointments = Appointment.objects.filter(client=user)
+    upcoming = appointments.filter(date__gte=now).order_by('date').only('therapist_id', 'date').first()
+    appointment = upcoming or appointments.filter(date__lt=now).order_by('-date').only('therapist_id').first()
+    therapist = None
+    if appointment is not None:
+        therapist = User.objects.select_related('profile__therapistprofile').filter(pk=appointment.therapist_id).first()
+    return {'therapist': therapist, 'expires_at': upcoming.date if upcoming else None}
+
+
+def client_goals(user, cursor=None):
+    return {'goals': paginate(Goal.objects.filter(client=user), ('-start_date', '-id'), cursor)}
+
+
+def resource_catalog(user):
+    # Only the first page of the shared, versioned catalog cache; the rest is on the catalog page
+    return resource_page()
+
+
+def user_messages(user, cursor=None):
+    # Summary rows per conversation, however many messages the threads hold
+    return {
+        'inbox': paginate(InboxEntry.objects.filter(user=user).select_related('thread', 'other'), ('-last_message_at', '-id'), cursor),
+        'unread_count': unread_count(user.pk),
+    }
+
+
+def user_privacy(user):
+    privacy_setting, created = PrivacySetting.objects.get_or_create(client=user)
+    return {'privacy_setting': privacy_setting, 'privacy_form': PrivacySettingForm(instance=privacy_setting)}
+
+
+def client_feedback(user, cursor=None):
+    return {'feedbacks': paginate(Feedback.objects.filter(client=user).select_related('therapist'), ('-timestamp', '-id'), cursor)}
+
+
+def therapist_upcoming_appointments(user, cursor=None):
+    page = paginate(
+        Appointment.objects.filter(therapist=user, date__gte=timezone.now()).select_related('client'), ('date', 'id'), cursor,
+    )
+    return {'upcoming_appointments': page, 'expires_at': page.items[0].date if page else None}
+
+
+def therapist_past_appointments(user, cursor=None):
+    now = timezone.now()
+    return {
+        'past_appointments': paginate(
+            Appointment.objects.filter(therapist=user, date__lt=now).select_related('client'), ('-date', '-id'), cursor,
+        ),
+        'expires_at': next_appointment_at(Appointment.objects.filter(therapist=user), now),
+    }
+
+
+def therapist_profile(user):
+    context = rating_summary(user.pk)
+    context['therapist_profile'] = TherapistProfile.objects.filter(profile__user=user).first()
+    return context
+
+
+def therapist_client_goals(user, cursor=None):
+    return {'client_goals': paginate(
+        # An IN over the therapist's clients lists each goal once, however many appointments they share
+        Goal.objects.filter(client__in=Appointment.objects.filter(therapist=user).values('client_id')).select_related('client'),
+        ('-start_date', '-id'), cursor,
+    )}
+
+
+def therapist_feedback(user, cursor=None):
+    return {'feedbacks': paginate(Feedback.objects.filter(therapist=user).select_related('client'), ('-timestamp', '-id'), cursor)}
+
+
+CLIENT_SECTIONS = {
+    'appointments': client_upcoming_appointments,
+    'past_appointments': client_past_appointments,
+    'therapist': client_therapist,
+    'goals': client_goals,
+    'resources': resource_catalog,
+    'messages': user_messages,
+    'privacy': user_privacy,
+    'feedback': client_feedback,
+}
+
+THERAPIST_SECTIONS = {
+    'appointments': therapist_upcoming_appointments,
+    'past_appointments': therapist_past_appointments,
+    'therapist': therapist_profile,
+    'goals': therapist_client_goals,
+    'resources': resource_catalog,
+    'messages': user_messages,
+    'privacy': user_privacy,
+    'feedback': therapist_feedback,
+}
+
+DASHBOARD_SECTIONS = {
+    'client': CLIENT_SECTIONS,
+    'therapist': THERAPIST_SECTIONS,
+}
+
+# Sections in the first response of a dashboard, the page fetches the others when they come into view
+ABOVE_THE_FOLD = getattr(settings, 'DASHBOARD_ABOVE_THE_FOLD', ['appointments'])
+
+
+def load_dashboard(role, user, sections=None):
+    context = {}
+    for name, loader in DASHBOARD_SECTIONS[role].items():
+        if sections is None or name in sections:
+            context.update(loader(user))
+    context.pop('expires_at', None)
+    return context
+
+
+def load_client_dashboard(user):
+    """Load everything the client dashboard renders with a fixed number of queries."""
+    return load_dashboard('client', user)
+
+
+def load_therapist_dashboard(user):
+    """Load everything the therapist dashboard renders with a fixed number of queries."""
+    return load_dashboard('therapist', user)
+
+
+def render_section(role, user, section, cursor=None):
+    """(html, seconds it may be cached) of one section."""
+    loader = DASHBOARD_SECTIONS[role][section]
+    try:
+        context = loader(user, cursor) if cursor else loader(user)
+    except InvalidCursor:
+        context = loader(user)
+    timeout = fragment_timeout(context.pop('expires_at', None))
+    context.update({'role': role, 'user': user, 'section': section})
+    return render_to_string(f'core/{section}.html', context), timeout
+
+
+def page_cursors(query):
+    """The list cursors of a dashboard request, from `<section>_cursor` query parameters."""
+    return {section: query[f'{section}_cursor'] for section in PAGINATED_SECTIONS if query.get(f'{section}_cursor')}
+
+
+def _plan_fragments(role, user, sections, cursors):
+    sections = [name for name in DASHBOARD_SECTIONS[role] if sections is None or name in sections]
+    # Only first pages are cached, later ones are a cheap seek anyway
+    keys = {fragment_key(role, user.pk, section): section for section in sections if section in CACHED_SECTIONS and section not in cursors}
+    return sections, keys
+
+
+def dashboard_fragments(role, user, sections=None, cursors=None):
+    """Rendered HTML of the dashboard sections, served from the cache where possible."""
+    cursors = cursors or {}
+    sections, keys = _plan_fragments(role, user, sections, cursors)
+    cache = fragment_cache()
+    cached = cache.get_many(keys)
+
+    fragments = {}
+    misses = defaultdict(dict)  # By timeout
+    for section in sections:
+        key = fragment_key(role, user.pk, section)
+        if key in cached:
+            fragments[section] = cached[key]
+        else:
+            fragments[section], timeout = render_section(role, user, section, cursors.get(section))
+            if key in keys and timeout:
+                misses[timeout][key] = fragments[section]
+    for timeout, renders in misses.items():
+        cache.set_many(renders, timeout)
+    return {section: mark_safe(html) for section, html in fragments.items()}
+
+
+def _call_and_close(func, *args):
+    # Pool threads open connections of their own, they must not outlive the call
+    try:
+        return func(*args)
+    finally:
+        connections.close_all()
+
+
+async def fan_out(calls):
+    """Run independent blocking (func, *args) calls at the same time and return their results in order.
+
+    The async ORM still runs every query on the one shared sync thread, so each call gets
+    a worker thread, and with it a database connection, of its own instead.
+    """
+    return await asyncio.gather(*(
+        sync_to_async(_call_and_close, thread_sensitive=False, executor=_fanout_executor)(func, *args)
+        for func, *args in calls
+    ))
+
+
+async def adashboard_fragments(role, user, sections=None, cursors=None):
+    """Async dashboard_fragments: the sections missing from the cache are rendered concurrently."""
+    cursors = cursors or {}
+    sections, keys = _plan_fragments(role, user, sections, cursors)
+    cache = fragment_cache()
+    cached = await cache.aget_many(keys)
+
+    missing = [section for section in sections if fragment_key(role, user.pk, section) not in cached]
+    rendered = dict(zip(missing, await fan_out([(render_section, role, user, section, cursors.get(section)) for section in missing])))
+    fragments = {}
+    misses = defaultdict(dict)  # By timeout
+    for section in sections:
+        key = fragment_key(role, user.pk, section)
+        if key in cached:
+            fragments[section] = cached[key]
+        else:
+            fragments[section], timeout = rendered[section]
+            if key in keys and timeout:
+                misses[timeout][key] = fragments[section]
+    for timeout, renders in misses.items():
+        await cache.aset_many(renders, timeout)
+    return {section: mark_safe(html) for section, html in fragments.items()}
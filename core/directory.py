@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Q
+
+from .models import Appointment, InboxEntry, Profile, UserNameTerm
+
+AUTOCOMPLETE_LIMIT = getattr(settings, 'AUTOCOMPLETE_LIMIT', 10)
+# Sorts after every character a name can hold, so [prefix, prefix + PREFIX_END) is all terms starting with prefix
+PREFIX_END = '\U0010ffff'
+# username, first name, last name and both names together
+TERMS_PER_USER = 4
+
+
+def normalize(text):
+    return ' '.join((text or '').lower().split())[:150]
+
+
+def name_terms(user):
+    names = [normalize(user.first_name), normalize(user.last_name)]
+    terms = {normalize(user.username), *names, normalize(' '.join(names))}
+    terms.discard('')
+    return terms
+
+
+def index_user(user, role=None, created=False):
+    """Bring the name terms of one user in line with their names and role."""
+    if role is None:
+        role = Profile.objects.filter(user=user).values_list('role', flat=True).first() or ''
+    wanted = name_terms(user)
+    current = {} if created else dict(UserNameTerm.objects.filter(user=user).values_list('term', 'role'))
+
+    stale = [term for term in current if term not in wanted]
+    if stale:
+        UserNameTerm.objects.filter(user=user, term__in=stale).delete()
+    if any(current[term] != role for term in current if term in wanted):
+        set_role(user.pk, role)
+    UserNameTerm.objects.bulk_create([
+        UserNameTerm(user=user, role=role, term=term) for term in wanted if term not in current
+    ], ignore_conflicts=created)
+
+
+def set_role(user_id, role):
+    # The names stay, only the role they are filed under changes
+    UserNameTerm.objects.filter(user_id=user_id).exclude(role=role).update(role=role)
+
+
+def index_users(profiles):
+    """Index freshly created users in one insert, e.g. after a bulk_create of their profiles."""
+    UserNameTerm.objects.bulk_create([
+        UserNameTerm(user=profile.user, role=profile.role, term=term)
+        for profile in profiles
+        for term in name_terms(profile.user)
+    ], ignore_conflicts=True)
+
+
+def counterpart_ids(user):
+    """The users `user` has appointments or conversations with."""
+    ids = set(Appointment.objects.filter(client=user).values_list('therapist_id', flat=True).distinct())
+    ids.update(Appointment.objects.filter(therapist=user).values_list('client_id', flat=True).distinct())
+    ids.update(InboxEntry.objects.filter(user=user).values_list('other_id', flat=True))
+    ids.discard(user.pk)
+    return ids
+
+
+def counterparts(user):
+    """The users of counterpart_ids as a queryset, for filtering without fetching the ids first."""
+    return User.objects.filter(
+        Q(pk__in=Appointment.objects.filter(client=user).values('therapist_id'))
+        | Q(pk__in=Appointment.objects.filter(therapist=user).values('client_id'))
+        | Q(pk__in=InboxEntry.objects.filter(user=user).values('other_id'))
+    ).exclude(pk=user.pk)
+
+
+def search_users(prefix, role=None, among=None, limit=AUTOCOMPLETE_LIMIT):
+    """Users with a name starting with `prefix`, in name order, at most `limit` of them.
+
+    A range scan over the name index, so the cost follows `limit` rather than the number
+    of users. `role` keeps to one kind of user, `among` to a set of user ids.
+    """
+    prefix = normalize(prefix)
+    terms = UserNameTerm.objects.filter(term__gte=prefix, term__lt=prefix + PREFIX_END)
+    if role is not None:
+        terms = terms.filter(role=role)
+    if among is not None:
+        if not among:
+            return []
+        terms = terms.filter(user_id__in=among)
+    # A user matches on at most TERMS_PER_USER terms, so this many rows always hold `limit` users
+    ids = []
+    for user_id in terms.order_by('term', 'user_id').values_list('user_id', flat=True)[:limit * TERMS_PER_USER]:
+        if user_id not in ids:
+            ids.append(user_id)
+    users = User.objects.in_bulk(ids[:limit])
+    return [users[user_id] for user_id in ids[:limit] if user_id in users]
@@ -1,106 +1,180 @@
 from django import forms
+from django.db.models.fields import BLANK_CHOICE_DASH
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import get_language
 from django.contrib.auth.models import User
-from .models import Profile, TherapistProfile, ClientProfile, Goal, Resource, Message, PrivacySetting, Feedback
+from .availability import MAX_SERIES_LENGTH
+from .directory import counterparts
+from .models import Profile, TherapistProfile, ClientProfile, Appointment, Goal, Resource, Message, PrivacySetting, Feedback
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Submit
+from crispy_forms.templatetags.crispy_forms_filters import as_crispy_form
+from crispy_forms.utils import TEMPLATE_PACK
+
+# Rendered HTML of blank forms, by form class, template pack and language
+_blank_renders = {}
+
+def submit_helper(label):
+    # For forms rendered with {% crispy %}, which reads the helper; shared by the class's instances
+    helper = FormHelper()
+    helper.form_method = 'post'
+    helper.add_input(Submit('submit', label))
+    return helper
+
+class CachedRenderMixin:
+    """For forms whose blank instances render the same HTML every time.
+
+    A form created without any arguments (no data, initial, instance or user) is rendered
+    once per template pack and language and the HTML reused; a bound form, with its values
+    and errors, is rendered as usual. Only for forms without per-user choices or callable
+    initials.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CachedRenderMixin, self).__init__(*args, **kwargs)
+        self.blank = not args and not kwargs
+
+def render_crispy(form, template_pack=TEMPLATE_PACK):
+    """`form|crispy`, served from the blank render cache where the form allows it."""
+    if not getattr(form, 'blank', False):
+        return as_crispy_form(form, template_pack)
+    # Labels and help texts are translated, each language gets its own render
+    key = (type(form), template_pack, get_language())
+    html = _blank_renders.get(key)
+    if html is None:
+        html = _blank_renders[key] = as_crispy_form(form, template_pack)
+    return html
+
+def forget_blank_renders():
+    _blank_renders.clear()
+
+class AutocompleteSelect(forms.Select):
+    """A select holding only the chosen option; the others are looked up at `url_name` as the user types."""
+    template_name = 'core/autocomplete_select.html'
+
+    def __init__(self, url_name, attrs=None):
+        super(AutocompleteSelect, self).__init__(attrs)
+        self.url_name = url_name
+
+    def get_context(self, name, value, attrs):
+        context = super(AutocompleteSelect, self).get_context(name, value, attrs)
+        context['widget']['url'] = reverse(self.url_name)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        # Rendering every choice would load the whole queryset, fetch the chosen one only
+        options = [self.create_option(name, '', BLANK_CHOICE_DASH[0][1], not any(value), 0)]
+        chosen = [v for v in value if str(v).isdigit()]
+        if chosen:
+            for index, obj in enumerate(self.choices.queryset.filter(pk__in=chosen), start=1):
+                option_value, label = self.choices.choice(obj)
+                options.append(self.create_option(name, option_value, label, True, index))
+        return [(None, options, 0)]
 
 class UserForm(forms.ModelForm):
+
     class Meta:
         model = User
         fields = ['username', 'email', 'password']
 
-    def __init__(self, *args, **kwargs):
-        super(UserForm, self).__init__(*args, **kwargs)
-        self.helper = FormHelper()
-        self.helper.form_method = 'post'
-        self.helper.add_input(Submit('submit', 'Save'))
-
 class ProfileForm(forms.ModelForm):
+
     class Meta:
         model = Profile
         fields = ['phone_number', 'address']
 
-    def __init__(self, *args, **kwargs):
-        super(ProfileForm, self).__init__(*args, **kwargs)
-        self.helper = FormHelper()
-        self.helper.form_method = 'post'
-        self.helper.add_input(Submit('submit', 'Save'))
-
 class TherapistProfileForm(forms.ModelForm):
+
     class Meta:
         model = TherapistProfile
-        fields = ['license_number', 'certifications', 'specializations', 'years_of_experience', 'certificate_pdf', 'id_pdf']
-
-    def __init__(self, *args, **kwargs):
-        super(TherapistProfileForm, self).__init__(*args, **kwargs)
-        self.helper = FormHelper()
-        self.helper.form_method = 'post'
-        self.helper.add_input(Submit('submit', 'Save'))
+        fields = ['license_number', 'gender', 'certifications', 'specializations', 'years_of_experience', 'certificate_pdf', 'id_pdf']
 
 class ClientProfileForm(forms.ModelForm):
+
     class Meta:
         model = ClientProfile
         fields = ['age', 'gender', 'medical_history', 'therapy_goals', 'preferred_therapist_gender', 'specific_issues', 'id_pdf']
 
-    def __init__(self, *args, **kwargs):
-        super(ClientProfileForm, self).__init__(*args, **kwargs)
-        self.helper = FormHelper()
-        self.helper.form_method = 'post'
-        self.helper.add_input(Submit('submit', 'Save'))
+class GoalForm(CachedRenderMixin, forms.ModelForm):
 
-class GoalForm(forms.ModelForm):
     class Meta:
         model = Goal
         fields = ['title', 'description', 'start_date', 'end_date', 'progress']
 
-    def __init__(self, *args, **kwargs):
-        super(GoalForm, self).__init__(*args, **kwargs)
-        self.helper = FormHelper()
-        self.helper.form_method = 'post'
-        self.helper.add_input(Submit('submit', 'Set Goal'))
+class GoalProgressForm(forms.ModelForm):
+    helper = submit_helper('Update Progress')
+
+    class Meta:
+        model = Goal
+        fields = ['progress']
+
+class ResourceForm(CachedRenderMixin, forms.ModelForm):
 
-class ResourceForm(forms.ModelForm):
     class Meta:
         model = Resource
         fields = ['title', 'description', 'link', 'file']
 
-    def __init__(self, *args, **kwargs):
-        super(ResourceForm, self).__init__(*args, **kwargs)
-        self.helper = FormHelper()
-        self.helper.form_method = 'post'
-        self.helper.add_input(Submit('submit', 'Add Resource'))
+class MessageForm(CachedRenderMixin, forms.ModelForm):
 
-class MessageForm(forms.ModelForm):
     class Meta:
         model = Message
         fields = ['receiver', 'subject', 'body']
+        widgets = {'receiver': AutocompleteSelect('autocomplete_receivers')}
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, user=None, **kwargs):
         super(MessageForm, self).__init__(*args, **kwargs)
-        self.helper = FormHelper()
-        self.helper.form_method = 'post'
-        self.helper.add_input(Submit('submit', 'Send Message'))
+        # The autocomplete only offers counterparts, a posted id has to be one of them too
+        if user is not None:
+            self.fields['receiver'].queryset = counterparts(user)
+
+class ReplyForm(forms.ModelForm):
+    helper = submit_helper('Reply')
+
+    class Meta:
+        model = Message
+        fields = ['body']
 
 class PrivacySettingForm(forms.ModelForm):
+
     class Meta:
         model = PrivacySetting
         fields = ['share_appointments', 'share_goals', 'share_resources']
 
-    def __init__(self, *args, **kwargs):
-        super(PrivacySettingForm, self).__init__(*args, **kwargs)
-        self.helper = FormHelper()
-        self.helper.form_method = 'post'
-        self.helper.add_input(Submit('submit', 'Update Settings'))
-
 class FeedbackForm(forms.ModelForm):
+
     class Meta:
         model = Feedback
-        fields = ['feedback_text', 'rating']
+        fields = ['appointment', 'rating', 'feedback_text']
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, client=None, **kwargs):
         super(FeedbackForm, self).__init__(*args, **kwargs)
-        self.helper = FormHelper()
-        self.helper.form_method = 'post'
-        self.helper.add_input(Submit('submit', 'Submit Feedback'))
+        # Feedback is given on one of the client's own past sessions, which ties it to a therapist
+        self.fields['appointment'].required = True
+        self.fields['appointment'].queryset = Appointment.objects.filter(
+            client=client, date__lt=timezone.now(),
+        ).select_related('client', 'therapist').order_by('-date')
+        self.client = client
+
+    def clean_appointment(self):
+        appointment = self.cleaned_data['appointment']
+        # The client is not a form field, so the model's unique constraint is not checked for us
+        if appointment and Feedback.objects.filter(client=self.client, appointment=appointment).exclude(pk=self.instance.pk).exists():
+            raise forms.ValidationError('You have already given feedback on this session.')
+        return appointment
+
+class AppointmentForm(CachedRenderMixin, forms.ModelForm):
 
-class AppointmentForm(forms.ModelForm): class Meta: model = Appointment fields = ['therapist', 'date', 'notes'] def __init__(self, *args, **kwargs): super(AppointmentForm, self).__init__(*args, **kwargs) self.helper = FormHelper() self.helper.form_method = 'post' self.helper.add_input(Submit('submit', 'Schedule Appointment'))
+    REPEAT_CHOICES = [(0, 'Does not repeat'), (1, 'Every week'), (2, 'Every two weeks'), (4, 'Every four weeks')]
+
+    repeat = forms.TypedChoiceField(choices=REPEAT_CHOICES, coerce=int, initial=0)
+    occurrences = forms.IntegerField(min_value=1, max_value=MAX_SERIES_LENGTH, initial=1, help_text='Number of sessions in the series')
+
+    class Meta:
+        model = Appointment
+        fields = ['therapist', 'date', 'notes']
+        widgets = {'therapist': AutocompleteSelect('autocomplete_therapists')}
+
+    def __init__(self, *args, **kwargs):
+        super(AppointmentForm, self).__init__(*args, **kwargs)
+        self.fields['therapist'].queryset = User.objects.filter(profile__role='therapist').order_by('username')
@@ -0,0 +1,37 @@
+from math import ceil
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+# Resources are shared by every user and are not cached per user
+CACHED_SECTIONS = frozenset(['appointments', 'past_appointments', 'therapist', 'goals', 'messages', 'privacy', 'feedback'])
+
+FRAGMENT_TIMEOUT = getattr(settings, 'DASHBOARD_FRAGMENT_TIMEOUT', 60 * 60)
+
+
+def fragment_cache():
+    return caches[getattr(settings, 'DASHBOARD_FRAGMENT_CACHE', 'default')]
+
+
+# Any user can ask for either dashboard's sections, each role's render is cached apart
+ROLES = ('client', 'therapist')
+
+
+def fragment_key(role, user_id, section):
+    return f'dashboard:{role}:{user_id}:{section}'
+
+
+def fragment_timeout(expires_at=None):
+    """Seconds a section may stay cached, less than FRAGMENT_TIMEOUT when it goes stale by itself at `expires_at`."""
+    if expires_at is None:
+        return FRAGMENT_TIMEOUT
+    return max(0, min(FRAGMENT_TIMEOUT, ceil((expires_at - timezone.now()).total_seconds())))
+
+
+def invalidate_fragments(user_ids, sections):
+    """Drop cached sections once the current transaction commits, so no stale render sneaks back in."""
+    keys = [fragment_key(role, user_id, section) for user_id in set(user_ids) if user_id for section in sections for role in ROLES]
+    if keys:
+        transaction.on_commit(lambda: fragment_cache().delete_many(keys))
@@ -0,0 +1,129 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from .metrics import MAIL_FAILED, MAIL_SENT, registry
+from .models import OutboundEmail
+from .tokens import account_activation_token
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = getattr(settings, 'MAIL_QUEUE_MAX_ATTEMPTS', 8)
+RETRY_BASE_DELAY = timedelta(seconds=getattr(settings, 'MAIL_QUEUE_RETRY_DELAY', 30))
+# A claimed batch is hidden from other workers for this long, if a worker dies the mail comes back
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+def queue_mail(subject, body, to_email, from_email=None):
+    return OutboundEmail.objects.create(
+        subject=subject, body=body, to_email=to_email, from_email=from_email or settings.DEFAULT_FROM_EMAIL or '',
+    )
+
+
+def verification_email(user, domain):
+    subject = 'Activate your account.'
+    body = render_to_string('core/acc_active_email.html', {
+        'user': user,
+        'domain': domain,
+        'uid': urlsafe_base64_encode(force_bytes(user.pk)),
+        'token': account_activation_token.make_token(user),
+    })
+    return OutboundEmail(subject=subject, body=body, to_email=user.email, from_email=settings.DEFAULT_FROM_EMAIL or '')
+
+
+def queue_verification_email(user, domain):
+    message = verification_email(user, domain)
+    message.save()
+    return message
+
+
+def retry_delay(attempts):
+    # 30s, 1m, 2m, 4m, ... capped at six hours, the exponent too so a large MAX_ATTEMPTS cannot overflow
+    return min(RETRY_BASE_DELAY * (2 ** min(attempts - 1, 20)), timedelta(hours=6))
+
+
+def claim_batch(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        due = OutboundEmail.objects.select_for_update(skip_locked=True).filter(
+            status='pending', next_attempt_at__lte=now,
+        ).order_by('next_attempt_at')[:batch_size]
+        batch = list(due)
+        OutboundEmail.objects.filter(pk__in=[email.pk for email in batch]).update(next_attempt_at=now + CLAIM_LEASE)
+    return batch
+
+
+def _record_failure(email, error):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = 'failed'
+        logger.error('Giving up on mail %s to %s after %d attempts: %s', email.pk, email.to_email, email.attempts, error)
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+        logger.warning('Mail %s to %s failed, retrying at %s: %s', email.pk, email.to_email, email.next_attempt_at, error)
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def send_batch(batch, connection=None):
+    """Deliver queued mail over one connection, returning (sent, failed)."""
+    sent = failed = 0
+    if not batch:
+        return sent, failed
+    # A connection passed in belongs to the caller and stays open for its next batch
+    owned = connection is None
+    connection = connection or get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        for email in batch:
+            _record_failure(email, e)
+        MAIL_FAILED.inc(amount=len(batch))
+        return sent, len(batch)
+    try:
+        for email in batch:
+            message = EmailMessage(email.subject, email.body, email.from_email or None, [email.to_email], connection=connection)
+            try:
+                message.send()
+            except Exception as e:
+                _record_failure(email, e)
+                failed += 1
+            else:
+                email.status = 'sent'
+                email.sent_at = timezone.now()
+                email.attempts += 1
+                email.save(update_fields=['status', 'sent_at', 'attempts'])
+                sent += 1
+    finally:
+        if owned:
+            connection.close()
+        MAIL_SENT.inc(amount=sent)
+        MAIL_FAILED.inc(amount=failed)
+        # The mail worker serves no requests, its counters are shared from here
+        registry.maybe_flush()
+    return sent, failed
+
+
+def drain_queue(batch_size=100, max_batches=None):
+    """Send everything that is due, all batches over one connection."""
+    total_sent = total_failed = batches = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        while max_batches is None or batches < max_batches:
+            batch = claim_batch(batch_size)
+            if not batch:
+                break
+            sent, failed = send_batch(batch, connection)
+            total_sent += sent
+            total_failed += failed
+            batches += 1
+    finally:
+        connection.close()
+    return total_sent, total_failed
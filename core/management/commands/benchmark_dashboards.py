@@ -0,0 +1,128 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory
+
+from core.dashboards import DASHBOARD_SECTIONS
+from core.fragments import fragment_cache, fragment_key
+from core.views import (
+    client_dashboard, client_dashboard_async, schedule_appointment, schedule_appointment_async,
+    therapist_dashboard, therapist_dashboard_async,
+)
+
+VIEWS = {
+    'client': ('client', client_dashboard, client_dashboard_async),
+    'therapist': ('therapist', therapist_dashboard, therapist_dashboard_async),
+    'schedule': ('client', schedule_appointment, schedule_appointment_async),
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare the sync (WSGI) and async (ASGI) dashboard views against a slow database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', choices=sorted(VIEWS), default='client')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per run.')
+        parser.add_argument('--concurrency', type=int, default=10, help='Requests in flight at once.')
+        parser.add_argument('--latency', type=float, default=20.0, help='Milliseconds added to every query.')
+        parser.add_argument('--warm', action='store_true', help='Keep the fragment cache between requests.')
+
+    def handle(self, *args, **options):
+        role, sync_view, async_view = VIEWS[options['view']]
+        user = User.objects.filter(profile__role=role, is_active=True).first()
+        if user is None:
+            raise CommandError(f'No active {role} user to benchmark with.')
+        self.user = user
+        self.role = role
+        self.warm = options['warm']
+        self.path = f"/{options['view']}/"
+
+        delay = options['latency'] / 1000
+
+        def slow_query(execute, sql, params, many, context):
+            # Stands in for a database that is far away or under load
+            time.sleep(delay)
+            return execute(sql, params, many, context)
+
+        def add_latency(sender, connection, **kwargs):
+            # Fires again whenever a thread reconnects, the wrapper must only be added once
+            if slow_query not in connection.execute_wrappers:
+                connection.execute_wrappers.append(slow_query)
+
+        connection_created.connect(add_latency)
+        for connection in connections.all():
+            add_latency(None, connection)
+        try:
+            requests, concurrency = options['requests'], options['concurrency']
+            self.report('WSGI, 1 sync worker', self.run_sync(sync_view, requests, 1))
+            self.report(f'WSGI, {concurrency} threads', self.run_sync(sync_view, requests, concurrency))
+            self.report(f'ASGI, 1 worker, {concurrency} in flight', asyncio.run(self.run_async(async_view, requests, concurrency)))
+        finally:
+            connection_created.disconnect(add_latency)
+            for connection in connections.all():
+                if slow_query in connection.execute_wrappers:
+                    connection.execute_wrappers.remove(slow_query)
+
+    def make_request(self):
+        request = RequestFactory().get(self.path)
+        request.user = self.user
+
+        async def auser():
+            return self.user
+
+        request.auser = auser
+        request.session = SessionBase()
+        request._messages = FallbackStorage(request)
+        if not self.warm:
+            # Every request renders its sections from the database
+            sections = DASHBOARD_SECTIONS.get(self.role, {})
+            fragment_cache().delete_many([fragment_key(self.role, self.user.pk, section) for section in sections])
+        return request
+
+    def timed_sync(self, view):
+        started = time.perf_counter()
+        try:
+            response = view(self.make_request())
+            if response.status_code != 200:
+                raise CommandError(f'{view.__name__} answered {response.status_code}')
+        finally:
+            connections.close_all()
+        return time.perf_counter() - started
+
+    def run_sync(self, view, requests, threads):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            latencies = list(pool.map(lambda i: self.timed_sync(view), range(requests)))
+        return time.perf_counter() - started, latencies
+
+    async def run_async(self, view, requests, concurrency):
+        limit = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with limit:
+                started = time.perf_counter()
+                response = await view(self.make_request())
+                if response.status_code != 200:
+                    raise CommandError(f'{view.__name__} answered {response.status_code}')
+                return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(one() for i in range(requests)))
+        return time.perf_counter() - started, latencies
+
+    def report(self, label, result):
+        elapsed, latencies = result
+        latencies = sorted(latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(
+            f'{label:<36} {len(latencies) / elapsed:7.1f} req/s  '
+            f'p50 {statistics.median(latencies) * 1000:7.1f}ms  p95 {p95 * 1000:7.1f}ms'
+        )
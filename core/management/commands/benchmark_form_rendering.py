@@ -0,0 +1,50 @@
+import statistics
+import time
+
+from crispy_forms.templatetags.crispy_forms_filters import as_crispy_form
+from crispy_forms.utils import TEMPLATE_PACK
+from django.core.management.base import BaseCommand
+
+from core.forms import AppointmentForm, GoalForm, MessageForm, ResourceForm, forget_blank_renders, render_crispy
+
+FORMS = {
+    'goal': GoalForm,
+    'resource': ResourceForm,
+    'message': MessageForm,
+    'appointment': AppointmentForm,
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare rendering blank dashboard forms through crispy every time with the cached render.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--form', choices=sorted(FORMS), action='append', help='Form to render, repeatable. Defaults to all.')
+        parser.add_argument('--iterations', type=int, default=200, help='Renders per form and strategy.')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        forget_blank_renders()
+        self.stdout.write(f"{'form':<12} {'crispy':>9} {'cached':>9} {'speedup':>8}")
+        totals = [0.0, 0.0]
+        for name in options['form'] or FORMS:
+            form_class = FORMS[name]
+            crispy = self.time(lambda: as_crispy_form(form_class(), TEMPLATE_PACK), iterations)
+            # The first render fills the cache, the timed ones are hits
+            render_crispy(form_class())
+            cached = self.time(lambda: render_crispy(form_class()), iterations)
+            for i, value in enumerate((crispy, cached)):
+                totals[i] += value
+            self.report(name, crispy, cached)
+        self.report('total', *totals)
+
+    def time(self, render, iterations):
+        timings = []
+        for i in range(iterations):
+            started = time.perf_counter()
+            render()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings) * 1000
+
+    def report(self, name, crispy, cached):
+        self.stdout.write(f'{name:<12} {crispy:7.3f}ms {cached:7.3f}ms {crispy / cached:7.1f}x')
@@ -0,0 +1,68 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import ROUTES, SKIPPED_ROUTES, RouteBenchmark, Subjects
+
+
+class Command(BaseCommand):
+    help = 'Time every route in core/urls.py with the test client and compare against a saved baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--route', action='append', choices=sorted(ROUTES), help='Only these routes, may be repeated.')
+        parser.add_argument('--requests', type=int, default=20, help='Timed requests per route.')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per route first.')
+        parser.add_argument('--cold', action='store_true', help='Clear the caches before every request.')
+        parser.add_argument('--save', metavar='PATH', help='Write the results to this JSON file as a baseline.')
+        parser.add_argument('--compare', metavar='PATH', help='Compare against a baseline written with --save.')
+        parser.add_argument('--tolerance', type=float, default=25.0, help='Percent p95 may grow before it counts as a regression.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = json.load(f)
+        try:
+            subjects = Subjects()
+        except LookupError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f"client {subjects.client.username}, therapist {subjects.therapist.username}, "
+            f"{options['requests']} requests per route{' with cold caches' if options['cold'] else ''}"
+        )
+        self.stdout.write(f"{'route':<32} {'status':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>7} {'queries':>7}")
+        self.regressions = []
+
+        def report(name, result):
+            if result is None:
+                self.stdout.write(f'{name:<32} skipped, nothing in the database to request')
+                return
+            line = (
+                f"{name:<32} {result['status']:>6} {result['p50']:>6.1f}ms {result['p95']:>6.1f}ms "
+                f"{result['p99']:>6.1f}ms {result['throughput']:>7.1f} {result['queries']:>7g}"
+            )
+            if baseline and baseline.get(name):
+                line += self.compare(name, result, baseline[name], options['tolerance'])
+            style = self.style.ERROR if result['status'] >= 400 else (lambda text: text)
+            self.stdout.write(style(line))
+
+        results = RouteBenchmark(subjects, options['requests'], options['warmup'], options['cold']).run(options['route'], report)
+        for name, reason in SKIPPED_ROUTES.items():
+            if not options['route']:
+                self.stdout.write(f'{name:<32} skipped, {reason}')
+
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Baseline written to {options['save']}")
+        if self.regressions:
+            raise CommandError('Regressions against the baseline: ' + ', '.join(self.regressions))
+
+    def compare(self, name, result, before, tolerance):
+        change = (result['p95'] - before['p95']) / before['p95'] * 100 if before['p95'] else 0
+        queries = result['queries'] - before['queries']
+        slower = change > tolerance
+        if slower or queries > 0:
+            self.regressions.append(name)
+        return f"  p95 {change:+.0f}%, queries {queries:+g}{'  REGRESSION' if slower or queries > 0 else ''}"
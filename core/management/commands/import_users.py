@@ -0,0 +1,225 @@
+import csv
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from core.directory import index_users
+from core.forms import UserForm, ProfileForm, ClientProfileForm, TherapistProfileForm
+from core.mail import verification_email
+from core.matching import index_therapists
+from core.models import Profile, ClientProfile, TherapistProfile, OutboundEmail
+
+ROLE_FORMS = {
+    'client': ClientProfileForm,
+    'therapist': TherapistProfileForm,
+}
+
+
+def _decodes(values):
+    # Undecodable bytes come through as lone surrogates, which do not encode back to UTF-8
+    try:
+        for value in values:
+            if isinstance(value, str):
+                value.encode('utf-8')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def read_rows(path, fmt):
+    """(line, row, error) for every record; a record that cannot be read has an error instead of a row."""
+    if path == '-':
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', errors='surrogateescape', newline='')
+    else:
+        stream = open(path, newline='', encoding='utf-8', errors='surrogateescape')
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(stream)
+            while True:
+                try:
+                    row = next(reader)
+                except StopIteration:
+                    break
+                except csv.Error as e:
+                    yield reader.line_num, None, f'Unreadable CSV row: {e}'
+                    continue
+                if not _decodes([*row, *row.values()]):
+                    yield reader.line_num, None, 'Not valid UTF-8.'
+                else:
+                    yield reader.line_num, row, None
+        else:
+            for line, text in enumerate(stream, start=1):
+                if not text.strip():
+                    continue
+                try:
+                    row = json.loads(text)
+                except ValueError as e:
+                    yield line, None, f'Invalid JSON: {e}'
+                    continue
+                if not isinstance(row, dict):
+                    yield line, None, 'Expected a JSON object.'
+                elif not _decodes([*row, *row.values()]):
+                    yield line, None, 'Not valid UTF-8.'
+                else:
+                    yield line, row, None
+    finally:
+        # Closing the wrapper would close stdin's buffer with it
+        if path == '-':
+            stream.detach()
+        else:
+            stream.close()
+
+
+def hash_passwords(passwords):
+    return [make_password(password) for password in passwords]
+
+
+class Command(BaseCommand):
+    help = 'Import clients and therapists from a CSV or JSONL file, validating rows with the registration forms.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file, or - for stdin.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension.')
+        parser.add_argument('--role', choices=['client', 'therapist'], help='Role for rows without a "role" column.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=None, help='Processes used to hash passwords.')
+        parser.add_argument('--domain', help='Domain used in activation links. Without it no activation mail is queued.')
+        parser.add_argument('--active', action='store_true', help='Create active accounts instead of sending activation mail.')
+        parser.add_argument('--rejects', help='Write rejected rows with their errors to this JSONL file.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        if path == '-' and not options['format']:
+            raise CommandError('--format is required when reading from stdin')
+        self.options = options
+        self.imported = 0
+        self.rejected = []
+        self.seen_usernames = set()
+
+        started = time.perf_counter()
+        rows = read_rows(path, fmt)
+        self.workers = options['workers'] or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            self.pool = pool
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                self.import_batch(batch)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{self.imported} imported, {len(self.rejected)} rejected, {self.imported / elapsed:.0f} rows/s')
+
+        elapsed = time.perf_counter() - started
+        self.report(elapsed)
+
+    def validate(self, row):
+        role = row.get('role') or self.options['role']
+        if role not in ROLE_FORMS:
+            return None, {'role': ['Missing or unknown role.']}
+        forms = [UserForm(row), ProfileForm(row), ROLE_FORMS[role](row)]
+        errors = {}
+        for form in forms:
+            # Uniqueness is checked for the whole batch at once, skip the per-row query
+            if isinstance(form, UserForm):
+                form.validate_unique = lambda: None
+            if not form.is_valid():
+                errors.update({field: list(messages) for field, messages in form.errors.items()})
+        # Compare the cleaned username, the raw value may be a number or a list
+        username = forms[0].cleaned_data.get('username')
+        if username is not None and username in self.seen_usernames:
+            errors.setdefault('username', []).append('Duplicate username in the import.')
+        if errors:
+            return None, errors
+        self.seen_usernames.add(username)
+        return (role, forms), None
+
+    def import_batch(self, batch):
+        valid = []
+        for line, row, error in batch:
+            if error:
+                self.rejected.append({'line': line, 'username': None, 'errors': {'__all__': [error]}})
+                continue
+            result, errors = self.validate(row)
+            if errors:
+                self.rejected.append({'line': line, 'username': row.get('username'), 'errors': errors})
+            else:
+                valid.append((line, row, result))
+
+        usernames = [forms[0].cleaned_data['username'] for _, _, (_, forms) in valid]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        for (line, _, _), username in zip(valid, usernames):
+            if username in existing:
+                self.rejected.append({'line': line, 'username': username, 'errors': {'username': ['A user with that username already exists.']}})
+        valid = [item for item, username in zip(valid, usernames) if username not in existing]
+        if not valid:
+            return
+
+        passwords = [forms[0].cleaned_data['password'] for _, _, (_, forms) in valid]
+        chunk = max(1, len(passwords) // (self.workers * 4))
+        hashed = [h for part in self.pool.map(hash_passwords, [passwords[i:i + chunk] for i in range(0, len(passwords), chunk)]) for h in part]
+
+        try:
+            users = self.save_batch(valid, hashed)
+        except IntegrityError as e:
+            # Another writer got there first; reject the batch rather than abort the import
+            for line, _, (_, forms) in valid:
+                self.rejected.append({'line': line, 'username': forms[0].cleaned_data['username'], 'errors': {'__all__': [f'Not saved: {e}']}})
+            return
+        self.imported += len(users)
+
+    def save_batch(self, valid, hashed):
+        with transaction.atomic():
+            users = []
+            for (_, _, (_, forms)), password in zip(valid, hashed):
+                user = forms[0].save(commit=False)
+                user.password = password
+                user.is_active = self.options['active']
+                users.append(user)
+            User.objects.bulk_create(users)
+
+            profiles = []
+            for user, (_, _, (role, forms)) in zip(users, valid):
+                profile = forms[1].save(commit=False)
+                profile.user = user
+                profile.role = role
+                profiles.append(profile)
+            Profile.objects.bulk_create(profiles)
+            index_users(profiles)
+
+            clients, therapists = [], []
+            for profile, (_, _, (role, forms)) in zip(profiles, valid):
+                role_profile = forms[2].save(commit=False)
+                role_profile.profile = profile
+                (therapists if role == 'therapist' else clients).append(role_profile)
+            ClientProfile.objects.bulk_create(clients)
+            TherapistProfile.objects.bulk_create(therapists)
+            # bulk_create skips post_save, so the name and matching indexes have to be fed directly
+            index_therapists(therapists)
+
+            if self.options['domain'] and not self.options['active']:
+                OutboundEmail.objects.bulk_create([verification_email(user, self.options['domain']) for user in users if user.email])
+        return users
+
+    def report(self, elapsed):
+        rate = self.imported / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {self.imported} users in {elapsed:.1f}s ({rate:.0f} rows/s), rejected {len(self.rejected)}'
+        ))
+        if self.options['rejects']:
+            with open(self.options['rejects'], 'w', encoding='utf-8') as out:
+                for reject in self.rejected:
+                    out.write(json.dumps(reject) + '\n')
+        for reject in self.rejected[:20]:
+            self.stderr.write(f"line {reject['line']} ({reject['username']}): {json.dumps(reject['errors'])}")
+        if len(self.rejected) > 20:
+            self.stderr.write(f'... and {len(self.rejected) - 20} more')
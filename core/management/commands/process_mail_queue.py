@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.mail import drain_queue
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbound mail, either once or continuously as a background worker.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Messages sent per SMTP connection.')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit.')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep when the queue is empty.')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = drain_queue(batch_size=options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f'Sent {sent} messages, {failed} failed')
+            if options['once']:
+                break
+            if not sent and not failed:
+                time.sleep(options['interval'])
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.messaging import rebuild_inbox
+
+
+class Command(BaseCommand):
+    help = 'Recompute the inbox rows (latest message and unread count) from the messages table.'
+
+    def handle(self, *args, **options):
+        entries = rebuild_inbox()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {entries} inbox entries'))
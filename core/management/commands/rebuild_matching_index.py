@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.matching import index_therapists
+from core.models import SpecializationTerm, TherapistProfile
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the therapist specialization index from scratch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        profiles = TherapistProfile.objects.only('id', 'specializations', 'certifications').order_by('id')
+        indexed = 0
+        with transaction.atomic():
+            SpecializationTerm.objects.all().delete()
+            batch = []
+            for profile in profiles.iterator(chunk_size=batch_size):
+                batch.append(profile)
+                if len(batch) == batch_size:
+                    index_therapists(batch)
+                    indexed += len(batch)
+                    batch = []
+            index_therapists(batch)
+            indexed += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} therapists'))
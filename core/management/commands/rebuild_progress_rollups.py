@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.progress import rebuild_progress_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-client goal rollups from goals and their progress history.'
+
+    def handle(self, *args, **options):
+        count = rebuild_progress_rollups()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt goal rollups for {count} clients'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute the therapist rating summaries from the feedback table.'
+
+    def handle(self, *args, **options):
+        therapists = rebuild_ratings()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating summaries for {therapists} therapists'))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.seeding import DatasetGenerator
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a synthetic dataset for local benchmarks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--therapists', type=int, default=None, help='Defaults to one therapist per 25 clients.')
+        parser.add_argument('--appointments', type=int, default=10, help='Average appointments per client.')
+        parser.add_argument('--goals', type=int, default=3, help='Average goals per client.')
+        parser.add_argument('--messages', type=int, default=20, help='Average messages per client.')
+        parser.add_argument('--feedback', type=int, default=2, help='Average feedback entries per client.')
+        parser.add_argument('--resources', type=int, default=200)
+        parser.add_argument('--prefix', default='seed', help='Usernames are <prefix>_c<n> and <prefix>_t<n>.')
+        parser.add_argument('--password', default='password', help='Password of every generated user.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed gives the same data.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Clients written per transaction.')
+
+    def handle(self, *args, **options):
+        generator = DatasetGenerator(
+            clients=options['clients'], therapists=options['therapists'], appointments=options['appointments'],
+            goals=options['goals'], messages=options['messages'], feedback=options['feedback'],
+            resources=options['resources'], prefix=options['prefix'], password=options['password'],
+            seed=options['seed'], batch_size=options['batch_size'],
+        )
+        if generator.existing_users():
+            raise CommandError(f"Users named {options['prefix']}_* already exist, pick another --prefix.")
+
+        started = time.perf_counter()
+
+        def progress(counts):
+            rows = sum(counts.values())
+            self.stdout.write(f'{rows} rows, {rows / (time.perf_counter() - started):.0f} rows/s')
+
+        counts = generator.run(progress)
+        elapsed = time.perf_counter() - started
+        for label, count in sorted(counts.items()):
+            self.stdout.write(f'{label:<28} {count:>10}')
+        self.stdout.write(self.style.SUCCESS(f'Created {sum(counts.values())} rows in {elapsed:.1f}s'))
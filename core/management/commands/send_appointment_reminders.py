@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.mail import drain_queue
+from core.reminders import REMINDER_BATCH_SIZE, queue_due_reminders
+
+
+class Command(BaseCommand):
+    help = 'Mail clients and therapists about upcoming appointments, either once or continuously as a scheduler.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=REMINDER_BATCH_SIZE, help='Appointments queued per transaction.')
+        parser.add_argument('--once', action='store_true', help='Queue and send the due reminders once and exit.')
+        parser.add_argument('--interval', type=float, default=60.0, help='Seconds between two scans.')
+        parser.add_argument('--queue-only', action='store_true', help='Only queue the mail, process_mail_queue sends it.')
+
+    def handle(self, *args, **options):
+        while True:
+            queued = queue_due_reminders(batch_size=options['batch_size'])
+            if queued:
+                self.stdout.write(f'Queued {queued} reminders')
+            if not options['queue_only']:
+                sent, failed = drain_queue(batch_size=options['batch_size'])
+                if sent or failed:
+                    self.stdout.write(f'Sent {sent} messages, {failed} failed')
+            if options['once']:
+                break
+            time.sleep(options['interval'])
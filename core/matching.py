@@ -0,0 +1,116 @@
+import re
+from collections import Counter
+
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Least
+from django.utils import timezone
+
+from .models import Appointment, SpecializationTerm, TherapistProfile
+
+STOPWORDS = frozenset('''
+    a an and are as at be by for from has have i in is it my of on or our that the their this to
+    with without me we you your very also been being more most other some such than then too
+'''.split())
+
+# How much one shared term, a matching gender, a year of experience and a booked session count
+OVERLAP_WEIGHT = 3.0
+GENDER_WEIGHT = 2.0
+EXPERIENCE_WEIGHT = 0.1
+EXPERIENCE_CAP = 20
+LOAD_PENALTY = 0.2
+
+SPECIALIZATION_WEIGHT = 2
+CERTIFICATION_WEIGHT = 1
+
+
+def normalize(word):
+    # Cheap plural folding so "phobias" meets "phobia" and "anxieties" meets "anxiety"
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def tokenize(*texts):
+    terms = set()
+    for text in texts:
+        for word in re.findall(r'[a-z0-9]+', (text or '').lower()):
+            if len(word) > 2 and word not in STOPWORDS:
+                terms.add(normalize(word)[:64])
+    return terms
+
+
+def therapist_terms(profile):
+    weights = Counter()
+    for term in tokenize(profile.certifications):
+        weights[term] = CERTIFICATION_WEIGHT
+    for term in tokenize(profile.specializations):
+        weights[term] = max(weights[term], SPECIALIZATION_WEIGHT)
+    return weights
+
+
+def index_therapist(profile):
+    """Bring the index entries of one therapist in line with their profile text."""
+    wanted = therapist_terms(profile)
+    current = dict(SpecializationTerm.objects.filter(therapist=profile).values_list('term', 'weight'))
+
+    stale = [term for term in current if term not in wanted]
+    if stale:
+        SpecializationTerm.objects.filter(therapist=profile, term__in=stale).delete()
+    changed = [term for term, weight in wanted.items() if term in current and current[term] != weight]
+    for term in changed:
+        SpecializationTerm.objects.filter(therapist=profile, term=term).update(weight=wanted[term])
+    SpecializationTerm.objects.bulk_create([
+        SpecializationTerm(therapist=profile, term=term, weight=weight)
+        for term, weight in wanted.items() if term not in current
+    ])
+
+
+def index_therapists(profiles):
+    """Index freshly created therapists in one insert, e.g. after a bulk_create."""
+    SpecializationTerm.objects.bulk_create([
+        SpecializationTerm(therapist=profile, term=term, weight=weight)
+        for profile in profiles
+        for term, weight in therapist_terms(profile).items()
+    ], ignore_conflicts=True)
+
+
+def match_therapists(client_profile, k=5):
+    """Rank therapists for a client by shared issues, gender preference, experience and load.
+
+    Only therapists sharing at least one term with the client are scored, and the scoring and
+    ordering happen in the database, so only the best k rows are loaded.
+    Returns a list of (score, therapist_profile), best first.
+    """
+    terms = tokenize(client_profile.specific_issues, client_profile.therapy_goals)
+    if not terms:
+        return []
+
+    overlap = (
+        SpecializationTerm.objects.filter(therapist=OuterRef('pk'), term__in=terms)
+        .values('therapist').annotate(total=Sum('weight')).values('total')
+    )
+    load = (
+        Appointment.objects.filter(therapist=OuterRef('profile__user'), date__gte=timezone.now())
+        .values('therapist').annotate(n=Count('id')).values('n')
+    )
+    preferred_gender = client_profile.preferred_therapist_gender
+    if preferred_gender and preferred_gender != 'No Preference':
+        gender = Case(When(gender=preferred_gender, then=Value(GENDER_WEIGHT)), default=Value(0.0))
+    else:
+        gender = Value(0.0)
+    score = ExpressionWrapper(
+        OVERLAP_WEIGHT * F('overlap') + gender
+        + EXPERIENCE_WEIGHT * Least(F('years_of_experience'), Value(EXPERIENCE_CAP))
+        - LOAD_PENALTY * F('load'),
+        output_field=FloatField(),
+    )
+    ranked = (
+        TherapistProfile.objects.annotate(overlap=Subquery(overlap))
+        .filter(overlap__gt=0)
+        .annotate(load=Coalesce(Subquery(load), 0), score=score)
+        .select_related('profile__user')
+        .order_by('-score', '-id')[:k]
+    )
+    return [(therapist.score, therapist) for therapist in ranked]
@@ -0,0 +1,154 @@
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header, quote_etag
+
+from .models import Appointment, ClientProfile, Resource, TherapistProfile
+from .storage import PDF_MAGIC, document_storage
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def can_access(user, name):
+    """Clients see their own ID, their therapists see it too; certificates are shown to the
+    therapist's clients, therapist IDs only to the therapist; resources to everyone logged in."""
+    if user.is_staff or Resource.objects.filter(file=name).exists():
+        return True
+
+    client_owners = list(ClientProfile.objects.filter(id_pdf=name).values_list('profile__user_id', flat=True))
+    if user.id in client_owners:
+        return True
+    if client_owners and Appointment.objects.filter(client_id__in=client_owners, therapist=user).exists():
+        return True
+
+    therapist_owners = list(TherapistProfile.objects.filter(id_pdf=name).values_list('profile__user_id', flat=True))
+    certificate_owners = list(TherapistProfile.objects.filter(certificate_pdf=name).values_list('profile__user_id', flat=True))
+    if user.id in therapist_owners or user.id in certificate_owners:
+        return True
+    return bool(certificate_owners) and Appointment.objects.filter(client=user, therapist_id__in=certificate_owners).exists()
+
+
+def storage_for(name):
+    return document_storage() if name.startswith('cas/') else default_storage
+
+
+def file_etag(name, stat):
+    # Content-addressed names already are a hash of the bytes
+    base = os.path.basename(name)
+    if name.startswith('cas/'):
+        return quote_etag(os.path.splitext(base)[0])
+    return quote_etag(f'{stat.st_size:x}-{int(stat.st_mtime):x}')
+
+
+def content_headers(path, name):
+    """(Content-Type, Content-Disposition) of a stored file.
+
+    Only files that really are PDFs are shown inline; anything else, whatever its name
+    claims, is a download the browser never renders in the site's origin.
+    """
+    with open(path, 'rb') as f:
+        is_pdf = f.read(len(PDF_MAGIC)) == PDF_MAGIC
+    filename = os.path.basename(name)
+    if is_pdf:
+        return 'application/pdf', content_disposition_header(False, filename)
+    return 'application/octet-stream', content_disposition_header(True, filename)
+
+
+def parse_range(header, size):
+    """The (start, end) of a single `bytes=` range, None for no range, or False if unsatisfiable."""
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_file(request, name):
+    storage = storage_for(name)
+    path = storage.path(name)
+    stat = os.stat(path)
+    etag = file_etag(name, stat)
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+    content_type, disposition = content_headers(path, name)
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return _with_validators(HttpResponseNotModified(), etag, last_modified)
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since and not if_none_match:
+        try:
+            if int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp():
+                return _with_validators(HttpResponseNotModified(), etag, last_modified)
+        except (TypeError, ValueError):
+            pass
+
+    # Let the front-end server send the bytes when it is set up for it
+    accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', None)
+    if accel_prefix:
+        response = HttpResponse()
+        # A URI to nginx, spaces and non-ASCII characters in stored names have to be escaped
+        response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(name)
+        return _with_validators(response, etag, last_modified, content_type, disposition)
+    if getattr(settings, 'MEDIA_SENDFILE', False):
+        response = HttpResponse()
+        response['X-Sendfile'] = path
+        return _with_validators(response, etag, last_modified, content_type, disposition)
+
+    byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+    if_range = request.headers.get('If-Range')
+    if byte_range and if_range and if_range.strip() != etag:
+        byte_range = None
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(_read_range(path, start, length), status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response['Content-Length'] = str(length)
+    else:
+        # FileResponse hands the open file to wsgi.file_wrapper, which can use sendfile()
+        response = FileResponse(open(path, 'rb'))
+    response['Accept-Ranges'] = 'bytes'
+    return _with_validators(response, etag, last_modified, content_type, disposition)
+
+
+def _with_validators(response, etag, last_modified, content_type=None, disposition=None):
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Cache-Control'] = 'private, max-age=3600'
+    if content_type:
+        response['Content-Type'] = content_type
+        response['Content-Disposition'] = disposition
+    # Uploaded content runs no scripts and is never sniffed into something renderable
+    response['X-Content-Type-Options'] = 'nosniff'
+    response['Content-Security-Policy'] = 'sandbox'
+    return response
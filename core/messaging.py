@@ -0,0 +1,148 @@
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Greatest
+from django.utils.text import Truncator
+
+from .events import get_broker, publish_to_users, user_channel
+from .fragments import invalidate_fragments
+from .models import InboxEntry, Message, Thread
+
+PREVIEW_LENGTH = 200
+INBOX_SIZE = 20
+
+
+def preview(body):
+    return Truncator(' '.join(body.split())).chars(PREVIEW_LENGTH)
+
+
+def message_payload(message):
+    return {
+        'id': message.pk,
+        'thread': message.thread_id,
+        'sender': message.sender.username,
+        'receiver': message.receiver.username,
+        'subject': message.subject,
+        'body': message.body,
+        'preview': preview(message.body),
+        'timestamp': message.timestamp.isoformat(),
+    }
+
+
+def send_message(sender, receiver, subject, body, thread=None):
+    """Store a message, starting a new thread unless one is given; its inbox rows change with it."""
+    with transaction.atomic():
+        return Message.objects.create(thread=thread, sender=sender, receiver=receiver, subject=subject, body=body)
+
+
+def assign_thread(message):
+    # Messages saved without a thread start a conversation of their own
+    if message.thread_id is None:
+        message.thread = Thread.objects.create(subject=message.subject)
+
+
+def record_message(message):
+    """Make a new message the latest of its thread in both participants' inbox rows."""
+    latest = {
+        'last_message': message,
+        'last_sender_id': message.sender_id,
+        'last_preview': preview(message.body),
+        'last_message_at': message.timestamp,
+    }
+    participants = [(message.sender_id, message.receiver_id, 0), (message.receiver_id, message.sender_id, int(not message.read))]
+    with transaction.atomic():
+        for user_id, other_id, unread in participants:
+            InboxEntry.objects.get_or_create(user_id=user_id, thread_id=message.thread_id, defaults={'other_id': other_id})
+            InboxEntry.objects.filter(user_id=user_id, thread_id=message.thread_id).update(
+                unread_count=F('unread_count') + unread, **latest,
+            )
+
+
+def forget_message(message):
+    """Take a deleted message back out of the inbox rows of its thread."""
+    with transaction.atomic():
+        if not message.read:
+            InboxEntry.objects.filter(user_id=message.receiver_id, thread_id=message.thread_id, unread_count__gt=0).update(
+                unread_count=F('unread_count') - 1,
+            )
+        latest = Message.objects.filter(thread_id=message.thread_id).order_by('-timestamp').first()
+        entries = InboxEntry.objects.filter(thread_id=message.thread_id)
+        if latest is None:
+            entries.delete()
+        else:
+            entries.filter(last_message__isnull=True).update(
+                last_message=latest, last_sender_id=latest.sender_id,
+                last_preview=preview(latest.body), last_message_at=latest.timestamp,
+            )
+
+
+def rebuild_inbox(thread_ids=None):
+    """Recompute the inbox rows of the given threads, or of every thread, from their messages."""
+    messages = Message.objects.filter(thread__isnull=False).order_by('thread_id', 'timestamp', 'id')
+    entries = InboxEntry.objects.all()
+    if thread_ids is not None:
+        messages = messages.filter(thread_id__in=thread_ids)
+        entries = entries.filter(thread_id__in=thread_ids)
+    rows = {}
+    for message in messages.iterator():
+        for user_id, other_id in ((message.sender_id, message.receiver_id), (message.receiver_id, message.sender_id)):
+            entry = rows.setdefault((user_id, message.thread_id), InboxEntry(user_id=user_id, thread_id=message.thread_id))
+            entry.other_id = other_id
+            entry.last_message = message
+        if not message.read:
+            rows[message.receiver_id, message.thread_id].unread_count += 1
+    for entry in rows.values():
+        latest = entry.last_message
+        entry.last_sender_id = latest.sender_id
+        entry.last_preview = preview(latest.body)
+        entry.last_message_at = latest.timestamp
+    with transaction.atomic():
+        entries.delete()
+        InboxEntry.objects.bulk_create(rows.values())
+    return len(rows)
+
+
+def inbox(user, limit=INBOX_SIZE):
+    # The most recent conversations straight off the (user, -last_message_at) index
+    return list(InboxEntry.objects.filter(user=user).select_related('thread', 'other').order_by('-last_message_at')[:limit])
+
+
+def unread_count(user_id):
+    # Only rows with unread messages are in the partial index being summed
+    return InboxEntry.objects.filter(user_id=user_id, unread_count__gt=0).aggregate(total=Sum('unread_count'))['total'] or 0
+
+
+def publish_new_message(message):
+    publish_to_users([message.sender_id, message.receiver_id], 'message', message_payload(message))
+
+
+def publish_unread_count(user_id):
+    """Send the receiver their unread count once the write that changed it is committed."""
+    def publish():
+        get_broker().publish(user_channel(user_id), {'type': 'unread', 'data': {'count': unread_count(user_id)}})
+
+    transaction.on_commit(publish)
+
+
+def mark_read(user, message_ids=None, thread=None):
+    """Mark the user's received messages read, all of them or only some messages or one thread."""
+    messages = Message.objects.filter(receiver=user, read=False)
+    entries = InboxEntry.objects.filter(user=user, unread_count__gt=0)
+    if message_ids is not None:
+        messages = messages.filter(id__in=message_ids)
+    if thread is not None:
+        messages = messages.filter(thread=thread)
+        entries = entries.filter(thread=thread)
+    with transaction.atomic():
+        if message_ids is None:
+            updated = messages.update(read=True)
+            entries.update(unread_count=0)
+        else:
+            per_thread = dict(messages.values('thread_id').annotate(n=Count('id')).values_list('thread_id', 'n'))
+            updated = messages.update(read=True)
+            for thread_id, count in per_thread.items():
+                entries.filter(thread_id=thread_id).update(unread_count=Greatest(F('unread_count') - count, 0))
+        if updated:
+            # update() sends no signals, do what the Message handlers would have done
+            invalidate_fragments([user.pk], ['messages'])
+            publish_unread_count(user.pk)
+    return updated
@@ -0,0 +1,275 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+# Seconds; the profiling middleware buckets in milliseconds, Prometheus wants seconds
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+QUERY_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200]
+FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)  # Seconds
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(labels), value] for labels, value in self.values.items()]
+
+    def samples(self, values):
+        for labels, value in values:
+            yield '', labels, value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def merge(self, merged, values):
+        for labels, value in values:
+            key = tuple(labels)
+            merged[key] = merged.get(key, 0) + value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                # One count per bucket, one for +Inf, then the sum
+                counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(labels), list(counts)] for labels, counts in self.values.items()]
+
+    def merge(self, merged, values):
+        for labels, counts in values:
+            key = tuple(labels)
+            if key in merged:
+                merged[key] = [a + b for a, b in zip(merged[key], counts)]
+            else:
+                merged[key] = list(counts)
+
+    def samples(self, values):
+        for labels, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ['+Inf'], counts):
+                cumulative += count
+                yield '_bucket', labels + [('le', bound)], cumulative
+            yield '_count', labels, cumulative
+            yield '_sum', labels, counts[-1]
+
+
+class Gauge(Metric):
+    """A value read when metrics are scraped, e.g. a queue length from the database."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, read, labels=()):
+        super().__init__(name, documentation, labels)
+        self.read = read
+
+    def snapshot(self):
+        # Read at scrape time, nothing to share between processes
+        return []
+
+    def merge(self, merged, values):
+        pass
+
+
+class Registry:
+    """Metrics of this process, summed with those other worker processes flushed to METRICS_DIR.
+
+    Updating a counter or histogram only touches memory. Every FLUSH_INTERVAL seconds,
+    and on exit, a process writes its totals to its own file; a scrape of any worker adds
+    up the files of all of them. Without METRICS_DIR every process reports only itself.
+    Files are named by pid and start time, and a process removes the files of dead ones
+    when it first flushes, so the directory must not be shared between hosts.
+    """
+
+    def __init__(self, directory=None):
+        self.metrics = {}
+        self.directory = directory
+        self.last_flush = 0.0
+        self.pid = None
+        self.started = None
+        self.pruned = False
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DURATION_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name, documentation, read, labels=()):
+        return self.register(Gauge(name, documentation, read, labels))
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items() if metric.kind != 'gauge'}
+
+    def path(self):
+        pid = os.getpid()
+        if pid != self.pid:
+            # A forked worker, or one given the pid of a dead one, starts a file of its own
+            self.pid, self.started = pid, time.time_ns()
+        return os.path.join(self.directory, f'metrics-{self.pid}-{self.started}.json')
+
+    def prune(self):
+        """Remove the files of worker processes that are no longer running."""
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*-*.json')):
+            try:
+                pid = int(os.path.basename(path).split('-')[1])
+            except ValueError:
+                continue
+            if not _running(pid):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def maybe_flush(self):
+        # Called after every request, almost always just a clock read
+        if self.directory and time.monotonic() - self.last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if not self.directory:
+            return
+        self.last_flush = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+        if not self.pruned:
+            self.prune()
+            self.pruned = True
+        path = self.path()
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(f'{path}.tmp', path)
+
+    def collect(self):
+        """{name: {labels: value}} over all processes, this one read live."""
+        snapshots = [self.snapshot()]
+        if self.directory:
+            own = self.path()
+            for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+                if path == own:
+                    continue
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    # Being replaced right now, the next scrape picks it up
+                    continue
+        merged = {name: {} for name in self.metrics}
+        for snapshot in snapshots:
+            for name, values in snapshot.items():
+                if name in self.metrics:
+                    self.metrics[name].merge(merged[name], values)
+        return merged
+
+    def exposition(self):
+        """The metrics in the Prometheus text format."""
+        lines = []
+        merged = self.collect()
+        for name, metric in self.metrics.items():
+            values = metric.read() if metric.kind == 'gauge' else merged[name]
+            labelled = [[list(zip(metric.labels, labels)), value] for labels, value in values.items()]
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for suffix, labels, value in metric.samples(labelled):
+                lines.append(f'{name}{suffix}{format_labels(labels)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Alive, only owned by another user
+        return True
+    return True
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _mail_queue():
+    counts = dict(OutboundEmail.objects.filter(status__in=['pending', 'failed']).values_list('status').annotate(n=Count('id')))
+    return {(status,): counts.get(status, 0) for status in ('pending', 'failed')}
+
+
+def _mail_queue_age():
+    oldest = OutboundEmail.objects.filter(status='pending').aggregate(oldest=Min('created_at'))['oldest']
+    return {(): (timezone.now() - oldest).total_seconds() if oldest else 0}
+
+
+registry = Registry(getattr(settings, 'METRICS_DIR', None))
+atexit.register(registry.flush)
+
+HTTP_REQUESTS = registry.counter('http_requests_total', 'Requests handled.', ['route', 'method', 'status'])
+HTTP_DURATION = registry.histogram('http_request_duration_seconds', 'Time from the first middleware to the response.', ['route'])
+HTTP_QUERIES = registry.histogram('http_request_queries', 'Database queries per request.', ['route'], QUERY_BUCKETS)
+HTTP_DB_SECONDS = registry.counter('http_request_db_seconds_total', 'Time spent in database queries.', ['route'])
+REGISTRATIONS = registry.counter('registrations_total', 'Completed registrations.', ['role'])
+ACTIVATIONS = registry.counter('activations_total', 'Activation link visits.', ['result'])
+VERIFICATION_EMAILS = registry.counter('verification_emails_queued_total', 'Verification mail queued.')
+MAIL_SENT = registry.counter('mail_sent_total', 'Queued mail delivered.')
+MAIL_FAILED = registry.counter('mail_send_failures_total', 'Failed delivery attempts of queued mail.')
+APPOINTMENTS_BOOKED = registry.counter('appointments_booked_total', 'Appointments created.', ['kind'])
+APPOINTMENTS_CONFIRMED = registry.counter('appointments_confirmed_total', 'Appointments confirmed by their therapist.')
+MESSAGES_SENT = registry.counter('messages_sent_total', 'Messages sent between users.')
+MAIL_QUEUE = registry.gauge('mail_queue_messages', 'Queued mail by status.', _mail_queue, ['status'])
+MAIL_QUEUE_AGE = registry.gauge('mail_queue_oldest_pending_seconds', 'Age of the oldest mail still waiting to be sent.', _mail_queue_age)
+
+
+def observe_request(route, method, status, seconds, queries, db_seconds):
+    HTTP_REQUESTS.inc(route, method, str(status))
+    HTTP_DURATION.observe(seconds, route)
+    HTTP_QUERIES.observe(queries, route)
+    HTTP_DB_SECONDS.inc(route, amount=db_seconds)
+    registry.maybe_flush()
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:00
+
+from datetime import timedelta
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_ends_at(apps, schema_editor):
+    Appointment = apps.get_model('core', 'Appointment')
+    Appointment.objects.filter(ends_at__isnull=True).update(ends_at=models.F('date') + timedelta(minutes=50))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_dashboard_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_ends_at, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='therapistprofile',
+            name='session_length',
+            field=models.PositiveIntegerField(default=50, help_text='Length of one session in minutes', validators=[django.core.validators.MinValueValidator(10), django.core.validators.MaxValueValidator(240)]),
+        ),
+        migrations.CreateModel(
+            name='BlockedPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('reason', models.CharField(blank=True, max_length=255)),
+                ('therapist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='blocked_periods', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['therapist', 'start'], name='blocked_therapist_start_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('end__gt', models.F('start'))), name='blocked_period_ends_after_start')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TherapistAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('therapist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'therapist availability',
+                'ordering': ['weekday', 'start_time'],
+                'constraints': [models.CheckConstraint(condition=models.Q(('end_time__gt', models.F('start_time'))), name='availability_ends_after_start')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_therapist_availability'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='therapistprofile',
+            name='gender',
+            field=models.CharField(blank=True, choices=[('Male', 'Male'), ('Female', 'Female'), ('Other', 'Other')], max_length=10),
+        ),
+        migrations.CreateModel(
+            name='SpecializationTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('therapist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='core.therapistprofile')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('term', 'therapist'), name='unique_specialization_term')],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations
+
+# Full-text index over resource titles and descriptions. SQLite only: FTS5 keeps it as an
+# external-content table synced by triggers. Other databases fall back to icontains lookups.
+CREATE_SQL = [
+    """CREATE VIRTUAL TABLE core_resource_fts USING fts5(
+        title, description, content='core_resource', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER core_resource_fts_insert AFTER INSERT ON core_resource BEGIN
+        INSERT INTO core_resource_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER core_resource_fts_delete AFTER DELETE ON core_resource BEGIN
+        INSERT INTO core_resource_fts(core_resource_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER core_resource_fts_update AFTER UPDATE ON core_resource BEGIN
+        INSERT INTO core_resource_fts(core_resource_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO core_resource_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    "INSERT INTO core_resource_fts(core_resource_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS core_resource_fts_insert',
+    'DROP TRIGGER IF EXISTS core_resource_fts_delete',
+    'DROP TRIGGER IF EXISTS core_resource_fts_update',
+    'DROP TABLE IF EXISTS core_resource_fts',
+]
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        if 'ENABLE_FTS5' not in {row[0] for row in cursor.fetchall()}:
+            return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_outbound_email_queue'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:10
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_resource_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('content_type', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='clientprofile',
+            name='id_pdf',
+            field=models.FileField(blank=True, null=True, storage=core.storage.document_storage, upload_to='client_ids/', validators=[core.storage.validate_pdf]),
+        ),
+        migrations.AlterField(
+            model_name='therapistprofile',
+            name='certificate_pdf',
+            field=models.FileField(blank=True, null=True, storage=core.storage.document_storage, upload_to='certificates/', validators=[core.storage.validate_pdf]),
+        ),
+        migrations.AlterField(
+            model_name='therapistprofile',
+            name='id_pdf',
+            field=models.FileField(blank=True, null=True, storage=core.storage.document_storage, upload_to='ids/', validators=[core.storage.validate_pdf]),
+        ),
+    ]
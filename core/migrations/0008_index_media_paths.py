@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:11
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_content_addressed_documents'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='clientprofile',
+            name='id_pdf',
+            field=models.FileField(blank=True, db_index=True, null=True, storage=core.storage.document_storage, upload_to='client_ids/', validators=[core.storage.validate_pdf]),
+        ),
+        migrations.AlterField(
+            model_name='resource',
+            name='file',
+            field=models.FileField(blank=True, db_index=True, null=True, upload_to='resources/'),
+        ),
+        migrations.AlterField(
+            model_name='therapistprofile',
+            name='certificate_pdf',
+            field=models.FileField(blank=True, db_index=True, null=True, storage=core.storage.document_storage, upload_to='certificates/', validators=[core.storage.validate_pdf]),
+        ),
+        migrations.AlterField(
+            model_name='therapistprofile',
+            name='id_pdf',
+            field=models.FileField(blank=True, db_index=True, null=True, storage=core.storage.document_storage, upload_to='ids/', validators=[core.storage.validate_pdf]),
+        ),
+    ]
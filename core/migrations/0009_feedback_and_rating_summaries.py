@@ -0,0 +1,104 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def assign_therapists(apps, schema_editor):
+    # Feedback used to name only the client; credit it to their latest session before it was given
+    Feedback = apps.get_model('core', 'Feedback')
+    Appointment = apps.get_model('core', 'Appointment')
+    for feedback in Feedback.objects.all().iterator():
+        appointment = (
+            Appointment.objects.filter(client_id=feedback.client_id, date__lte=feedback.timestamp).order_by('-date').first()
+            or Appointment.objects.filter(client_id=feedback.client_id).order_by('date').first()
+        )
+        if appointment is None:
+            # Nobody to attribute it to
+            feedback.delete()
+        else:
+            Feedback.objects.filter(pk=feedback.pk).update(therapist_id=appointment.therapist_id, appointment_id=appointment.pk)
+
+
+def summarize_feedback(apps, schema_editor):
+    # Same rollup as core.ratings.rebuild_ratings, for the feedback carried over from before
+    Feedback = apps.get_model('core', 'Feedback')
+    TherapistRating = apps.get_model('core', 'TherapistRating')
+    FeedbackDay = apps.get_model('core', 'FeedbackDay')
+    summaries, days = {}, {}
+    for feedback in Feedback.objects.all().iterator():
+        summary = summaries.setdefault(feedback.therapist_id, TherapistRating(therapist_id=feedback.therapist_id))
+        summary.count += 1
+        summary.total += feedback.rating
+        setattr(summary, f'rating_{feedback.rating}', getattr(summary, f'rating_{feedback.rating}') + 1)
+        key = (feedback.therapist_id, timezone.localtime(feedback.timestamp).date())
+        day = days.setdefault(key, FeedbackDay(therapist_id=key[0], day=key[1]))
+        day.count += 1
+        day.total += feedback.rating
+    TherapistRating.objects.bulk_create(summaries.values())
+    FeedbackDay.objects.bulk_create(days.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0008_index_media_paths'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TherapistRating',
+            fields=[
+                ('therapist', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('rating_1', models.PositiveIntegerField(default=0)),
+                ('rating_2', models.PositiveIntegerField(default=0)),
+                ('rating_3', models.PositiveIntegerField(default=0)),
+                ('rating_4', models.PositiveIntegerField(default=0)),
+                ('rating_5', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='feedback',
+            name='therapist',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='feedback_received', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='feedback',
+            name='appointment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='feedback', to='core.appointment'),
+        ),
+        migrations.RunPython(assign_therapists, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='feedback',
+            name='therapist',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feedback_received', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['client', '-timestamp'], name='feedback_client_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['therapist', '-timestamp'], name='feedback_therapist_ts_idx'),
+        ),
+        migrations.CreateModel(
+            name='FeedbackDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('therapist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feedback_days', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('therapist', 'day'), name='unique_feedback_day')],
+            },
+        ),
+        migrations.RunPython(summarize_feedback, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:13
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_history(apps, schema_editor):
+    # Existing goals start their history and rollups at their current progress
+    Goal = apps.get_model('core', 'Goal')
+    GoalProgress = apps.get_model('core', 'GoalProgress')
+    ClientGoalStats = apps.get_model('core', 'ClientGoalStats')
+    now = django.utils.timezone.now()
+    stats = {}
+    history = []
+    for goal in Goal.objects.only('id', 'client_id', 'progress').iterator():
+        history.append(GoalProgress(goal_id=goal.id, progress=max(goal.progress, 0), recorded_at=now))
+        row = stats.setdefault(goal.client_id, ClientGoalStats(client_id=goal.client_id, last_progress_at=now))
+        row.goal_count += 1
+        row.completed_count += int(goal.progress >= 100)
+        row.progress_sum += goal.progress
+    GoalProgress.objects.bulk_create(history, batch_size=1000)
+    ClientGoalStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0009_feedback_and_rating_summaries'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='goal',
+            name='progress',
+            field=models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)]),
+        ),
+        migrations.CreateModel(
+            name='ClientGoalStats',
+            fields=[
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='goal_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('goal_count', models.PositiveIntegerField(default=0)),
+                ('completed_count', models.PositiveIntegerField(default=0)),
+                ('progress_sum', models.IntegerField(default=0)),
+                ('last_progress_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ClientProgressDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('delta', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GoalProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('progress', models.PositiveSmallIntegerField()),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='goal',
+            name='last_progress_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='goal',
+            index=models.Index(condition=models.Q(('progress__lt', 100)), fields=['client', 'last_progress_at'], name='goal_open_progress_idx'),
+        ),
+        migrations.AddField(
+            model_name='clientprogressday',
+            name='client',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress_days', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='goalprogress',
+            name='goal',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress_history', to='core.goal'),
+        ),
+        migrations.AddConstraint(
+            model_name='clientprogressday',
+            constraint=models.UniqueConstraint(fields=('client', 'day'), name='unique_client_progress_day'),
+        ),
+        migrations.AddIndex(
+            model_name='goalprogress',
+            index=models.Index(fields=['goal', 'recorded_at'], name='goal_progress_goal_idx'),
+        ),
+        migrations.RunPython(backfill_history, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def group_into_threads(apps, schema_editor):
+    # Existing messages between the same two people under the same subject become one thread
+    Message = apps.get_model('core', 'Message')
+    Thread = apps.get_model('core', 'Thread')
+    InboxEntry = apps.get_model('core', 'InboxEntry')
+    threads = {}
+    entries = {}
+    messages = list(Message.objects.order_by('timestamp', 'id'))
+    for message in messages:
+        key = (min(message.sender_id, message.receiver_id), max(message.sender_id, message.receiver_id), message.subject)
+        if key not in threads:
+            threads[key] = Thread.objects.create(subject=message.subject)
+        message.thread = threads[key]
+        for user_id, other_id in ((message.sender_id, message.receiver_id), (message.receiver_id, message.sender_id)):
+            entry = entries.setdefault((user_id, message.thread.id), InboxEntry(user_id=user_id, thread=message.thread, other_id=other_id))
+            entry.last_message = message
+            entry.last_sender_id = message.sender_id
+            entry.last_preview = ' '.join(message.body.split())[:200]
+            entry.last_message_at = message.timestamp
+        if not message.read:
+            entries[(message.receiver_id, message.thread.id)].unread_count += 1
+    Message.objects.bulk_update(messages, ['thread'], batch_size=1000)
+    InboxEntry.objects.bulk_create(entries.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_goal_progress_history'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Thread',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InboxEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_preview', models.CharField(blank=True, max_length=200)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.message')),
+                ('last_sender', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox', to=settings.AUTH_USER_MODEL)),
+                ('thread', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='core.thread')),
+            ],
+            options={
+                'verbose_name_plural': 'inbox entries',
+            },
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='thread',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='core.thread'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['thread', '-timestamp'], name='message_thread_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inboxentry',
+            index=models.Index(fields=['user', '-last_message_at'], name='inbox_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inboxentry',
+            index=models.Index(condition=models.Q(('unread_count__gt', 0)), fields=['user'], name='inbox_user_unread_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='inboxentry',
+            constraint=models.UniqueConstraint(fields=('user', 'thread'), name='unique_inbox_entry'),
+        ),
+        migrations.RunPython(group_into_threads, migrations.RunPython.noop),
+    ]
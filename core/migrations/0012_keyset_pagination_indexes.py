@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_message_threads'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['date', 'id'], name='appointment_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['timestamp', 'id'], name='feedback_ts_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='goal',
+            index=models.Index(fields=['start_date', 'id'], name='goal_start_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='goalprogress',
+            index=models.Index(fields=['recorded_at', 'id'], name='goal_progress_recorded_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['timestamp', 'id'], name='message_ts_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='outboundemail',
+            index=models.Index(fields=['created_at', 'id'], name='outbound_email_created_id_idx'),
+        ),
+    ]
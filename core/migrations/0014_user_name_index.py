@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_terms(apps, schema_editor):
+    # The same terms core.directory.name_terms derives, for the users that already exist
+    User = apps.get_model('auth', 'User')
+    UserNameTerm = apps.get_model('core', 'UserNameTerm')
+
+    def normalize(text):
+        return ' '.join((text or '').lower().split())[:150]
+
+    rows = []
+    for user in User.objects.values('id', 'username', 'first_name', 'last_name', 'profile__role').iterator():
+        names = [normalize(user['first_name']), normalize(user['last_name'])]
+        terms = {normalize(user['username']), *names, normalize(' '.join(names))} - {''}
+        rows.extend(UserNameTerm(user_id=user['id'], role=user['profile__role'] or '', term=term) for term in terms)
+    UserNameTerm.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_appointment_reminders'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserNameTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(blank=True, max_length=10)),
+                ('term', models.CharField(max_length=150)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='name_terms', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['role', 'term', 'user'], name='user_name_term_prefix_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'term'), name='unique_user_name_term')],
+            },
+        ),
+        migrations.RunPython(backfill_terms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:08
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+
+def drop_duplicate_feedback(apps, schema_editor):
+    # Keep the latest rating per session and take the others back out of the summaries
+    Feedback = apps.get_model('core', 'Feedback')
+    TherapistRating = apps.get_model('core', 'TherapistRating')
+    FeedbackDay = apps.get_model('core', 'FeedbackDay')
+    duplicated = (
+        Feedback.objects.filter(appointment__isnull=False).values('client_id', 'appointment_id')
+        .annotate(n=Count('id'), latest=Max('id')).filter(n__gt=1)
+    )
+    for group in duplicated:
+        older = Feedback.objects.filter(client_id=group['client_id'], appointment_id=group['appointment_id'], id__lt=group['latest'])
+        for feedback in older:
+            TherapistRating.objects.filter(therapist_id=feedback.therapist_id).update(**{
+                'count': F('count') - 1,
+                'total': F('total') - feedback.rating,
+                f'rating_{feedback.rating}': F(f'rating_{feedback.rating}') - 1,
+            })
+            FeedbackDay.objects.filter(therapist_id=feedback.therapist_id, day=timezone.localtime(feedback.timestamp).date()).update(
+                count=F('count') - 1, total=F('total') - feedback.rating,
+            )
+        older.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_user_name_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_feedback, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='feedback',
+            constraint=models.UniqueConstraint(fields=('client', 'appointment'), name='unique_feedback_per_appointment'),
+        ),
+    ]
@@ -1,7 +1,16 @@
+from datetime import timedelta
+
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django_extensions.db.models import TimeStampedModel
 
+from .storage import document_storage, validate_pdf
+
+DEFAULT_SESSION_LENGTH = 50  # Minutes
+MAX_SESSION_LENGTH = 240  # Minutes, bounds how far back a conflict check has to look
+
 class Profile(TimeStampedModel):
     ROLE_CHOICES = [
         ('client', 'Client'),
@@ -15,18 +24,56 @@ class Profile(TimeStampedModel):
     def __str__(self):
         return self.user.username
 
+class UserNameTerm(models.Model):
+    # Lowercased username and names of every user, searched by prefix for the autocomplete widgets
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='name_terms')
+    role = models.CharField(max_length=10, blank=True)  # Copied from the profile, empty for users without one
+    term = models.CharField(max_length=150)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'term'], name='unique_user_name_term'),
+        ]
+        indexes = [
+            # A prefix is a range over term, within one role
+            models.Index(fields=['role', 'term', 'user'], name='user_name_term_prefix_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.user_id}"
+
 class TherapistProfile(TimeStampedModel):
     profile = models.OneToOneField(Profile, on_delete=models.CASCADE)
+    gender = models.CharField(max_length=10, choices=[('Male', 'Male'), ('Female', 'Female'), ('Other', 'Other')], blank=True)
     license_number = models.CharField(max_length=50)
     certifications = models.TextField()
     specializations = models.TextField()
     years_of_experience = models.PositiveIntegerField()
-    certificate_pdf = models.FileField(upload_to='certificates/', blank=True, null=True)
-    id_pdf = models.FileField(upload_to='ids/', blank=True, null=True)
+    session_length = models.PositiveIntegerField(
+        default=DEFAULT_SESSION_LENGTH,
+        validators=[MinValueValidator(10), MaxValueValidator(MAX_SESSION_LENGTH)],
+        help_text='Length of one session in minutes',
+    )
+    certificate_pdf = models.FileField(upload_to='certificates/', storage=document_storage, validators=[validate_pdf], blank=True, null=True, db_index=True)
+    id_pdf = models.FileField(upload_to='ids/', storage=document_storage, validators=[validate_pdf], blank=True, null=True, db_index=True)
 
     def __str__(self):
         return f"{self.profile.user.username} - Therapist"
 
+class SpecializationTerm(models.Model):
+    # Inverted index over the free-text specializations and certifications of therapists
+    therapist = models.ForeignKey(TherapistProfile, on_delete=models.CASCADE, related_name='terms')
+    term = models.CharField(max_length=64)
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'therapist'], name='unique_specialization_term'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.therapist_id}"
+
 class ClientProfile(TimeStampedModel):
     profile = models.OneToOneField(Profile, on_delete=models.CASCADE)
     age = models.PositiveIntegerField()
@@ -35,42 +82,183 @@ class ClientProfile(TimeStampedModel):
     therapy_goals = models.TextField()
     preferred_therapist_gender = models.CharField(max_length=20, choices=[('Male', 'Male'), ('Female', 'Female'), ('No Preference', 'No Preference')])
     specific_issues = models.TextField()
-    id_pdf = models.FileField(upload_to='client_ids/', blank=True, null=True)
+    id_pdf = models.FileField(upload_to='client_ids/', storage=document_storage, validators=[validate_pdf], blank=True, null=True, db_index=True)
 
     def __str__(self):
         return f"{self.profile.user.username} - Client"
 
+def session_length_of(therapist_id):
+    profile = TherapistProfile.objects.filter(profile__user_id=therapist_id).only('session_length').first()
+    return timedelta(minutes=profile.session_length if profile else DEFAULT_SESSION_LENGTH)
+
 class Appointment(models.Model):
-    client = models.ForeignKey(User, on_delete=models.CASCADE)
+    client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='appointments')
     therapist = models.ForeignKey(User, related_name='therapist', on_delete=models.CASCADE)
     date = models.DateTimeField()
+    ends_at = models.DateTimeField(blank=True, null=True, editable=False)
     notes = models.TextField(blank=True)
     confirmed = models.BooleanField(default=False)  # New field to indicate if the appointment is confirmed
 
+    class Meta:
+        indexes = [
+            # Dashboards filter by one side of the appointment and sort by date
+            models.Index(fields=['client', 'date'], name='appointment_client_date_idx'),
+            # Keyset pages of the admin change list seek on (date, id)
+            models.Index(fields=['date', 'id'], name='appointment_date_id_idx'),
+            models.Index(fields=['therapist', 'date'], name='appointment_therapist_date_idx'),
+            # Only the handful of sessions still waiting for the therapist's confirmation
+            models.Index(fields=['therapist', 'date'], name='appointment_unconfirmed_idx', condition=models.Q(confirmed=False)),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What ends_at was derived from, so moving the session moves its end too
+        instance._scheduled = (instance.__dict__.get('therapist_id'), instance.__dict__.get('date'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        scheduled = getattr(self, '_scheduled', None)
+        loaded = 'date' in self.__dict__ and 'therapist_id' in self.__dict__
+        moved = scheduled is not None and loaded and scheduled != (self.therapist_id, self.date)
+        if self.date is not None and (self.ends_at is None or moved):
+            self.ends_at = self.date + session_length_of(self.therapist_id)
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'ends_at'}
+        super().save(*args, **kwargs)
+        self._scheduled = (self.therapist_id, self.date)
+
     def __str__(self):
         return f"{self.client.username} - {self.date}"
 
+class TherapistAvailability(models.Model):
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+    therapist = models.ForeignKey(User, on_delete=models.CASCADE, related_name='availability')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    class Meta:
+        ordering = ['weekday', 'start_time']
+        verbose_name_plural = 'therapist availability'
+        constraints = [
+            models.CheckConstraint(condition=models.Q(end_time__gt=models.F('start_time')), name='availability_ends_after_start'),
+        ]
+
+    def __str__(self):
+        return f"{self.therapist.username} - {self.get_weekday_display()} {self.start_time}-{self.end_time}"
+
+class BlockedPeriod(models.Model):
+    therapist = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blocked_periods')
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    reason = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['therapist', 'start'], name='blocked_therapist_start_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(end__gt=models.F('start')), name='blocked_period_ends_after_start'),
+        ]
+
+    def __str__(self):
+        return f"{self.therapist.username} blocked {self.start} - {self.end}"
+
 class Goal(models.Model):
     client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='goals')
     title = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     start_date = models.DateField()
     end_date = models.DateField(blank=True, null=True)
-    progress = models.IntegerField(default=0)  # Percentage completion
+    progress = models.IntegerField(default=0, validators=[MinValueValidator(0), MaxValueValidator(100)])  # Percentage completion
+    last_progress_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['client', '-start_date'], name='goal_client_start_idx'),
+            models.Index(fields=['start_date', 'id'], name='goal_start_id_idx'),
+            # Finds goals that stopped moving without touching completed ones
+            models.Index(fields=['client', 'last_progress_at'], name='goal_open_progress_idx', condition=models.Q(progress__lt=100)),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.client.username}"
 
+class GoalProgress(models.Model):
+    # Append-only history, one row per change of Goal.progress
+    goal = models.ForeignKey(Goal, on_delete=models.CASCADE, related_name='progress_history')
+    progress = models.PositiveSmallIntegerField()
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['goal', 'recorded_at'], name='goal_progress_goal_idx'),
+            models.Index(fields=['recorded_at', 'id'], name='goal_progress_recorded_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.goal_id}: {self.progress}% at {self.recorded_at}"
+
+class ClientGoalStats(models.Model):
+    # Rollup of a client's goals, kept current by core.progress on every goal write
+    client = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='goal_stats')
+    goal_count = models.PositiveIntegerField(default=0)
+    completed_count = models.PositiveIntegerField(default=0)
+    progress_sum = models.IntegerField(default=0)
+    last_progress_at = models.DateTimeField(blank=True, null=True)
+
+    @property
+    def average_progress(self):
+        return self.progress_sum / self.goal_count if self.goal_count else None
+
+    @property
+    def completion_rate(self):
+        return self.completed_count / self.goal_count if self.goal_count else None
+
+    def __str__(self):
+        return f"Goal stats for {self.client.username}"
+
+class ClientProgressDay(models.Model):
+    # Net progress points gained per client per day, the source of the trend line
+    client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='progress_days')
+    day = models.DateField()
+    delta = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'day'], name='unique_client_progress_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.client.username} {self.day}: {self.delta:+d}"
+
 class Resource(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField()
     link = models.URLField(blank=True, null=True)
-    file = models.FileField(upload_to='resources/', blank=True, null=True)
+    file = models.FileField(upload_to='resources/', blank=True, null=True, db_index=True)
 
     def __str__(self):
         return self.title
 
+class Thread(models.Model):
+    subject = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.subject
+
 class Message(models.Model):
+    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name='messages', blank=True, null=True)
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
     subject = models.CharField(max_length=255)
@@ -78,9 +266,43 @@ class Message(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['sender', '-timestamp'], name='message_sender_ts_idx'),
+            models.Index(fields=['receiver', '-timestamp'], name='message_receiver_ts_idx'),
+            # Unread messages are a small slice of the inbox, keep them in their own index
+            models.Index(fields=['receiver', '-timestamp'], name='message_unread_idx', condition=models.Q(read=False)),
+            models.Index(fields=['thread', '-timestamp'], name='message_thread_ts_idx'),
+            models.Index(fields=['timestamp', 'id'], name='message_ts_id_idx'),
+        ]
+
     def __str__(self):
         return f"From {self.sender.username} to {self.receiver.username} - {self.subject}"
 
+class InboxEntry(models.Model):
+    # One row per participant of a thread, kept current by core.messaging on send, read and edit
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inbox')
+    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name='inbox_entries')
+    other = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    last_message = models.ForeignKey(Message, on_delete=models.SET_NULL, related_name='+', blank=True, null=True)
+    last_sender = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='+', blank=True, null=True)
+    last_preview = models.CharField(max_length=200, blank=True)
+    last_message_at = models.DateTimeField(blank=True, null=True)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'inbox entries'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'thread'], name='unique_inbox_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_message_at'], name='inbox_user_recent_idx'),
+            models.Index(fields=['user'], name='inbox_user_unread_idx', condition=models.Q(unread_count__gt=0)),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.thread}"
+
 class PrivacySetting(models.Model):
     client = models.OneToOneField(User, on_delete=models.CASCADE, related_name='privacy_setting')
     share_appointments = models.BooleanField(default=True)
@@ -89,3 +311,117 @@ class PrivacySetting(models.Model):
 
     def __str__(self):
         return f"Privacy settings for {self.client.username}"
+
+class Feedback(models.Model):
+    RATING_CHOICES = [(i, str(i)) for i in range(1, 6)]
+    client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feedback_given')
+    therapist = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feedback_received')
+    appointment = models.ForeignKey(Appointment, on_delete=models.SET_NULL, related_name='feedback', blank=True, null=True)
+    rating = models.PositiveSmallIntegerField(choices=RATING_CHOICES)
+    feedback_text = models.TextField()
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['client', '-timestamp'], name='feedback_client_ts_idx'),
+            models.Index(fields=['therapist', '-timestamp'], name='feedback_therapist_ts_idx'),
+            models.Index(fields=['timestamp', 'id'], name='feedback_ts_id_idx'),
+        ]
+        constraints = [
+            # One rating per session, so nobody can stack up a therapist's average
+            models.UniqueConstraint(fields=['client', 'appointment'], name='unique_feedback_per_appointment'),
+        ]
+
+    def __str__(self):
+        return f"{self.client.username} rated {self.therapist.username} {self.rating}/5"
+
+class TherapistRating(models.Model):
+    # Running totals of a therapist's feedback, kept up to date by core.ratings on every write
+    therapist = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='rating_summary')
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def histogram(self):
+        return [(rating, getattr(self, f'rating_{rating}')) for rating in range(1, 6)]
+
+    def __str__(self):
+        return f"{self.therapist.username} - {self.count} ratings"
+
+class FeedbackDay(models.Model):
+    # Per-day totals, the last 30 of them make up the recent rating window
+    therapist = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feedback_days')
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['therapist', 'day'], name='unique_feedback_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.therapist.username} {self.day}: {self.count}"
+
+class OutboundEmail(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    to_email = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # The worker only ever looks at mail that is still due
+            models.Index(fields=['next_attempt_at'], name='outbound_email_due_idx', condition=models.Q(status='pending')),
+            models.Index(fields=['created_at', 'id'], name='outbound_email_created_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to_email} ({self.status})"
+
+class AppointmentReminder(models.Model):
+    # One row per reminder handed to the mail queue, so a window is never mailed twice
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='reminders')
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='appointment_reminders')
+    lead_time = models.PositiveIntegerField(help_text='Minutes before the appointment')
+    email = models.ForeignKey(OutboundEmail, on_delete=models.SET_NULL, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['appointment', 'lead_time', 'recipient'], name='unique_appointment_reminder'),
+        ]
+
+    def __str__(self):
+        return f"{self.appointment_id} -{self.lead_time}m -> {self.recipient_id}"
+
+class StoredFile(models.Model):
+    # One row per blob in the content-addressed document storage
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    content_type = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
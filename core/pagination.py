@@ -0,0 +1,94 @@
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+CURSOR_SALT = 'core.pagination'
+
+
+class InvalidCursor(Exception):
+    """The cursor was tampered with or was issued for another list."""
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+class KeysetPaginator:
+    """Seek pagination: each page continues after the sort key of the previous one.
+
+    `ordering` lists model fields, each optionally prefixed with '-', and must end in a
+    unique one (usually 'id') so the key of a row is never shared. With an index matching
+    the ordering every page costs one index seek and `per_page + 1` rows, however deep it
+    is. Cursors are signed, opaque to clients and only valid for the same ordering.
+    """
+
+    def __init__(self, queryset, ordering, per_page=20):
+        self.queryset = queryset
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self.fields = [queryset.model._meta.get_field(name) for name, descending in self.ordering]
+        self.per_page = per_page
+        self.salt = f"{CURSOR_SALT}:{queryset.model._meta.label}:{','.join(ordering)}"
+
+    def encode(self, item, direction):
+        return signing.dumps({'k': [field.value_to_string(item) for field in self.fields], 'd': direction}, salt=self.salt)
+
+    def decode(self, cursor):
+        try:
+            data = signing.loads(cursor, salt=self.salt)
+            values = [field.to_python(value) for field, value in zip(self.fields, data['k'], strict=True)]
+            return values, data['d'] == 'next'
+        except (signing.BadSignature, ValidationError, KeyError, TypeError, ValueError):
+            raise InvalidCursor(cursor)
+
+    def seek(self, values, forward):
+        # (a, b) after (x, y) is a > x OR (a = x AND b > y), with > and < swapped where needed
+        condition = Q()
+        for position, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending == forward else 'gt'
+            term = Q(**{f'{name}__{lookup}': values[position]})
+            for earlier, (earlier_name, _) in enumerate(self.ordering[:position]):
+                term &= Q(**{earlier_name: values[earlier]})
+            condition |= term
+        return condition
+
+    def page(self, cursor=None):
+        forward = True
+        queryset = self.queryset
+        if cursor:
+            values, forward = self.decode(cursor)
+            queryset = queryset.filter(self.seek(values, forward))
+        # Walking backwards reads the reversed order and flips the rows afterwards
+        order = [('-' if descending == forward else '') + name for name, descending in self.ordering]
+        rows = list(queryset.order_by(*order)[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        has_next = more if forward else bool(cursor)
+        has_previous = bool(cursor) if forward else more
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode(rows[-1], 'next') if rows and has_next else None,
+            previous_cursor=self.encode(rows[0], 'previous') if rows and has_previous else None,
+        )
@@ -0,0 +1,294 @@
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.base import Template
+from django.utils import timezone
+
+from .metrics import observe_request
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in milliseconds, the last bucket takes everything slower
+LATENCY_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf')]
+WINDOW_SECONDS = 60
+WINDOWS = 15
+
+# The timings of the request being handled; asgiref copies it into the threads views run in
+_current = ContextVar('request_timings', default=None)
+_template_depth = ContextVar('template_depth', default=0)
+_in_form = ContextVar('in_form', default=False)
+
+
+class RequestTimings:
+    """SQL, template and form rendering time of one request, in seconds."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.db = 0.0
+        self.templates = 0.0
+        self.forms = 0.0
+
+    def add(self, attribute, elapsed):
+        # Async views render and query from several threads at once
+        with self.lock:
+            setattr(self, attribute, getattr(self, attribute) + elapsed)
+
+    def server_timing(self, total):
+        metrics = [f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"']
+        if templates_instrumented():
+            metrics += [f'tpl;dur={self.templates * 1000:.1f}', f'forms;dur={self.forms * 1000:.1f}']
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+def _time_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        with timings.lock:
+            timings.queries += 1
+            timings.db += elapsed
+
+
+def _watch_connection(sender=None, connection=None, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+_render = Template.render
+
+
+def _timed_render(self, context):
+    timings = _current.get()
+    if timings is None:
+        return _render(self, context)
+    # Only the outermost template counts, includes and crispy's field templates are inside it
+    outermost = _template_depth.get() == 0
+    name = getattr(self.origin, 'template_name', None) or ''
+    form = not _in_form.get() and name.startswith(f"{getattr(settings, 'CRISPY_TEMPLATE_PACK', 'bootstrap4')}/")
+    depth_token = _template_depth.set(_template_depth.get() + 1)
+    form_token = _in_form.set(True) if form else None
+    started = time.perf_counter()
+    try:
+        return _render(self, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        _template_depth.reset(depth_token)
+        if form_token is not None:
+            _in_form.reset(form_token)
+            timings.add('forms', elapsed)
+        if outermost:
+            timings.add('templates', elapsed)
+
+
+def instrument_templates():
+    """Time template rendering, by wrapping Template.render until uninstrument_templates()."""
+    Template.render = _timed_render
+
+
+def uninstrument_templates():
+    Template.render = _render
+
+
+def templates_instrumented():
+    return Template.render is _timed_render
+
+
+class RollingHistogram:
+    """Latency histogram over the last `windows` periods of `window` seconds each."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, window=WINDOW_SECONDS, windows=WINDOWS):
+        self.buckets = buckets
+        self.window = window
+        self.lock = threading.Lock()
+        self.periods = [[None, [0] * len(buckets), 0.0] for i in range(windows)]
+
+    def _period(self, now):
+        index = int(now // self.window)
+        period = self.periods[index % len(self.periods)]
+        if period[0] != index:
+            # The slot last held a period that has rolled out of the window
+            period[0], period[1], period[2] = index, [0] * len(self.buckets), 0.0
+        return period
+
+    def observe(self, value, now=None):
+        with self.lock:
+            period = self._period(now or time.time())
+            period[1][bisect_left(self.buckets, value)] += 1
+            period[2] += value
+
+    def snapshot(self, now=None):
+        current = int((now or time.time()) // self.window)
+        counts, total = [0] * len(self.buckets), 0.0
+        with self.lock:
+            for index, period_counts, period_total in self.periods:
+                if index is not None and current - index < len(self.periods):
+                    counts = [a + b for a, b in zip(counts, period_counts)]
+                    total += period_total
+        return counts, total
+
+    def summary(self, now=None):
+        counts, total = self.snapshot(now)
+        count = sum(counts)
+        if not count:
+            return {'count': 0}
+
+        def quantile(q):
+            # The upper bound of the bucket the quantile falls in, None past the last finite one
+            seen = 0
+            for bound, n in zip(self.buckets, counts):
+                seen += n
+                if seen >= q * count:
+                    break
+            return bound if bound != float('inf') else None
+
+        return {
+            'count': count,
+            'mean': total / count,
+            'p50': quantile(0.5),
+            'p95': quantile(0.95),
+            'p99': quantile(0.99),
+            'buckets': {('+Inf' if bound == float('inf') else str(bound)): n for bound, n in zip(self.buckets, counts)},
+        }
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def route_histogram(route):
+    histogram = _histograms.get(route)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(route, RollingHistogram())
+    return histogram
+
+
+def route_summaries():
+    """Latency of every route over the last quarter of an hour, in milliseconds."""
+    return {route: histogram.summary() for route, histogram in sorted(_histograms.items())}
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else '<unmatched>'
+
+
+class ProfilingMiddleware:
+    """Times every request and reports it in a Server-Timing header and per-route histograms.
+
+    The header is only sent with DEBUG on or to staff. Template and form rendering is only
+    timed with PROFILING_TEMPLATES, which wraps Template.render for the whole process.
+
+    A sample of sync requests (PROFILING_SAMPLE_RATE) runs under cProfile; the profile of
+    one that turns out slower than PROFILING_SLOW_MS is written to PROFILING_DUMP_DIR, at
+    most once per route every PROFILING_DUMP_INTERVAL seconds. Load a dump with pstats
+    or snakeviz.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.01)
+        self.slow = getattr(settings, 'PROFILING_SLOW_MS', 500) / 1000
+        self.dump_dir = getattr(settings, 'PROFILING_DUMP_DIR', None)
+        self.dump_interval = getattr(settings, 'PROFILING_DUMP_INTERVAL', 60)
+        self.server_timing = getattr(settings, 'PROFILING_SERVER_TIMING', True)
+        if getattr(settings, 'PROFILING_TEMPLATES', settings.DEBUG):
+            instrument_templates()
+        self.last_dump = {}
+        connection_created.connect(_watch_connection)
+        for connection in connections.all(initialized_only=True):
+            _watch_connection(connection=connection)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        profiler = self.start_profiler()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            total = time.perf_counter() - started
+            if profiler is not None:
+                profiler.disable()
+            _current.reset(token)
+        self.finish(request, response, timings, total, profiler, self.shows_timing(getattr(request, 'user', None)))
+        return response
+
+    async def __acall__(self, request):
+        # Concurrent requests share the event loop thread, cProfile would mix them up
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            total = time.perf_counter() - started
+            _current.reset(token)
+        user = None
+        if self.server_timing and not settings.DEBUG and hasattr(request, 'auser'):
+            user = await request.auser()
+        self.finish(request, response, timings, total, None, self.shows_timing(user))
+        return response
+
+    def shows_timing(self, user):
+        # Timings tell how the site is built, only developers and staff get to see them
+        return self.server_timing and (settings.DEBUG or bool(getattr(user, 'is_staff', False)))
+
+    def start_profiler(self):
+        if not self.dump_dir or random.random() >= self.sample_rate:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already running in this thread
+            return None
+        return profiler
+
+    def finish(self, request, response, timings, total, profiler, show_timing):
+        route = route_of(request)
+        route_histogram(route).observe(total * 1000)
+        observe_request(route, request.method, response.status_code, total, timings.queries, timings.db)
+        if show_timing:
+            response['Server-Timing'] = timings.server_timing(total)
+        if profiler is not None and total >= self.slow:
+            self.dump(profiler, route, total)
+
+    def dump(self, profiler, route, total):
+        now = time.monotonic()
+        if now - self.last_dump.get(route, -self.dump_interval) < self.dump_interval:
+            return
+        self.last_dump[route] = now
+        slug = ''.join(c if c.isalnum() else '_' for c in route).strip('_') or 'root'
+        path = os.path.join(self.dump_dir, f"{slug}-{timezone.now():%Y%m%d-%H%M%S}-{total * 1000:.0f}ms.prof")
+        try:
+            os.makedirs(self.dump_dir, exist_ok=True)
+            profiler.dump_stats(path)
+        except OSError as e:
+            logger.warning('Could not write profile of %s to %s: %s', route, path, e)
+        else:
+            logger.info('Slow request to %s took %.0fms, profile written to %s', route, total * 1000, path)
@@ -0,0 +1,114 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Appointment, ClientGoalStats, ClientProgressDay, Goal, GoalProgress
+
+TREND_WINDOW_DAYS = 30
+STALLED_AFTER_DAYS = 14
+COMPLETE = 100
+
+
+def record_progress(goal, previous=None):
+    """Append a history row for the goal and fold the change into its client's rollups.
+
+    `previous` is the progress stored before this save, None for a new goal. Saves that
+    leave the progress alone write nothing.
+    """
+    if previous is not None and previous == goal.progress:
+        return
+    moment = goal.last_progress_at
+    delta = goal.progress - (previous or 0)
+    completed = int(goal.progress >= COMPLETE) - int(previous is not None and previous >= COMPLETE)
+    with transaction.atomic():
+        GoalProgress.objects.create(goal=goal, progress=goal.progress, recorded_at=moment)
+        _apply(goal.client_id, delta, completed, int(previous is None), moment)
+
+
+def forget_goal(goal):
+    # History rows go with the goal, only the rollups need the goal taken back out
+    completed = int(goal.progress >= COMPLETE)
+    _apply(goal.client_id, -goal.progress, -completed, -1, None)
+
+
+def _apply(client_id, delta, completed, goals, moment):
+    with transaction.atomic():
+        # Taking a goal out never creates the rollup, it is gone when the client is being deleted
+        if goals >= 0:
+            ClientGoalStats.objects.get_or_create(client_id=client_id)
+        changes = {
+            'goal_count': F('goal_count') + goals,
+            'completed_count': F('completed_count') + completed,
+            'progress_sum': F('progress_sum') + delta,
+        }
+        if moment is not None:
+            changes['last_progress_at'] = moment
+        ClientGoalStats.objects.filter(client_id=client_id).update(**changes)
+        if moment is not None and delta:
+            day = timezone.localtime(moment).date()
+            ClientProgressDay.objects.get_or_create(client_id=client_id, day=day)
+            ClientProgressDay.objects.filter(client_id=client_id, day=day).update(delta=F('delta') + delta)
+
+
+def caseload(therapist, days=TREND_WINDOW_DAYS, stalled_after=STALLED_AFTER_DAYS):
+    """Per-client goal analytics for a therapist's caseload, read from the rollups.
+
+    Four queries whatever the number of goals: the rollups, the daily trend rows of the
+    window, and the open goals that have not moved in `stalled_after` days.
+    """
+    client_ids = Appointment.objects.filter(therapist=therapist).values('client_id')
+    stats = list(ClientGoalStats.objects.filter(client_id__in=client_ids).select_related('client').order_by('client__username'))
+
+    since = timezone.localdate() - timedelta(days=days - 1)
+    trends = dict(
+        ClientProgressDay.objects.filter(client_id__in=client_ids, day__gte=since)
+        .values('client_id').annotate(gain=Sum('delta')).values_list('client_id', 'gain')
+    )
+    stalled = {}
+    cutoff = timezone.now() - timedelta(days=stalled_after)
+    for goal in Goal.objects.filter(client_id__in=client_ids, progress__lt=COMPLETE, last_progress_at__lt=cutoff).order_by('last_progress_at'):
+        stalled.setdefault(goal.client_id, []).append(goal)
+
+    rows = [
+        {'stats': row, 'client': row.client, 'trend': trends.get(row.client_id, 0), 'stalled': stalled.get(row.client_id, [])}
+        for row in stats
+    ]
+    totals = {
+        'clients': len(rows),
+        'goals': sum(row.goal_count for row in stats),
+        'completed': sum(row.completed_count for row in stats),
+        'stalled': sum(len(goals) for goals in stalled.values()),
+    }
+    totals['completion_rate'] = totals['completed'] / totals['goals'] if totals['goals'] else None
+    return {'caseload': rows, 'totals': totals, 'trend_days': days, 'stalled_after': stalled_after}
+
+
+def rebuild_progress_rollups():
+    """Recompute every client rollup from the goals and their history, for repairs only."""
+    stats = {}
+    for goal in Goal.objects.only('client_id', 'progress', 'last_progress_at'):
+        row = stats.setdefault(goal.client_id, ClientGoalStats(client_id=goal.client_id))
+        row.goal_count += 1
+        row.completed_count += int(goal.progress >= COMPLETE)
+        row.progress_sum += goal.progress
+        if row.last_progress_at is None or goal.last_progress_at > row.last_progress_at:
+            row.last_progress_at = goal.last_progress_at
+
+    days = {}
+    last_seen = {}
+    for entry in GoalProgress.objects.select_related('goal').only('progress', 'recorded_at', 'goal__client_id').order_by('goal_id', 'recorded_at', 'id'):
+        delta = entry.progress - last_seen.get(entry.goal_id, 0)
+        last_seen[entry.goal_id] = entry.progress
+        key = (entry.goal.client_id, timezone.localtime(entry.recorded_at).date())
+        days[key] = days.get(key, 0) + delta
+
+    with transaction.atomic():
+        ClientGoalStats.objects.all().delete()
+        ClientProgressDay.objects.all().delete()
+        ClientGoalStats.objects.bulk_create(stats.values())
+        ClientProgressDay.objects.bulk_create([
+            ClientProgressDay(client_id=client_id, day=day, delta=delta) for (client_id, day), delta in days.items() if delta
+        ])
+    return len(stats)
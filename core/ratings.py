@@ -0,0 +1,79 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Feedback, FeedbackDay, TherapistRating
+
+RECENT_WINDOW_DAYS = 30
+
+
+def apply_rating(therapist_id, rating, moment, sign=1):
+    """Add (sign=1) or remove (sign=-1) one rating from the therapist's running totals.
+
+    Two single-row UPDATEs with F() expressions, independent of how much feedback exists.
+    Removing never creates rows: when the summaries are gone, e.g. because the therapist
+    is being deleted along with their feedback, there is nothing left to take it out of.
+    """
+    day = timezone.localtime(moment).date()
+    with transaction.atomic():
+        if sign > 0:
+            TherapistRating.objects.get_or_create(therapist_id=therapist_id)
+            FeedbackDay.objects.get_or_create(therapist_id=therapist_id, day=day)
+        TherapistRating.objects.filter(therapist_id=therapist_id).update(**{
+            'count': F('count') + sign,
+            'total': F('total') + sign * rating,
+            f'rating_{rating}': F(f'rating_{rating}') + sign,
+        })
+        FeedbackDay.objects.filter(therapist_id=therapist_id, day=day).update(
+            count=F('count') + sign, total=F('total') + sign * rating,
+        )
+
+
+def recent_rating(therapist_id, days=RECENT_WINDOW_DAYS):
+    """(count, average) over the last `days` days, read from at most `days` daily rows."""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    totals = FeedbackDay.objects.filter(therapist_id=therapist_id, day__gte=since).aggregate(count=Sum('count'), total=Sum('total'))
+    count = totals['count'] or 0
+    return count, (totals['total'] / count if count else None)
+
+
+def rating_summary(therapist_id):
+    summary = TherapistRating.objects.filter(therapist_id=therapist_id).first()
+    recent_count, recent_average = recent_rating(therapist_id)
+    return {'rating': summary, 'recent_count': recent_count, 'recent_average': recent_average}
+
+
+def top_rated(limit=10, min_count=1):
+    # Sorting happens on the one-row-per-therapist summary table, never on Feedback
+    return (
+        TherapistRating.objects.filter(count__gte=min_count)
+        .annotate(average_rating=F('total') * 1.0 / F('count'))
+        .select_related('therapist')
+        .order_by('-average_rating', '-count')[:limit]
+    )
+
+
+def rebuild_ratings():
+    """Recompute every summary from the feedback table, for repairs only."""
+    summaries = {}
+    for row in Feedback.objects.values('therapist_id', 'rating').annotate(n=Count('id')):
+        summary = summaries.setdefault(row['therapist_id'], TherapistRating(therapist_id=row['therapist_id']))
+        summary.count += row['n']
+        summary.total += row['n'] * row['rating']
+        setattr(summary, f"rating_{row['rating']}", row['n'])
+    days = (
+        Feedback.objects.annotate(day=TruncDate('timestamp'))
+        .values('therapist_id', 'day').annotate(n=Count('id'), rating_total=Sum('rating'))
+    )
+    with transaction.atomic():
+        TherapistRating.objects.all().delete()
+        FeedbackDay.objects.all().delete()
+        TherapistRating.objects.bulk_create(summaries.values())
+        FeedbackDay.objects.bulk_create([
+            FeedbackDay(therapist_id=row['therapist_id'], day=row['day'], count=row['n'], total=row['rating_total'])
+            for row in days
+        ])
+    return len(summaries)
@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Appointment, AppointmentReminder, OutboundEmail
+from .pagination import KeysetPaginator
+
+REMINDER_BATCH_SIZE = 500
+
+
+def lead_times():
+    # Minutes before the session, longest first
+    return sorted(getattr(settings, 'APPOINTMENT_REMINDER_LEAD_TIMES', [24 * 60, 60]), reverse=True)
+
+
+def reminder_windows(now=None):
+    """Yield (lead_time, start, end): appointments in (start, end] are due for that reminder.
+
+    A window stops where the next shorter one begins, so a session booked at short notice
+    only gets the reminder that fits it instead of every one at once.
+    """
+    now = now or timezone.now()
+    leads = lead_times()
+    for position, lead_time in enumerate(leads):
+        shorter = leads[position + 1] if position + 1 < len(leads) else 0
+        yield lead_time, now + timedelta(minutes=shorter), now + timedelta(minutes=lead_time)
+
+
+def due_appointments(lead_time, start, end):
+    # A range scan over the (date, id) index, minus whatever was already reminded about
+    reminded = AppointmentReminder.objects.filter(appointment=OuterRef('pk'), lead_time=lead_time)
+    return Appointment.objects.filter(date__gt=start, date__lte=end).exclude(Exists(reminded)).select_related('client', 'therapist')
+
+
+def reminder_email(appointment, recipient, now=None):
+    other = appointment.therapist if recipient.pk == appointment.client_id else appointment.client
+    subject = 'Reminder: your upcoming appointment'
+    body = render_to_string('core/appointment_reminder_email.html', {
+        'user': recipient,
+        'other': other,
+        'appointment': appointment,
+        'now': now or timezone.now(),
+    })
+    return OutboundEmail(subject=subject, body=body, to_email=recipient.email, from_email=settings.DEFAULT_FROM_EMAIL or '')
+
+
+def queue_reminders_for(appointments, lead_time, now=None):
+    """Queue the reminder mail of one batch of appointments, returning how many were queued."""
+    pairs = [(appointment, user) for appointment in appointments for user in (appointment.client, appointment.therapist)]
+    with transaction.atomic():
+        AppointmentReminder.objects.bulk_create(
+            [AppointmentReminder(appointment=appointment, recipient=user, lead_time=lead_time) for appointment, user in pairs],
+            ignore_conflicts=True,
+        )
+        # Rows another scheduler queued first already point at their mail, the rest are ours
+        claimed = {
+            (reminder.appointment_id, reminder.recipient_id): reminder
+            for reminder in AppointmentReminder.objects.filter(
+                appointment__in=appointments, lead_time=lead_time, email__isnull=True,
+            )
+        }
+        reminders, emails = [], []
+        for appointment, user in pairs:
+            reminder = claimed.get((appointment.pk, user.pk))
+            if reminder is not None and user.email:
+                reminders.append(reminder)
+                emails.append(reminder_email(appointment, user, now))
+        OutboundEmail.objects.bulk_create(emails)
+        for reminder, email in zip(reminders, emails):
+            reminder.email = email
+        AppointmentReminder.objects.bulk_update(reminders, ['email'])
+    return len(emails)
+
+
+def queue_due_reminders(now=None, batch_size=REMINDER_BATCH_SIZE):
+    """Queue mail for every appointment that entered a reminder window and has not had it yet."""
+    now = now or timezone.now()
+    queued = 0
+    for lead_time, start, end in reminder_windows(now):
+        paginator = KeysetPaginator(due_appointments(lead_time, start, end), ('date', 'id'), per_page=batch_size)
+        cursor = None
+        while True:
+            page = paginator.page(cursor)
+            if page:
+                queued += queue_reminders_for(page.items, lead_time, now)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+    return queued
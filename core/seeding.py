@@ -0,0 +1,320 @@
+import random
+from contextlib import contextmanager
+from datetime import time as clock, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .catalog import bump_catalog_version
+from .directory import index_users
+from .matching import index_therapists
+from .messaging import preview
+from .models import (
+    Appointment, ClientGoalStats, ClientProfile, ClientProgressDay, Feedback, FeedbackDay, Goal, GoalProgress,
+    InboxEntry, Message, PrivacySetting, Profile, Resource, TherapistAvailability, TherapistProfile,
+    TherapistRating, Thread,
+)
+from .progress import COMPLETE
+
+ISSUES = [
+    'anxiety', 'depression', 'stress', 'grief', 'trauma', 'insomnia', 'addiction', 'relationships',
+    'self-esteem', 'anger', 'ocd', 'ptsd', 'eating disorders', 'burnout', 'panic attacks', 'phobias',
+    'adhd', 'bipolar disorder', 'family conflict', 'loneliness',
+]
+CERTIFICATIONS = [
+    'CBT', 'DBT', 'EMDR', 'ACT', 'psychodynamic therapy', 'family therapy', 'mindfulness',
+    'trauma-focused CBT', 'motivational interviewing', 'schema therapy',
+]
+GOAL_TITLES = [
+    'Sleep eight hours', 'Daily journaling', 'Exercise three times a week', 'Practice breathing exercises',
+    'Reconnect with friends', 'Reduce screen time', 'Manage work stress', 'Attend every session',
+    'Cut down on caffeine', 'Try one new hobby',
+]
+WORDS = (
+    'session week feel better sleep plan talk exercise breathing journal progress work family friends '
+    'morning evening stress calm notes homework reflect goal today tomorrow time again thanks'
+).split()
+RATING_WEIGHTS = [5, 8, 17, 35, 35]  # Ratings 1 to 5
+SESSION_LENGTHS = [45, 50, 60]
+GENDERS = ['Male', 'Female', 'Other']
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    # auto_now_add would stamp every bulk-created row with the same moment
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class DatasetGenerator:
+    """Writes a synthetic but realistic dataset, a batch of clients per transaction.
+
+    Every row goes in through bulk_create, so the rollups that signals would normally
+    maintain (inbox rows, goal stats, rating summaries, the matching index) are written
+    here directly. The same `seed` always produces the same data.
+    """
+
+    def __init__(self, clients=1000, therapists=None, appointments=10, goals=3, messages=20, feedback=2,
+                 resources=200, prefix='seed', password='password', seed=0, batch_size=1000, now=None):
+        self.clients = clients
+        self.therapists = therapists if therapists is not None else max(1, clients // 25)
+        self.appointments = appointments
+        self.goals = goals
+        self.messages = messages
+        self.feedback = feedback
+        self.resources = resources
+        self.prefix = prefix
+        self.password = make_password(password)
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.now = now or timezone.now()
+        self.counts = {}
+        self.ratings = {}
+        self.rating_days = {}
+
+    def existing_users(self):
+        return User.objects.filter(username__startswith=f'{self.prefix}_').exists()
+
+    def run(self, progress=None):
+        """Generate everything, calling `progress(counts)` after every batch."""
+        with explicit_timestamps(Message._meta.get_field('timestamp'), Thread._meta.get_field('created_at'), Feedback._meta.get_field('timestamp')):
+            # (user id, session length) of every therapist, clients are spread over them
+            self.therapist_sessions = []
+            for start in range(0, self.therapists, self.batch_size):
+                self.therapist_sessions += self.create_therapists(start, min(start + self.batch_size, self.therapists))
+            self.create_resources()
+            for start in range(0, self.clients, self.batch_size):
+                with transaction.atomic():
+                    self.create_clients(start, min(start + self.batch_size, self.clients))
+                if progress:
+                    progress(self.counts)
+            self.write_ratings()
+        return self.counts
+
+    def bulk_create(self, model, rows, **kwargs):
+        created = model.objects.bulk_create(rows, **kwargs)
+        self.counts[model._meta.label] = self.counts.get(model._meta.label, 0) + len(rows)
+        return created
+
+    def text(self, words):
+        return ' '.join(self.random.choice(WORDS) for i in range(words)).capitalize() + '.'
+
+    def users(self, kind, start, end):
+        return self.bulk_create(User, [
+            User(
+                username=f'{self.prefix}_{kind}{n}', email=f'{self.prefix}_{kind}{n}@example.com',
+                password=self.password, is_active=True,
+            )
+            for n in range(start, end)
+        ])
+
+    def create_therapists(self, start, end):
+        with transaction.atomic():
+            users = self.users('t', start, end)
+            profiles = self.bulk_create(Profile, [
+                Profile(user=user, phone_number=f'555{user.pk:07d}'[:15], address=f'{user.pk} Main Street', role='therapist')
+                for user in users
+            ])
+            index_users(profiles)
+            therapist_profiles = self.bulk_create(TherapistProfile, [
+                TherapistProfile(
+                    profile=profile,
+                    gender=self.random.choice(GENDERS),
+                    license_number=f'LIC-{profile.user_id}',
+                    certifications=', '.join(self.random.sample(CERTIFICATIONS, self.random.randint(1, 3))),
+                    specializations=', '.join(self.random.sample(ISSUES, self.random.randint(2, 4))),
+                    years_of_experience=self.random.randint(1, 30),
+                    session_length=self.random.choice(SESSION_LENGTHS),
+                )
+                for profile in profiles
+            ])
+            index_therapists(therapist_profiles)
+            # Weekdays, nine to five
+            self.bulk_create(TherapistAvailability, [
+                TherapistAvailability(therapist=user, weekday=weekday, start_time=clock(9), end_time=clock(17))
+                for user in users for weekday in range(5)
+            ])
+        return [(user.pk, profile.session_length) for user, profile in zip(users, therapist_profiles)]
+
+    def create_resources(self):
+        for start in range(0, self.resources, self.batch_size):
+            self.bulk_create(Resource, [
+                Resource(
+                    title=f'{self.random.choice(ISSUES).capitalize()}: {self.text(3)[:-1]}',
+                    description=self.text(30),
+                    link=f'https://example.com/resources/{n}',
+                )
+                for n in range(start, min(start + self.batch_size, self.resources))
+            ])
+        bump_catalog_version()
+
+    def moment(self, days_before, days_after):
+        # A session start on the hour within working hours
+        day = self.now + timedelta(days=self.random.randint(-days_before, days_after))
+        return day.replace(hour=self.random.randint(9, 16), minute=0, second=0, microsecond=0)
+
+    def around(self, average):
+        return self.random.randint(0, 2 * average) if average else 0
+
+    def create_clients(self, start, end):
+        users = self.users('c', start, end)
+        profiles = self.bulk_create(Profile, [
+            Profile(user=user, phone_number=f'555{user.pk:07d}'[:15], address=f'{user.pk} High Street', role='client')
+            for user in users
+        ])
+        index_users(profiles)
+        self.bulk_create(ClientProfile, [
+            ClientProfile(
+                profile=profile,
+                age=self.random.randint(18, 80),
+                gender=self.random.choice(GENDERS),
+                medical_history=self.text(12),
+                therapy_goals=self.text(8),
+                preferred_therapist_gender=self.random.choice(['Male', 'Female', 'No Preference']),
+                specific_issues=', '.join(self.random.sample(ISSUES, self.random.randint(1, 3))),
+            )
+            for profile in profiles
+        ])
+        self.bulk_create(PrivacySetting, [
+            PrivacySetting(client=user, share_appointments=self.random.random() < 0.9, share_goals=self.random.random() < 0.8)
+            for user in users
+        ])
+        therapist_of = {user.pk: self.random.choice(self.therapist_sessions) for user in users}
+        appointments = self.create_appointments(users, therapist_of)
+        self.create_goals(users)
+        self.create_messages(users, therapist_of)
+        self.create_feedback(appointments)
+
+    def create_appointments(self, users, therapist_of):
+        rows = []
+        for user in users:
+            therapist_id, session_length = therapist_of[user.pk]
+            for i in range(self.around(self.appointments)):
+                # Most of a client's history lies in the past
+                date = self.moment(365, 90) if self.random.random() < 0.8 else self.moment(0, 90)
+                rows.append(Appointment(
+                    client=user, therapist_id=therapist_id, date=date, ends_at=date + timedelta(minutes=session_length),
+                    confirmed=date < self.now or self.random.random() < 0.7,
+                ))
+        return self.bulk_create(Appointment, rows)
+
+    def create_goals(self, users):
+        goals, steps = [], []
+        for user in users:
+            for i in range(self.around(self.goals)):
+                start = self.moment(365, 0)
+                progress = self.random.choice([0, 10, 25, 40, 50, 60, 75, 90, COMPLETE])
+                # Progress moved in a few steps after the goal was set
+                history = sorted(self.random.sample(range(1, progress), min(progress - 1, self.random.randint(0, 2)))) + [progress] if progress else []
+                moments = sorted(start + timedelta(days=self.random.randint(0, max(0, (self.now - start).days))) for step in history)
+                goals.append(Goal(
+                    client=user, title=self.random.choice(GOAL_TITLES), description=self.text(10),
+                    start_date=start.date(), progress=progress, last_progress_at=moments[-1] if moments else start,
+                ))
+                steps.append([(0, start)] + list(zip(history, moments)))
+        goals = self.bulk_create(Goal, goals)
+        self.bulk_create(GoalProgress, [
+            GoalProgress(goal=goal, progress=value, recorded_at=moment)
+            for goal, history in zip(goals, steps) for value, moment in history
+        ])
+
+        stats, days = {}, {}
+        for goal, history in zip(goals, steps):
+            row = stats.setdefault(goal.client_id, ClientGoalStats(client_id=goal.client_id))
+            row.goal_count += 1
+            row.completed_count += int(goal.progress >= COMPLETE)
+            row.progress_sum += goal.progress
+            row.last_progress_at = max(filter(None, [row.last_progress_at, goal.last_progress_at]))
+            for (before, _), (value, moment) in zip(history, history[1:]):
+                key = (goal.client_id, timezone.localtime(moment).date())
+                days[key] = days.get(key, 0) + value - before
+        self.bulk_create(ClientGoalStats, list(stats.values()))
+        self.bulk_create(ClientProgressDay, [
+            ClientProgressDay(client_id=client_id, day=day, delta=delta) for (client_id, day), delta in days.items() if delta
+        ])
+
+    def create_messages(self, users, therapist_of):
+        # Conversations of a few messages each between a client and their therapist
+        conversations = []
+        for user in users:
+            therapist_id = therapist_of[user.pk][0]
+            remaining = self.around(self.messages)
+            while remaining > 0:
+                length = min(remaining, self.random.randint(1, 8))
+                remaining -= length
+                started = self.now - timedelta(days=self.random.randint(0, 365), minutes=self.random.randint(0, 24 * 60))
+                conversations.append((user.pk, therapist_id, started, length))
+        threads = self.bulk_create(Thread, [
+            Thread(subject=self.text(4)[:-1], created_at=started) for _, _, started, _ in conversations
+        ])
+
+        messages, last = [], []
+        for thread, (client_id, therapist_id, started, length) in zip(threads, conversations):
+            sender, receiver = (client_id, therapist_id) if self.random.random() < 0.6 else (therapist_id, client_id)
+            moment = started
+            for n in range(length):
+                # Only the tail of a recent conversation is still unread
+                read = moment < self.now - timedelta(days=2) or n < length - 2
+                messages.append(Message(
+                    thread=thread, sender_id=sender, receiver_id=receiver, subject=thread.subject,
+                    body=self.text(self.random.randint(5, 60)), timestamp=moment, read=read,
+                ))
+                sender, receiver = receiver, sender
+                moment = min(self.now, moment + timedelta(minutes=self.random.randint(5, 3 * 24 * 60)))
+            last.append(len(messages) - 1)
+        messages = self.bulk_create(Message, messages)
+
+        entries = []
+        first = 0
+        for thread, (client_id, therapist_id, _, _), end in zip(threads, conversations, last):
+            thread_messages = messages[first:end + 1]
+            first = end + 1
+            latest = thread_messages[-1]
+            for user_id, other_id in ((client_id, therapist_id), (therapist_id, client_id)):
+                entries.append(InboxEntry(
+                    user_id=user_id, thread=thread, other_id=other_id, last_message=latest,
+                    last_sender_id=latest.sender_id, last_preview=preview(latest.body), last_message_at=latest.timestamp,
+                    unread_count=sum(1 for message in thread_messages if message.receiver_id == user_id and not message.read),
+                ))
+        self.bulk_create(InboxEntry, entries)
+
+    def create_feedback(self, appointments):
+        past = {}
+        for appointment in appointments:
+            if appointment.ends_at < self.now:
+                past.setdefault(appointment.client_id, []).append(appointment)
+        rows = []
+        for client_appointments in past.values():
+            for appointment in self.random.sample(client_appointments, min(len(client_appointments), self.around(self.feedback))):
+                rating = self.random.choices(range(1, 6), RATING_WEIGHTS)[0]
+                rows.append(Feedback(
+                    client_id=appointment.client_id, therapist_id=appointment.therapist_id, appointment=appointment,
+                    rating=rating, feedback_text=self.text(20), timestamp=appointment.ends_at,
+                ))
+                summary = self.ratings.setdefault(appointment.therapist_id, TherapistRating(therapist_id=appointment.therapist_id))
+                summary.count += 1
+                summary.total += rating
+                setattr(summary, f'rating_{rating}', getattr(summary, f'rating_{rating}') + 1)
+                day = self.rating_days.setdefault(
+                    (appointment.therapist_id, timezone.localtime(appointment.ends_at).date()),
+                    [0, 0],
+                )
+                day[0] += 1
+                day[1] += rating
+        self.bulk_create(Feedback, rows)
+
+    def write_ratings(self):
+        # Therapists take feedback from many client batches, their summaries go in last
+        with transaction.atomic():
+            self.bulk_create(TherapistRating, list(self.ratings.values()))
+            self.bulk_create(FeedbackDay, [
+                FeedbackDay(therapist_id=therapist_id, day=day, count=count, total=total)
+                for (therapist_id, day), (count, total) in self.rating_days.items()
+            ])
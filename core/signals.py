@@ -0,0 +1,188 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.autoreload import file_changed
+
+from .catalog import bump_catalog_version
+from .directory import index_user, set_role
+from .forms import forget_blank_renders
+from .fragments import invalidate_fragments
+from .matching import index_therapist
+from .metrics import APPOINTMENTS_BOOKED, MESSAGES_SENT
+from .messaging import assign_thread, forget_message, publish_new_message, publish_unread_count, rebuild_inbox, record_message
+from .models import Appointment, Feedback, Goal, Message, PrivacySetting, Profile, Resource, TherapistProfile
+from .progress import forget_goal, record_progress
+from .ratings import apply_rating
+
+
+@receiver(post_save, sender=User)
+def update_name_index(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Logging in saves last_login only, that leaves the names alone
+    if raw or (update_fields is not None and not {'username', 'first_name', 'last_name'} & set(update_fields)):
+        return
+    # A new user has no profile yet, it brings the role when it is saved
+    index_user(instance, role='' if created else None, created=created)
+
+
+@receiver(post_save, sender=Profile)
+def update_name_role(sender, instance, raw=False, **kwargs):
+    if not raw:
+        set_role(instance.user_id, instance.role)
+
+
+@receiver(post_save, sender=TherapistProfile)
+def update_matching_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_therapist(instance)
+
+
+def therapist_ids_of(client_id):
+    return list(Appointment.objects.filter(client_id=client_id).values_list('therapist_id', flat=True).distinct())
+
+
+def client_ids_of(therapist_id):
+    return list(Appointment.objects.filter(therapist_id=therapist_id).values_list('client_id', flat=True).distinct())
+
+
+@receiver(post_save, sender=TherapistProfile)
+def therapist_profile_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    therapist_id = instance.profile.user_id
+    invalidate_fragments([therapist_id], ['therapist'])
+    # Clients see their therapist's specializations too
+    invalidate_fragments(client_ids_of(therapist_id), ['therapist'])
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def appointment_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_fragments([instance.client_id], ['appointments', 'past_appointments', 'therapist'])
+    # A new client brings their goals and feedback onto the therapist's dashboard
+    invalidate_fragments([instance.therapist_id], ['appointments', 'past_appointments', 'goals', 'feedback'])
+
+
+@receiver(post_save, sender=Appointment)
+def count_booking(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        APPOINTMENTS_BOOKED.inc('single')
+
+
+@receiver(pre_save, sender=Goal)
+def remember_previous_progress(sender, instance, raw=False, **kwargs):
+    instance._previous_progress = None
+    if instance.pk and not raw:
+        instance._previous_progress = Goal.objects.filter(pk=instance.pk).values_list('progress', flat=True).first()
+    if not raw and instance._previous_progress != instance.progress:
+        instance.last_progress_at = timezone.now()
+
+
+@receiver(post_save, sender=Goal)
+def goal_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        record_progress(instance, None if created else instance._previous_progress)
+
+
+@receiver(post_delete, sender=Goal)
+def goal_deleted(sender, instance, **kwargs):
+    forget_goal(instance)
+
+
+@receiver(post_save, sender=Goal)
+@receiver(post_delete, sender=Goal)
+def goal_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_fragments([instance.client_id] + therapist_ids_of(instance.client_id), ['goals'])
+
+
+@receiver(pre_save, sender=Message)
+def message_thread(sender, instance, raw=False, **kwargs):
+    if not raw:
+        assign_thread(instance)
+
+
+@receiver(pre_save, sender=Message)
+def remember_previous_message(sender, instance, raw=False, **kwargs):
+    # Edits, say in the admin, can move a message or flip its read flag under the inbox rows
+    instance._previous_message = None
+    if instance.pk and not raw:
+        instance._previous_message = Message.objects.filter(pk=instance.pk).values_list('thread_id', 'sender_id', 'receiver_id', 'read', 'body').first()
+
+
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    users, receivers = {instance.sender_id, instance.receiver_id}, {instance.receiver_id}
+    previous = getattr(instance, '_previous_message', None)
+    if created:
+        MESSAGES_SENT.inc()
+        record_message(instance)
+        # Connected users get the message pushed instead of reloading
+        publish_new_message(instance)
+    elif previous and previous != (instance.thread_id, instance.sender_id, instance.receiver_id, instance.read, instance.body):
+        rebuild_inbox({previous[0], instance.thread_id})
+        users.update(previous[1:3])
+        receivers.add(previous[2])
+    invalidate_fragments(list(users), ['messages'])
+    for user_id in receivers:
+        publish_unread_count(user_id)
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    forget_message(instance)
+    invalidate_fragments([instance.sender_id, instance.receiver_id], ['messages'])
+    publish_unread_count(instance.receiver_id)
+
+
+@receiver(post_save, sender=PrivacySetting)
+@receiver(post_delete, sender=PrivacySetting)
+def privacy_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_fragments([instance.client_id], ['privacy'])
+
+
+@receiver(pre_save, sender=Feedback)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    # Edits have to take the old rating back out of the summaries
+    instance._previous_rating = None
+    if instance.pk and not raw:
+        instance._previous_rating = Feedback.objects.filter(pk=instance.pk).values_list('therapist_id', 'rating', 'timestamp').first()
+
+
+@receiver(post_save, sender=Feedback)
+def feedback_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    if previous:
+        apply_rating(*previous, sign=-1)
+    apply_rating(instance.therapist_id, instance.rating, instance.timestamp)
+    invalidate_fragments([instance.client_id], ['feedback'])
+    invalidate_fragments([instance.therapist_id], ['feedback', 'therapist'])
+
+
+@receiver(post_delete, sender=Feedback)
+def feedback_deleted(sender, instance, **kwargs):
+    apply_rating(instance.therapist_id, instance.rating, instance.timestamp, sign=-1)
+    invalidate_fragments([instance.client_id], ['feedback'])
+    invalidate_fragments([instance.therapist_id], ['feedback', 'therapist'])
+
+
+@receiver(post_save, sender=Resource)
+@receiver(post_delete, sender=Resource)
+def resource_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_catalog_version()
+
+
+@receiver(file_changed)
+def template_changed(sender, file_path, **kwargs):
+    # runserver picks up edited templates without a restart, cached form renders must follow
+    if file_path.suffix == '.html':
+        forget_blank_renders()
@@ -0,0 +1,172 @@
+import hashlib
+import os
+import tempfile
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig, ValidationError
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.utils.functional import cached_property
+
+UPLOAD_MAX_SIZE = getattr(settings, 'UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+# Upload fields that only accept PDF documents, checked on the first chunk
+PDF_UPLOAD_FIELDS = getattr(settings, 'PDF_UPLOAD_FIELDS', {'certificate_pdf', 'id_pdf'})
+PDF_MAGIC = b'%PDF-'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Stores each upload once, under the SHA-256 of its content.
+
+    The upload is streamed to a temporary file chunk by chunk while it is hashed, then
+    moved to cas/<aa>/<bb>/<digest><ext>. Uploading the same bytes again only returns
+    the existing name. Every stored blob has a StoredFile row for lookups by hash.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is decided by the content, never by the uploaded name
+        return name
+
+    @cached_property
+    def tmp_dir(self):
+        path = os.path.join(self.location, 'cas', 'tmp')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _save(self, name, content):
+        StoredFile = apps.get_model('core', 'StoredFile')
+        hasher = hashlib.sha256()
+        size = 0
+        head = b''
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in content.chunks():
+                    size += len(chunk)
+                    if size > UPLOAD_MAX_SIZE:
+                        raise ValidationError('The file is larger than %(limit)s bytes.', params={'limit': UPLOAD_MAX_SIZE})
+                    if len(head) < len(PDF_MAGIC):
+                        head += chunk[:len(PDF_MAGIC)]
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+            digest = hasher.hexdigest()
+            # The same bytes uploaded under another extension keep the name they were first stored under
+            final_name = StoredFile.objects.filter(sha256=digest).values_list('name', flat=True).first()
+            if final_name is None:
+                extension = os.path.splitext(name)[1].lower()[:10]
+                final_name = f'cas/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+            final_path = self.path(final_name)
+            moved = not os.path.exists(final_path)
+            if moved:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+                os.replace(tmp_path, final_path)
+            else:
+                os.remove(tmp_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        content_type = 'application/pdf' if head.startswith(PDF_MAGIC) else getattr(content, 'content_type', None) or ''
+        stored, _ = StoredFile.objects.get_or_create(
+            sha256=digest, defaults={'name': final_name, 'size': size, 'content_type': content_type},
+        )
+        if moved and stored.name != final_name:
+            # Another upload of these bytes under another name got its row in first
+            os.remove(final_path)
+        return stored.name
+
+
+def document_storage():
+    return _document_storage
+
+
+_document_storage = ContentAddressedStorage()
+
+
+class RejectedUpload(SimpleUploadedFile):
+    """Stands in for an upload the limits stopped, so form validation can report why."""
+
+    def __init__(self, field_name, file_name, rejection, size):
+        super().__init__(file_name, b'', 'application/octet-stream')
+        self.field_name = field_name
+        self.rejection = rejection
+        # Report what was received so the form field does not mistake it for an empty file
+        self.size = max(size, 1)
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    """Enforces size and type limits while the request body streams in.
+
+    Must come first in FILE_UPLOAD_HANDLERS. A file that is not a PDF where one is
+    expected has its chunks dropped and reaches the form as a RejectedUpload. A file over
+    UPLOAD_MAX_SIZE stops the upload without reading the rest of the body, and the
+    request is answered with a 400 before any view runs.
+    """
+
+    too_big = None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.received = 0
+        self.rejection = None
+        if content_length is not None and content_length > UPLOAD_MAX_SIZE:
+            self.stop()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.rejection:
+            return None
+        if start == 0 and self.field_name in PDF_UPLOAD_FIELDS and not raw_data.startswith(PDF_MAGIC):
+            self.rejection = 'Only PDF documents can be uploaded here.'
+            return None
+        self.received += len(raw_data)
+        if self.received > UPLOAD_MAX_SIZE:
+            self.stop()
+        return raw_data
+
+    def stop(self):
+        self.too_big = f'{self.field_name}: the file is larger than {UPLOAD_MAX_SIZE} bytes.'
+        raise StopUpload(connection_reset=True)
+
+    def file_complete(self, file_size):
+        if self.rejection:
+            return RejectedUpload(self.field_name, self.file_name, self.rejection, self.received)
+        return None
+
+    def upload_complete(self):
+        # The parse ended early, a view must not run on the fields that made it in
+        if self.too_big:
+            raise RequestDataTooBig(self.too_big)
+
+
+def _incoming(value):
+    # Model validators get a FieldFile, only one that was just assigned wraps an upload to check
+    if getattr(value, '_committed', True):
+        return None
+    return value.file
+
+
+def validate_upload(value):
+    upload = _incoming(value)
+    if upload is None:
+        return
+    rejection = getattr(upload, 'rejection', None)
+    if rejection:
+        raise ValidationError(rejection)
+    if upload.size > UPLOAD_MAX_SIZE:
+        raise ValidationError('The file is larger than %(limit)s bytes.', params={'limit': UPLOAD_MAX_SIZE})
+
+
+def validate_pdf(value):
+    validate_upload(value)
+    upload = _incoming(value)
+    if upload is None:
+        return
+    position = upload.tell()
+    upload.seek(0)
+    head = upload.read(len(PDF_MAGIC))
+    upload.seek(position)
+    if head != PDF_MAGIC:
+        raise ValidationError('Only PDF documents can be uploaded here.')
@@ -0,0 +1,12 @@
+from django import template
+from crispy_forms.utils import TEMPLATE_PACK
+
+from core.forms import render_crispy
+
+register = template.Library()
+
+
+@register.filter
+def crispy_cached(form, template_pack=TEMPLATE_PACK):
+    """Like crispy's `crispy` filter, but blank forms of a CachedRenderMixin class render once."""
+    return render_crispy(form, template_pack)
@@ -1,3 +1,1082 @@
-from django.test import TestCase
+import itertools
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from asgiref.sync import sync_to_async
+from crispy_forms.templatetags.crispy_forms_filters import as_crispy_form
+from io import StringIO
+from unittest import mock
+from datetime import datetime, time as clock, timedelta
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.core.cache import caches
+from django.core.exceptions import RequestDataTooBig, ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.db import IntegrityError, connection, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone, translation
+
+from .availability import book_appointment, book_series, confirm_appointments, next_free_slots
+from .benchmarks import ROUTES, Route, Subjects
+from .catalog import MAX_CATALOG_PAGE
+from . import dashboards
+from .dashboards import DASHBOARD_SECTIONS, dashboard_fragments, render_section
+from .management.commands.import_users import Command as ImportUsersCommand
+from .forms import AppointmentForm, FeedbackForm, MessageForm, forget_blank_renders, render_crispy
+from .fragments import FRAGMENT_TIMEOUT, fragment_cache, fragment_key
+from .profiling import instrument_templates, templates_instrumented, uninstrument_templates
+from .progress import caseload, rebuild_progress_rollups
+from .ratings import rating_summary, rebuild_ratings
+from .reminders import queue_due_reminders
+from .events import get_broker, sse_frame, user_channel
+from .matching import match_therapists
+from .metrics import Registry
+from .messaging import mark_read, rebuild_inbox, send_message
+from .pagination import InvalidCursor, KeysetPaginator
+from .views import _message_stream
+from .mail import MAX_ATTEMPTS, claim_batch, drain_queue, queue_mail, retry_delay, send_batch
+from .models import Appointment, AppointmentReminder, BlockedPeriod, ClientGoalStats, ClientProfile, ClientProgressDay, Feedback, FeedbackDay, Goal, GoalProgress, InboxEntry, Message, OutboundEmail, Profile, Resource, SpecializationTerm, StoredFile, TherapistAvailability, TherapistProfile, TherapistRating
+from .seeding import DatasetGenerator
+from .storage import ContentAddressedStorage, LimitedUploadHandler
+
+# Every view runs against each of these datasets; per-client volumes grow with the scale
+DATASET_SCALES = [1, 4]
+TIMED_RUNS = 3
+
+_usernames = itertools.count()
+
+
+def _registration(role_fields):
+    def data(subjects):
+        n = next(_usernames)
+        return {
+            'username': f'budget{n}', 'email': f'budget{n}@example.com', 'password': 'password',
+            'phone_number': '5550000000', 'address': '1 Test Street', **role_fields,
+        }
+    return data
+
+
+REGISTRATION_ROUTES = {
+    'register:post': Route(method='post', data=_registration({
+        'age': 30, 'gender': 'Female', 'medical_history': 'None', 'therapy_goals': 'Sleep better',
+        'preferred_therapist_gender': 'No Preference', 'specific_issues': 'insomnia',
+    })),
+    'register_therapist:post': Route(method='post', data=_registration({
+        'license_number': 'LIC-1', 'gender': 'Male', 'certifications': 'CBT', 'specializations': 'anxiety',
+        'years_of_experience': 5,
+    })),
+}
+
+# (queries, milliseconds) a request may use on the largest dataset, caches cold.
+# Query budgets are exact on purpose: any new query is a change worth reviewing.
+VIEW_BUDGETS = {
+    'client_dashboard': (2, 200),
+    'therapist_dashboard': (2, 200),
+    'dashboard_section': (3, 300),
+    'schedule_appointment': (4, 300),
+    'register': (0, 200),
+    'register_therapist': (0, 200),
+    'register_role': (1, 200),
+    'autocomplete_therapists': (3, 100),
+    'autocomplete_receivers': (6, 100),
+    'update_goal_progress': (3, 200),
+    'register:post': (7, 300),
+    'register_therapist:post': (10, 300),
+}
+
+
+def normalize(sql):
+    # The same statement with other parameters is the same query for N+1 purposes
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    return re.sub(r'\((?:\?, )+\?\)', '(...)', sql)
+
+
+def format_queries(queries):
+    return '\n'.join(f'  {n}. {query}' for n, query in enumerate(queries, start=1))
+
+
+def repeated_more_often(small, large):
+    # A statement showing up once more is a branch the data took, one repeated more often is an N+1
+    before, after = Counter(map(normalize, small)), Counter(map(normalize, large))
+    return [
+        f'  {before[statement]} -> {count}x  {statement}'
+        for statement, count in after.most_common() if count > before[statement] and count > 1
+    ]
+
+
+class ViewBudgetTests(TestCase):
+    """Query and time budgets of the views that have been tuned, on datasets of growing size."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.measurements = {}
+        for scale in DATASET_SCALES:
+            # Each dataset is rolled back before the next, bigger one is generated
+            with transaction.atomic():
+                DatasetGenerator(
+                    clients=10 * scale, therapists=2, appointments=3 * scale, goals=2 * scale,
+                    messages=5 * scale, feedback=scale, resources=5 * scale, seed=scale,
+                ).run()
+                subjects = Subjects()
+                for name in VIEW_BUDGETS:
+                    cls.measurements[name, scale] = cls.measure(name, subjects)
+                transaction.set_rollback(True)
+
+    @classmethod
+    def measure(cls, name, subjects):
+        route = REGISTRATION_ROUTES.get(name) or ROUTES[name]
+
+        def value(spec):
+            return spec(subjects) if callable(spec) else spec
+
+        client = Client()
+        if route.role:
+            client.force_login(subjects.user(route.role))
+        url = reverse(name.split(':')[0], kwargs=value(route.kwargs) or {})
+        queries, timings = None, []
+        for run in range(TIMED_RUNS):
+            for cache in caches.all():
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                if route.method == 'post':
+                    response = client.post(url, value(route.data))
+                else:
+                    response = client.get(url, value(route.query) or {})
+                timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code < 400, f'{name} answered {response.status_code}'
+            # Session and login writes only happen on the first request
+            queries = [query['sql'] for query in captured.captured_queries if 'django_session' not in query['sql']]
+        return queries, statistics.median(timings)
+
+    def test_query_budgets(self):
+        largest = DATASET_SCALES[-1]
+        for name, (budget, milliseconds) in VIEW_BUDGETS.items():
+            with self.subTest(view=name):
+                queries, elapsed = self.measurements[name, largest]
+                self.assertLessEqual(
+                    len(queries), budget,
+                    f'{name} used {len(queries)} queries, its budget is {budget}:\n{format_queries(queries)}',
+                )
+
+    def test_time_budgets(self):
+        largest = DATASET_SCALES[-1]
+        for name, (budget, milliseconds) in VIEW_BUDGETS.items():
+            with self.subTest(view=name):
+                queries, elapsed = self.measurements[name, largest]
+                self.assertLessEqual(elapsed, milliseconds, f'{name} took {elapsed:.1f}ms, its budget is {milliseconds}ms')
+
+    def test_query_count_does_not_grow_with_data(self):
+        smallest, largest = DATASET_SCALES[0], DATASET_SCALES[-1]
+        for name in VIEW_BUDGETS:
+            with self.subTest(view=name):
+                small, large = self.measurements[name, smallest][0], self.measurements[name, largest][0]
+                repeated = repeated_more_often(small, large)
+                if repeated:
+                    self.fail(
+                        f'{name} went from {len(small)} to {len(large)} queries when the data grew {largest}x, '
+                        f'probably an N+1. Statements that repeat more often:\n' + '\n'.join(repeated)
+                        + f'\nAll queries on the larger dataset:\n{format_queries(large)}'
+                    )
+
+
+def make_user(username, role='client', **therapist_fields):
+    user = User.objects.create_user(username, f'{username}@example.com', 'password')
+    profile = Profile.objects.create(user=user, phone_number='5550000000', address='1 Test Street', role=role)
+    if role == 'therapist':
+        TherapistProfile.objects.create(profile=profile, **{
+            'license_number': 'LIC-1', 'certifications': 'CBT', 'specializations': 'anxiety',
+            'years_of_experience': 5, **therapist_fields,
+        })
+    return user
+
+
+def next_weekday(weekday, hour, weeks_ahead=1):
+    day = timezone.localdate() + timedelta(weeks=weeks_ahead)
+    day += timedelta(days=(weekday - day.weekday()) % 7)
+    return timezone.make_aware(datetime.combine(day, clock(hour)))
+
+
+class AvailabilityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = make_user('client')
+        cls.therapist = make_user('therapist', role='therapist', session_length=60)
+        TherapistAvailability.objects.create(therapist=cls.therapist, weekday=0, start_time=clock(9), end_time=clock(12))
+
+    def test_booking_rejects_past_sessions(self):
+        last_monday = next_weekday(0, 9, weeks_ahead=-1)
+        with self.assertRaisesMessage(ValidationError, 'only be booked in the future'):
+            book_appointment(self.client_user, self.therapist, last_monday)
+        with self.assertRaisesMessage(ValidationError, 'only be booked in the future'):
+            book_series(self.client_user, self.therapist, last_monday, 3)
+        self.assertFalse(Appointment.objects.exists())
+
+    def test_booking_rejects_overlapping_sessions(self):
+        monday = next_weekday(0, 9)
+        book_appointment(self.client_user, self.therapist, monday)
+        with self.assertRaisesMessage(ValidationError, 'already booked'):
+            book_appointment(self.client_user, self.therapist, monday + timedelta(minutes=30))
+        # Back to back is fine
+        book_appointment(self.client_user, self.therapist, monday + timedelta(hours=1))
+
+    def test_booking_rejects_blocked_periods_and_hours_off(self):
+        monday = next_weekday(0, 9)
+        BlockedPeriod.objects.create(therapist=self.therapist, start=monday, end=monday + timedelta(hours=1))
+        with self.assertRaisesMessage(ValidationError, 'already booked'):
+            book_appointment(self.client_user, self.therapist, monday)
+        with self.assertRaisesMessage(ValidationError, 'does not work'):
+            book_appointment(self.client_user, self.therapist, monday.replace(hour=11, minute=30))
+        with self.assertRaisesMessage(ValidationError, 'does not work'):
+            book_appointment(self.client_user, self.therapist, next_weekday(1, 10))
+
+    def test_free_slots_skip_busy_time(self):
+        monday = next_weekday(0, 9)
+        book_appointment(self.client_user, self.therapist, monday + timedelta(hours=1))
+        slots = next_free_slots(self.therapist, count=2, after=monday - timedelta(days=1))
+        self.assertEqual(slots, [monday, monday + timedelta(hours=2)])
+
+    def test_slots_and_booking_agree_without_working_hours(self):
+        therapist = make_user('no_hours', role='therapist')
+        slots = next_free_slots(therapist, count=3, after=next_weekday(0, 0))
+        self.assertEqual(len(slots), 3)
+        for slot in slots:
+            book_appointment(self.client_user, therapist, slot)
+        with self.assertRaisesMessage(ValidationError, 'does not work'):
+            book_appointment(self.client_user, therapist, next_weekday(0, 22))
+
+    def test_ends_at_follows_session_length_and_date(self):
+        monday = next_weekday(0, 9)
+        appointment = Appointment.objects.create(client=self.client_user, therapist=self.therapist, date=monday)
+        self.assertEqual(appointment.ends_at, monday + timedelta(minutes=60))
+        appointment = Appointment.objects.get(pk=appointment.pk)
+        appointment.date = monday + timedelta(hours=2)
+        appointment.save(update_fields=['date'])
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.ends_at, monday + timedelta(hours=3))
+
+    def test_impossible_dates_are_bad_requests(self):
+        self.client.force_login(self.client_user)
+        response = self.client.get(reverse('free_slots', args=[self.therapist.pk]), {'after': '2026-02-30T10:00:00'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('free_therapists'), {'at': '2026-02-30T10:00:00'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BrokenConnection:
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        raise ConnectionError('relay unavailable')
+
+
+class MailQueueTests(TestCase):
+    def test_drain_sends_due_mail_once(self):
+        queue_mail('Hello', 'Body', 'someone@example.com')
+        self.assertEqual(drain_queue(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(drain_queue(), (0, 0))
+        self.assertEqual(OutboundEmail.objects.get().status, 'sent')
+
+    def test_failures_back_off_then_give_up(self):
+        email = queue_mail('Hello', 'Body', 'someone@example.com')
+        self.assertEqual(send_batch([email], BrokenConnection()), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('pending', 1))
+        self.assertIn('relay unavailable', email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now() + retry_delay(1) - timedelta(seconds=5))
+        # Not due again until the delay has passed
+        self.assertEqual(claim_batch(10), [])
+        for attempt in range(2, MAX_ATTEMPTS + 1):
+            send_batch([email], BrokenConnection())
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('failed', MAX_ATTEMPTS))
+
+    def test_retry_delay_doubles_up_to_a_cap(self):
+        self.assertEqual(retry_delay(2), 2 * retry_delay(1))
+        self.assertEqual(retry_delay(3), 4 * retry_delay(1))
+        self.assertEqual(retry_delay(100), timedelta(hours=6))
+
+
+class ImportUsersTests(TestCase):
+    client_fields = {
+        'phone_number': '5550000000', 'address': '1 Test Street', 'age': 30, 'gender': 'Female',
+        'medical_history': 'None', 'therapy_goals': 'Sleep better', 'preferred_therapist_gender': 'No Preference',
+        'specific_issues': 'insomnia',
+    }
+
+    def import_file(self, content, suffix):
+        with tempfile.NamedTemporaryFile('wb', suffix=suffix, delete=False) as f:
+            f.write(content)
+        self.addCleanup(os.remove, f.name)
+        rejects = f.name + '.rejects'
+        self.addCleanup(lambda: os.path.exists(rejects) and os.remove(rejects))
+        call_command('import_users', f.name, '--role', 'client', '--workers', '1', '--active', '--rejects', rejects, stdout=StringIO(), stderr=StringIO())
+        with open(rejects, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def row(self, username):
+        return {'username': username, 'email': f'{username}@example.com', 'password': 'password', **self.client_fields}
+
+    def test_unreadable_json_lines_are_rejected_with_their_line(self):
+        lines = [
+            json.dumps(self.row('first')).encode(),
+            b'{"username": "broken",',
+            b'',
+            b'["not", "an", "object"]',
+            json.dumps(self.row('second')).encode().replace(b'second', b'sec\xffond'),
+            json.dumps(self.row('third')).encode(),
+        ]
+        rejects = self.import_file(b'\n'.join(lines), '.jsonl')
+        self.assertEqual([reject['line'] for reject in rejects], [2, 4, 5])
+        self.assertEqual(set(User.objects.values_list('username', flat=True)), {'first', 'third'})
+
+    def test_csv_rows_are_validated_and_decoded_one_by_one(self):
+        header = ','.join(self.row('x'))
+        rows = [','.join(str(value) for value in self.row(name).values()) for name in ('first', 'second', 'third')]
+        rows[1] = rows[1].replace('second', 'sec\udcffond')
+        content = '\n'.join([header, *rows, 'fourth,,password']).encode('utf-8', 'surrogateescape')
+        rejects = self.import_file(content, '.csv')
+        self.assertEqual([reject['line'] for reject in rejects], [3, 5])
+        self.assertEqual(rejects[0]['errors'], {'__all__': ['Not valid UTF-8.']})
+        self.assertIn('phone_number', rejects[1]['errors'])
+        self.assertEqual(set(User.objects.values_list('username', flat=True)), {'first', 'third'})
+        self.assertEqual(Profile.objects.filter(role='client').count(), 2)
+
+    def test_usernames_are_compared_after_cleaning(self):
+        lines = [json.dumps(self.row(123)), json.dumps(self.row(['listed'])), json.dumps(self.row('123'))]
+        content = '\n'.join(lines).encode()
+        rejects = self.import_file(content, '.jsonl')
+        self.assertEqual([reject['line'] for reject in rejects], [2, 3])
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['123'])
+        # Importing the same file again rejects every row instead of failing on the unique index
+        self.assertEqual(sorted(reject['line'] for reject in self.import_file(content, '.jsonl')), [1, 2, 3])
+
+    def test_a_batch_that_fails_to_save_is_rejected(self):
+        with mock.patch.object(ImportUsersCommand, 'save_batch', side_effect=IntegrityError('UNIQUE constraint failed')):
+            rejects = self.import_file(json.dumps(self.row('first')).encode(), '.jsonl')
+        self.assertEqual(rejects, [{'line': 1, 'username': 'first', 'errors': {'__all__': ['Not saved: UNIQUE constraint failed']}}])
+        self.assertFalse(User.objects.exists())
+
+
+class DashboardFragmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = make_user('client')
+        cls.therapist = make_user('therapist', role='therapist')
+
+    def setUp(self):
+        fragment_cache().clear()
+
+    def test_roles_are_cached_apart(self):
+        # Anyone can ask for the other role's sections, that render must not end up on their own dashboard
+        dashboard_fragments('therapist', self.client_user, sections=['therapist'])
+        fragments = dashboard_fragments('client', self.client_user, sections=['therapist'])
+        self.assertEqual(fragments['therapist'], render_section('client', self.client_user, 'therapist')[0])
+        self.assertIsNotNone(fragment_cache().get(fragment_key('client', self.client_user.pk, 'therapist')))
+
+    def test_time_split_sections_expire_when_the_next_session_starts(self):
+        soon = timezone.now() + timedelta(minutes=10)
+        Appointment.objects.create(client=self.client_user, therapist=self.therapist, date=soon)
+        for role, user in (('client', self.client_user), ('therapist', self.therapist)):
+            for section in ('appointments', 'past_appointments'):
+                with self.subTest(role=role, section=section):
+                    html, timeout = render_section(role, user, section)
+                    self.assertAlmostEqual(timeout, 600, delta=5)
+        self.assertAlmostEqual(render_section('client', self.client_user, 'therapist')[1], 600, delta=5)
+        self.assertEqual(render_section('client', self.client_user, 'goals')[1], FRAGMENT_TIMEOUT)
+
+    def test_invalidation_reaches_both_roles(self):
+        dashboard_fragments('client', self.client_user, sections=['appointments'])
+        dashboard_fragments('therapist', self.client_user, sections=['appointments'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(client=self.client_user, therapist=self.therapist, date=timezone.now() + timedelta(days=1))
+        for role in ('client', 'therapist'):
+            self.assertIsNone(fragment_cache().get(fragment_key(role, self.client_user.pk, 'appointments')))
+
+
+class ResourceCatalogTests(TestCase):
+    def test_pages_past_the_last_allowed_are_not_found(self):
+        self.client.force_login(make_user('client'))
+        url = reverse('resource_catalog')
+        self.assertEqual(self.client.get(url, {'page': MAX_CATALOG_PAGE}).status_code, 200)
+        self.assertEqual(self.client.get(url, {'page': MAX_CATALOG_PAGE + 1}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'page': '9' * 30, 'q': 'anxiety'}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'page': '-3'}).status_code, 200)
+
+
+class DocumentStorageTests(TestCase):
+    def setUp(self):
+        location = tempfile.TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        self.storage = ContentAddressedStorage(location=location.name)
+
+    def test_same_content_is_stored_once(self):
+        first = self.storage.save('id.pdf', ContentFile(b'%PDF-1.4 same bytes'))
+        second = self.storage.save('other-name.pdf', ContentFile(b'%PDF-1.4 same bytes'))
+        third = self.storage.save('id.pdf', ContentFile(b'%PDF-1.4 other bytes'))
+        renamed = self.storage.save('id.txt', ContentFile(b'%PDF-1.4 same bytes'))
+        self.assertEqual(first, second)
+        self.assertEqual(renamed, first)
+        self.assertNotEqual(first, third)
+        self.assertEqual(StoredFile.objects.count(), 2)
+        self.assertEqual(len(os.listdir(os.path.dirname(self.storage.path(first)))), 1)
+        self.assertEqual(StoredFile.objects.get(name=first).content_type, 'application/pdf')
+        self.assertEqual(os.listdir(self.storage.tmp_dir), [])
+
+    def test_oversized_files_are_not_kept(self):
+        with mock.patch('core.storage.UPLOAD_MAX_SIZE', 8):
+            with self.assertRaises(ValidationError):
+                self.storage.save('big.pdf', ContentFile(b'%PDF-1.4 too long'))
+        self.assertEqual(os.listdir(self.storage.tmp_dir), [])
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_documents_that_are_not_pdfs_are_rejected_on_upload(self):
+        data = REGISTRATION_ROUTES['register_therapist:post'].data(None)
+        data['certificate_pdf'] = SimpleUploadedFile('certificate.pdf', b'<html>not a pdf</html>', 'application/pdf')
+        response = self.client.post(reverse('register_therapist'), data)
+        self.assertContains(response, 'Only PDF documents can be uploaded here.')
+        self.assertFalse(User.objects.filter(username=data['username']).exists())
+        with mock.patch('core.storage.UPLOAD_MAX_SIZE', 8):
+            data['certificate_pdf'] = SimpleUploadedFile('certificate.pdf', b'%PDF-1.4 too long', 'application/pdf')
+            response = self.client.post(reverse('register_therapist'), data)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.filter(username=data['username']).exists())
+
+    def test_oversized_uploads_stop_reading_the_body(self):
+        handler = LimitedUploadHandler()
+        handler.new_file('certificate_pdf', 'certificate.pdf', 'application/pdf', None)
+        with mock.patch('core.storage.UPLOAD_MAX_SIZE', 8):
+            self.assertEqual(handler.receive_data_chunk(b'%PDF-1.4', 0), b'%PDF-1.4')
+            with self.assertRaises(StopUpload) as stopped:
+                handler.receive_data_chunk(b' too long', 8)
+        self.assertTrue(stopped.exception.connection_reset)
+        with self.assertRaises(RequestDataTooBig):
+            handler.upload_complete()
+
+
+class ProtectedMediaTests(TestCase):
+    document = 'cas/ab/cd/abcd.pdf'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user('owner')
+        ClientProfile.objects.create(
+            profile=cls.owner.profile, age=30, gender='Female', medical_history='None', therapy_goals='Sleep better',
+            preferred_therapist_gender='No Preference', specific_issues='insomnia', id_pdf=cls.document,
+        )
+        cls.therapist = make_user('therapist', role='therapist')
+        cls.stranger = make_user('stranger')
+        Resource.objects.create(title='Page', description='Uploaded page', file='resources/page.html')
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        for name, content in ((self.document, b'%PDF-1.4 0123456789'), ('resources/page.html', b'<script>alert(1)</script>')):
+            os.makedirs(os.path.join(media_root.name, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(media_root.name, name), 'wb') as f:
+                f.write(content)
+
+    def get(self, user, name, **headers):
+        self.client.force_login(user)
+        return self.client.get(reverse('protected_media', args=[name]), headers=headers)
+
+    def test_documents_are_only_served_to_their_owner_and_therapists(self):
+        self.assertEqual(self.get(self.owner, self.document).status_code, 200)
+        self.assertEqual(self.get(self.stranger, self.document).status_code, 404)
+        self.assertEqual(self.get(self.therapist, self.document).status_code, 404)
+        Appointment.objects.create(client=self.owner, therapist=self.therapist, date=timezone.now())
+        self.assertEqual(self.get(self.therapist, self.document).status_code, 200)
+        self.assertEqual(self.get(self.owner, 'cas/ab/cd/missing.pdf').status_code, 404)
+
+    def test_only_pdfs_are_shown_inline(self):
+        response = self.get(self.owner, self.document)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response['Content-Disposition'].startswith('inline'))
+        response = self.get(self.stranger, 'resources/page.html')
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertEqual(response['Content-Security-Policy'], 'sandbox')
+
+    def test_offloaded_names_are_quoted(self):
+        name = 'resources/my notes ü.html'
+        Resource.objects.create(title='Notes', description='Uploaded notes', file=name)
+        with open(os.path.join(settings.MEDIA_ROOT, name), 'wb') as f:
+            f.write(b'notes')
+        with override_settings(MEDIA_ACCEL_REDIRECT_PREFIX='/protected/'):
+            response = self.get(self.owner, name)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/resources/my%20notes%20%C3%BC.html')
+
+    def test_ranges(self):
+        response = self.get(self.owner, self.document, range='bytes=9-12')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'0123')
+        self.assertEqual(response['Content-Range'], 'bytes 9-12/19')
+        response = self.get(self.owner, self.document, range='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        self.assertEqual(self.get(self.owner, self.document, range='bytes=50-').status_code, 416)
+        # A range for another version of the file gets the whole current one
+        response = self.get(self.owner, self.document, range='bytes=9-12', if_range='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_requests(self):
+        etag = self.get(self.owner, self.document)['ETag']
+        self.assertEqual(etag, '"abcd"')
+        self.assertEqual(self.get(self.owner, self.document, if_none_match=etag).status_code, 304)
+        self.assertEqual(self.get(self.owner, self.document, if_none_match='"other"').status_code, 200)
+
+
+class RatingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = make_user('client')
+        cls.therapist = make_user('therapist', role='therapist')
+        cls.sessions = [
+            Appointment.objects.create(client=cls.client_user, therapist=cls.therapist, date=timezone.now() - timedelta(days=days))
+            for days in (1, 2, 3)
+        ]
+
+    def rate(self, appointment, rating):
+        return Feedback.objects.create(client=self.client_user, therapist=self.therapist, appointment=appointment, rating=rating, feedback_text='ok')
+
+    def summary(self):
+        summary = rating_summary(self.therapist.pk)
+        rating = summary['rating']
+        return (rating.count, rating.total, rating.histogram[3][1], summary['recent_count']) if rating else None
+
+    def test_summaries_follow_every_write(self):
+        feedback = self.rate(self.sessions[0], 4)
+        self.rate(self.sessions[1], 2)
+        self.assertEqual(self.summary(), (2, 6, 1, 2))
+        feedback.rating = 5
+        feedback.save()
+        self.assertEqual(self.summary(), (2, 7, 0, 2))
+        feedback.delete()
+        self.assertEqual(self.summary(), (1, 2, 0, 1))
+        expected = self.summary()
+        rebuild_ratings()
+        self.assertEqual(self.summary(), expected)
+
+    def test_deleting_a_therapist_with_feedback(self):
+        self.rate(self.sessions[0], 4)
+        self.therapist.delete()
+        self.assertFalse(Feedback.objects.exists())
+        self.assertFalse(TherapistRating.objects.exists())
+        self.assertFalse(FeedbackDay.objects.exists())
+
+    def test_deleting_a_client_takes_their_ratings_out(self):
+        self.rate(self.sessions[0], 4)
+        other = make_user('other')
+        session = Appointment.objects.create(client=other, therapist=self.therapist, date=timezone.now() - timedelta(days=1))
+        Feedback.objects.create(client=other, therapist=self.therapist, appointment=session, rating=2, feedback_text='meh')
+        other.delete()
+        self.assertEqual(self.summary(), (1, 4, 1, 1))
+
+    def test_one_feedback_per_session(self):
+        self.rate(self.sessions[0], 4)
+        data = {'appointment': self.sessions[0].pk, 'rating': 1, 'feedback_text': 'again'}
+        form = FeedbackForm(data, client=self.client_user)
+        self.assertIn('appointment', form.errors)
+        self.assertTrue(FeedbackForm(dict(data, appointment=self.sessions[1].pk), client=self.client_user).is_valid())
+
+
+class GoalProgressTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = make_user('client')
+        cls.therapist = make_user('therapist', role='therapist')
+        Appointment.objects.create(client=cls.client_user, therapist=cls.therapist, date=timezone.now())
+
+    def goal(self, progress=0):
+        return Goal.objects.create(client=self.client_user, title='Sleep', start_date=timezone.localdate(), progress=progress)
+
+    def stats(self):
+        stats = ClientGoalStats.objects.get(client=self.client_user)
+        return stats.goal_count, stats.completed_count, stats.progress_sum
+
+    def test_rollups_follow_every_write(self):
+        goal = self.goal(20)
+        self.goal(100)
+        self.assertEqual(self.stats(), (2, 1, 120))
+        goal.progress = 50
+        goal.save()
+        self.assertEqual(self.stats(), (2, 1, 150))
+        self.assertEqual(GoalProgress.objects.filter(goal=goal).count(), 2)
+        self.assertEqual(ClientProgressDay.objects.get(client=self.client_user).delta, 150)
+        goal.delete()
+        self.assertEqual(self.stats(), (1, 1, 100))
+        expected = self.stats()
+        rebuild_progress_rollups()
+        self.assertEqual(self.stats(), expected)
+
+    def test_caseload_reads_the_rollups(self):
+        self.goal(40)
+        self.goal(100)
+        totals = caseload(self.therapist)['totals']
+        self.assertEqual((totals['clients'], totals['goals'], totals['completed'], totals['completion_rate']), (1, 2, 1, 0.5))
+
+    def test_deleting_a_client_with_goals(self):
+        self.goal(40)
+        self.client_user.delete()
+        self.assertFalse(Goal.objects.exists())
+        self.assertFalse(ClientGoalStats.objects.exists())
+
+
+@override_settings(EVENT_BROKER='core.events.RecordingBroker', EVENT_STREAM_KEEPALIVE=1)
+class MessageEventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender = make_user('sender')
+        cls.receiver = make_user('receiver')
+
+    def setUp(self):
+        get_broker().published.clear()
+
+    def test_messages_are_published_to_both_sides_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            message = send_message(self.sender, self.receiver, 'Hello', 'Are you free on Monday?')
+            self.assertEqual(get_broker().published, [])
+        published = {(channel, event['type']) for channel, event in get_broker().published}
+        self.assertEqual(published, {
+            (user_channel(self.sender.pk), 'message'), (user_channel(self.receiver.pk), 'message'),
+            (user_channel(self.receiver.pk), 'unread'),
+        })
+        unread = [event for channel, event in get_broker().published if event['type'] == 'unread']
+        self.assertEqual(unread[0]['data'], {'count': 1})
+        self.assertEqual([event['data']['id'] for _, event in get_broker().published if event['type'] == 'message'], [message.pk] * 2)
+
+    async def test_stream_starts_with_the_unread_count_then_follows_the_channel(self):
+        stream = _message_stream(self.receiver)
+        try:
+            first = await stream.__anext__()
+            self.assertTrue(first.startswith('retry: 5000\n'))
+            self.assertIn(sse_frame({'type': 'unread', 'data': {'count': 0}}), first)
+            event = {'type': 'unread', 'data': {'count': 3}}
+            get_broker().publish(user_channel(self.receiver.pk), event)
+            self.assertEqual(await stream.__anext__(), sse_frame(event))
+            self.assertEqual(await stream.__anext__(), ': keepalive\n\n')
+        finally:
+            await stream.aclose()
+        self.assertEqual(get_broker().subscribers, {})
+
+    def test_streams_need_a_logged_in_user_and_an_asgi_server(self):
+        self.assertEqual(self.client.get(reverse('message_events')).status_code, 403)
+        self.client.force_login(self.receiver)
+        self.assertEqual(self.client.get(reverse('message_events')).status_code, 501)
+
+
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('client')
+        start = timezone.localdate()
+        # Pairs of goals share a start date, only the id tells them apart
+        for n in range(7):
+            Goal.objects.create(client=cls.user, title=f'Goal {n}', start_date=start - timedelta(days=n // 2))
+        cls.paginator = KeysetPaginator(Goal.objects.filter(client=cls.user), ('-start_date', '-id'), per_page=3)
+        cls.expected = list(Goal.objects.filter(client=cls.user).order_by('-start_date', '-id'))
+
+    def test_pages_walk_forward_and_back_without_gaps(self):
+        pages = [self.paginator.page()]
+        while pages[-1].has_next:
+            pages.append(self.paginator.page(pages[-1].next_cursor))
+        self.assertEqual([goal for page in pages for goal in page], self.expected)
+        self.assertFalse(pages[0].has_previous)
+        back = self.paginator.page(pages[-1].previous_cursor)
+        self.assertEqual(list(back), list(pages[-2]))
+
+    def test_tampered_and_foreign_cursors_are_refused(self):
+        cursor = self.paginator.page().next_cursor
+        with self.assertRaises(InvalidCursor):
+            self.paginator.page(cursor[:-2] + ('A' if cursor[-2] != 'A' else 'B') + cursor[-1])
+        with self.assertRaises(InvalidCursor):
+            KeysetPaginator(Goal.objects.all(), ('start_date', 'id'), per_page=3).page(cursor)
+        with self.assertRaises(InvalidCursor):
+            self.paginator.page('not-a-cursor')
+
+
+class AppointmentSeriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = make_user('client')
+        cls.therapist = make_user('therapist', role='therapist')
+        TherapistAvailability.objects.create(therapist=cls.therapist, weekday=0, start_time=clock(9), end_time=clock(17))
+
+    def test_weekly_series_is_booked_at_the_same_hour(self):
+        first = next_weekday(0, 10)
+        appointments = book_series(self.client_user, self.therapist, first, 4, interval_weeks=2)
+        self.assertEqual([a.date for a in appointments], [first + timedelta(weeks=2 * i) for i in range(4)])
+        self.assertTrue(all(a.ends_at == a.date + timedelta(minutes=50) for a in appointments))
+
+    def test_one_clash_books_nothing(self):
+        first = next_weekday(0, 10)
+        book_appointment(make_user('other'), self.therapist, first + timedelta(weeks=2, minutes=30))
+        with self.assertRaisesMessage(ValidationError, 'not available on'):
+            book_series(self.client_user, self.therapist, first, 4)
+        self.assertFalse(Appointment.objects.filter(client=self.client_user).exists())
+
+    def test_series_length_is_bounded(self):
+        with self.assertRaises(ValidationError):
+            book_series(self.client_user, self.therapist, next_weekday(0, 10), 0)
+
+    def test_confirming_only_touches_the_therapists_own_appointments(self):
+        own = book_appointment(self.client_user, self.therapist, next_weekday(0, 10))
+        other_therapist = make_user('other_therapist', role='therapist')
+        foreign = book_appointment(self.client_user, other_therapist, next_weekday(0, 10))
+        self.assertEqual(confirm_appointments(self.therapist, [own.pk, foreign.pk]), 1)
+        self.assertEqual(confirm_appointments(self.therapist, [own.pk]), 0)
+        foreign.refresh_from_db()
+        self.assertFalse(foreign.confirmed)
+
+
+class ReminderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = make_user('client')
+        cls.therapist = make_user('therapist', role='therapist')
+
+    def book(self, minutes_ahead, now):
+        return Appointment.objects.create(client=self.client_user, therapist=self.therapist, date=now + timedelta(minutes=minutes_ahead))
+
+    def test_each_reminder_is_queued_once(self):
+        now = timezone.now()
+        self.book(12 * 60, now)
+        self.assertEqual(queue_due_reminders(now), 2)
+        self.assertEqual(queue_due_reminders(now + timedelta(minutes=5)), 0)
+        # The one-hour reminder is a reminder of its own
+        self.assertEqual(queue_due_reminders(now + timedelta(minutes=11 * 60 + 1)), 2)
+        self.assertEqual(OutboundEmail.objects.count(), 4)
+        self.assertEqual(AppointmentReminder.objects.count(), 4)
+
+    def test_short_notice_bookings_only_get_the_reminder_that_fits(self):
+        now = timezone.now()
+        self.book(30, now)
+        self.book(3 * 24 * 60, now)
+        self.assertEqual(queue_due_reminders(now), 2)
+        self.assertEqual(set(AppointmentReminder.objects.values_list('lead_time', flat=True)), {60})
+
+
+class SubjectsTests(TestCase):
+    def test_the_benchmarked_client_has_a_goal(self):
+        therapist = make_user('therapist', role='therapist')
+        clients = [make_user(f'client{n}') for n in range(3)]
+        for client in clients:
+            appointment = Appointment.objects.create(client=client, therapist=therapist, date=timezone.now() - timedelta(days=1))
+            Feedback.objects.create(client=client, therapist=therapist, appointment=appointment, rating=4, feedback_text='ok')
+        goal = Goal.objects.create(client=clients[0], title='Sleep', start_date=timezone.localdate())
+        subjects = Subjects()
+        self.assertEqual((subjects.client, subjects.goal_id), (clients[0], goal.pk))
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('client')
+        cls.staff = make_user('staff')
+        cls.staff.is_staff = True
+        cls.staff.save()
+
+    def test_server_timing_is_only_shown_to_staff(self):
+        self.client.force_login(self.user)
+        self.assertNotIn('Server-Timing', self.client.get(reverse('home')))
+        self.client.force_login(self.staff)
+        self.assertIn('db;dur=', self.client.get(reverse('home'))['Server-Timing'])
+
+    async def test_async_requests_check_the_user_too(self):
+        await self.async_client.aforce_login(self.user)
+        self.assertNotIn('Server-Timing', await self.async_client.get(reverse('home')))
+        await self.async_client.aforce_login(self.staff)
+        self.assertIn('Server-Timing', await self.async_client.get(reverse('home')))
+
+    @override_settings(DEBUG=True)
+    def test_server_timing_is_shown_to_everyone_with_debug(self):
+        self.assertIn('total;dur=', self.client.get(reverse('home'))['Server-Timing'])
+
+    @override_settings(PROFILING_TEMPLATES=False)
+    def test_templates_are_left_alone_unless_asked_for(self):
+        self.addCleanup(instrument_templates if templates_instrumented() else uninstrument_templates)
+        uninstrument_templates()
+        self.client.force_login(self.staff)
+        self.assertNotIn('tpl;dur=', self.client.get(reverse('home'))['Server-Timing'])
+        self.assertFalse(templates_instrumented())
+
+
+class MessageReceiverTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = make_user('client')
+        cls.therapist = make_user('therapist', role='therapist')
+        cls.stranger = make_user('stranger')
+        Appointment.objects.create(client=cls.client_user, therapist=cls.therapist, date=timezone.now())
+
+    def form(self, receiver, user=None):
+        return MessageForm({'receiver': receiver.pk, 'subject': 'Hi', 'body': 'Hello'}, user=user or self.client_user)
+
+    def test_messages_only_go_to_counterparts(self):
+        self.assertTrue(self.form(self.therapist).is_valid())
+        self.assertTrue(self.form(self.client_user, user=self.therapist).is_valid())
+        self.assertIn('receiver', self.form(self.stranger).errors)
+        self.assertIn('receiver', self.form(self.client_user).errors)
+
+    def test_dashboard_refuses_strangers(self):
+        self.client.force_login(self.client_user)
+        data = {'message_form': '', 'receiver': self.stranger.pk, 'subject': 'Hi', 'body': 'Hello'}
+        self.assertEqual(self.client.post(reverse('client_dashboard'), data).status_code, 200)
+        self.assertFalse(Message.objects.exists())
+        data['receiver'] = self.therapist.pk
+        self.assertRedirects(self.client.post(reverse('client_dashboard'), data), reverse('client_dashboard'))
+        self.assertTrue(Message.objects.filter(receiver=self.therapist).exists())
+
+
+class FormRenderingTests(TestCase):
+    def test_cached_render_matches_crispy(self):
+        self.assertEqual(render_crispy(AppointmentForm()), as_crispy_form(AppointmentForm()))
+        self.assertIs(render_crispy(AppointmentForm()), render_crispy(AppointmentForm()))
+
+    def test_cached_renders_follow_the_language(self):
+        forget_blank_renders()
+        self.addCleanup(forget_blank_renders)
+        with mock.patch('core.forms.as_crispy_form', lambda form, pack: translation.get_language()):
+            with translation.override('de'):
+                self.assertEqual(render_crispy(AppointmentForm()), 'de')
+            with translation.override('en'):
+                self.assertEqual(render_crispy(AppointmentForm()), 'en')
+
+    def test_schedule_page_has_submit_button(self):
+        self.client.force_login(make_user('client'))
+        response = self.client.get(reverse('schedule_appointment'))
+        self.assertContains(response, '<button type="submit" class="btn btn-primary">Schedule Appointment</button>', html=True)
+
+
+class InboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender = make_user('sender')
+        cls.receiver = make_user('receiver')
+        cls.other = make_user('other')
+
+    def inbox(self):
+        return {
+            (entry.user_id, entry.thread_id): (entry.other_id, entry.last_message_id, entry.unread_count)
+            for entry in InboxEntry.objects.all()
+        }
+
+    def assertInbox(self, expected):
+        self.assertEqual(self.inbox(), expected)
+        # What the signals maintained is what a rebuild from the messages table gives
+        call_command('rebuild_inbox', stdout=StringIO())
+        self.assertEqual(self.inbox(), expected)
+
+    def test_send_and_reply(self):
+        first = send_message(self.sender, self.receiver, 'Hello', 'Are you free on Monday?')
+        thread = first.thread_id
+        self.assertInbox({(self.sender.pk, thread): (self.receiver.pk, first.pk, 0), (self.receiver.pk, thread): (self.sender.pk, first.pk, 1)})
+        reply = send_message(self.receiver, self.sender, 'Re: Hello', 'Yes', thread=first.thread)
+        self.assertInbox({(self.sender.pk, thread): (self.receiver.pk, reply.pk, 1), (self.receiver.pk, thread): (self.sender.pk, reply.pk, 1)})
+
+    def test_deleting_the_latest_message(self):
+        first = send_message(self.sender, self.receiver, 'Hello', 'Are you free on Monday?')
+        send_message(self.sender, self.receiver, 'Hello', 'Or Tuesday?', thread=first.thread).delete()
+        thread = first.thread_id
+        self.assertInbox({(self.sender.pk, thread): (self.receiver.pk, first.pk, 0), (self.receiver.pk, thread): (self.sender.pk, first.pk, 1)})
+        first.delete()
+        self.assertInbox({})
+
+    def test_mark_read(self):
+        first = send_message(self.sender, self.receiver, 'Hello', 'Are you free on Monday?')
+        second = send_message(self.sender, self.receiver, 'Hello', 'Or Tuesday?', thread=first.thread)
+        thread = first.thread_id
+        self.assertEqual(mark_read(self.receiver, message_ids=[first.pk]), 1)
+        self.assertInbox({(self.sender.pk, thread): (self.receiver.pk, second.pk, 0), (self.receiver.pk, thread): (self.sender.pk, second.pk, 1)})
+        self.assertEqual(mark_read(self.receiver), 1)
+        self.assertEqual(self.inbox()[self.receiver.pk, thread], (self.sender.pk, second.pk, 0))
+
+    def test_edits_outside_send_and_read_keep_the_summary(self):
+        message = send_message(self.sender, self.receiver, 'Hello', 'Are you free on Monday?')
+        thread = message.thread_id
+        message.read = True
+        message.save()
+        self.assertEqual(self.inbox()[self.receiver.pk, thread], (self.sender.pk, message.pk, 0))
+        message.read = False
+        message.receiver = self.other
+        message.save()
+        self.assertInbox({(self.sender.pk, thread): (self.other.pk, message.pk, 0), (self.other.pk, thread): (self.sender.pk, message.pk, 1)})
+
+    def test_rebuild_repairs_drifted_rows(self):
+        message = send_message(self.sender, self.receiver, 'Hello', 'Are you free on Monday?')
+        expected = self.inbox()
+        InboxEntry.objects.filter(user=self.receiver).update(unread_count=5, last_message=None)
+        InboxEntry.objects.filter(user=self.sender).delete()
+        self.assertEqual(rebuild_inbox([message.thread_id]), 2)
+        self.assertEqual(self.inbox(), expected)
+
+
+class MatchingTests(TestCase):
+    def terms(self, therapist):
+        return dict(SpecializationTerm.objects.filter(therapist__profile__user=therapist).values_list('term', 'weight'))
+
+    def test_profile_saves_update_the_index(self):
+        therapist = make_user('therapist', role='therapist')
+        self.assertEqual(self.terms(therapist), {'cbt': 1, 'anxiety': 2})
+        profile = TherapistProfile.objects.get(profile__user=therapist)
+        profile.specializations = 'Depression and phobias'
+        profile.certifications = 'CBT for anxiety'
+        profile.save()
+        self.assertEqual(self.terms(therapist), {'cbt': 1, 'anxiety': 1, 'depression': 2, 'phobia': 2})
+
+    def test_ranking_by_overlap_gender_and_load(self):
+        both = make_user('both', role='therapist', specializations='anxiety, insomnia')
+        female = make_user('female', role='therapist', gender='Female')
+        plain = make_user('plain', role='therapist')
+        busy = make_user('busy', role='therapist')
+        make_user('grief', role='therapist', specializations='grief', certifications='EMDR')
+        client_user = make_user('client')
+        for days in (1, 2):
+            Appointment.objects.create(client=client_user, therapist=busy, date=timezone.now() + timedelta(days=days))
+        client_profile = ClientProfile(specific_issues='Anxiety attacks', therapy_goals='Sleep through insomnia', preferred_therapist_gender='Female')
+        with self.assertNumQueries(1):
+            ranked = match_therapists(client_profile, k=3)
+        self.assertEqual([therapist.profile.user for _, therapist in ranked], [both, female, plain])
+        self.assertAlmostEqual(ranked[0][0], 3.0 * 4 + 0.1 * 5)
+        ranked = match_therapists(client_profile)
+        self.assertEqual([therapist.profile.user for _, therapist in ranked][-1], busy)
+        self.assertAlmostEqual(ranked[-1][0], 3.0 * 2 + 0.1 * 5 - 0.2 * 2)
+        self.assertEqual(match_therapists(ClientProfile(specific_issues='the and', therapy_goals='', preferred_therapist_gender='Female')), [])
+
+
+# The sections render on pool threads with connections of their own, which only see committed rows
+class AsyncDashboardTests(TransactionTestCase):
+    def setUp(self):
+        fragment_cache().clear()
+        self.client_user = make_user('client')
+        self.therapist = make_user('therapist', role='therapist')
+        Appointment.objects.create(client=self.client_user, therapist=self.therapist, date=next_weekday(0, 10))
+        Goal.objects.create(client=self.client_user, title='Sleep better', description='', start_date=timezone.localdate(), end_date=timezone.localdate(), progress=10)
+        send_message(self.therapist, self.client_user, 'Hello', 'See you on Monday')
+
+    def content(self, response):
+        self.assertEqual(response.status_code, 200)
+        return re.sub(r'name="csrfmiddlewaretoken" value="[^"]*"', '', response.content.decode())
+
+    async def render_both(self, user, name):
+        await self.async_client.aforce_login(user)
+        await sync_to_async(self.client.force_login)(user)
+        await sync_to_async(fragment_cache().clear)()
+        sync = await sync_to_async(self.client.get)(reverse(name))
+        await sync_to_async(fragment_cache().clear)()
+        return self.content(sync), self.content(await self.async_client.get(reverse(f'{name}_async')))
+
+    async def test_async_dashboards_render_the_sync_sections(self):
+        # Every section in the first response, so the async view renders them all on the pool
+        every_section = [section for sections in DASHBOARD_SECTIONS.values() for section in sections]
+        pooled = mock.patch('core.dashboards._call_and_close', wraps=dashboards._call_and_close)
+        with mock.patch('core.views.ABOVE_THE_FOLD', every_section), pooled as call_and_close:
+            for user, name in ((self.client_user, 'client_dashboard'), (self.therapist, 'therapist_dashboard')):
+                sync, async_ = await self.render_both(user, name)
+                self.assertIn('Sleep better', sync)
+                self.assertIn('See you on Monday', sync)
+                self.assertNotIn('lazy-section"', sync)
+                self.assertEqual(async_, sync)
+        self.assertEqual(call_and_close.call_count, len(every_section))
+
+    async def test_async_schedule_page_matches_the_sync_one(self):
+        sync, async_ = await self.render_both(self.client_user, 'schedule_appointment')
+        self.assertIn('Schedule Appointment', sync)
+        self.assertEqual(async_, sync)
+
+    async def test_posts_go_to_the_sync_views(self):
+        await self.async_client.aforce_login(self.client_user)
+        data = {'goal_form': '', 'title': 'Run', 'description': 'Twice a week', 'start_date': '2026-01-01', 'end_date': '2026-06-01', 'progress': 0}
+        response = await self.async_client.post(reverse('client_dashboard_async'), data)
+        self.assertRedirects(response, reverse('client_dashboard'), fetch_redirect_response=False)
+        self.assertTrue(await Goal.objects.filter(client=self.client_user, title='Run').aexists())
+        data = {'therapist': self.therapist.pk, 'date': next_weekday(1, 10).strftime('%Y-%m-%d %H:%M'), 'notes': '', 'repeat': 0, 'occurrences': 1}
+        response = await self.async_client.post(reverse('schedule_appointment_async'), data)
+        self.assertRedirects(response, reverse('client_dashboard'), fetch_redirect_response=False)
+        self.assertEqual(await Appointment.objects.filter(client=self.client_user).acount(), 2)
+
+
+class MetricsTests(TestCase):
+    def registry(self, directory=None):
+        registry = Registry(directory)
+        registry.counter('jobs_total', 'Jobs run.', ['queue'])
+        registry.histogram('job_seconds', 'Job duration.', buckets=[0.1, 1])
+        registry.gauge('backlog', 'Jobs waiting.', lambda: {(): 7})
+        return registry
+
+    def test_exposition(self):
+        registry = self.registry()
+        registry.metrics['jobs_total'].inc('mail')
+        registry.metrics['jobs_total'].inc('mail', amount=2)
+        registry.metrics['job_seconds'].observe(0.05)
+        registry.metrics['job_seconds'].observe(0.5)
+        registry.metrics['job_seconds'].observe(5)
+        self.assertEqual(registry.exposition().splitlines(), [
+            '# HELP jobs_total Jobs run.', '# TYPE jobs_total counter', 'jobs_total{queue="mail"} 3',
+            '# HELP job_seconds Job duration.', '# TYPE job_seconds histogram',
+            'job_seconds_bucket{le="0.1"} 1', 'job_seconds_bucket{le="1"} 2', 'job_seconds_bucket{le="+Inf"} 3',
+            'job_seconds_count 3', 'job_seconds_sum 5.55',
+            '# HELP backlog Jobs waiting.', '# TYPE backlog gauge', 'backlog 7',
+        ])
+
+    def test_workers_are_summed_and_dead_ones_dropped(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        directory = directory.name
+        first, second = self.registry(directory), self.registry(directory)
+        first.metrics['jobs_total'].inc('mail')
+        first.flush()
+        second.metrics['jobs_total'].inc('mail', amount=2)
+        # Same pid, another start: a worker given the pid of a dead one does not overwrite its file
+        self.assertNotEqual(first.path(), second.path())
+        self.assertEqual(second.collect()['jobs_total'], {('mail',): 3})
+
+        dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+        dead.wait()
+        with open(os.path.join(directory, f'metrics-{dead.pid}-1.json'), 'w', encoding='utf-8') as f:
+            json.dump({'jobs_total': [[['mail'], 100]]}, f)
+        self.assertEqual(second.collect()['jobs_total'], {('mail',): 103})
+        second.flush()
+        self.assertEqual(sorted(os.listdir(directory)), sorted(os.path.basename(r.path()) for r in (first, second)))
+        self.assertEqual(first.collect()['jobs_total'], {('mail',): 3})
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_need_the_token_or_staff(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+        response = self.client.get(url, headers={'Authorization': 'Bearer secret'})
+        self.assertContains(response, '# TYPE http_requests_total counter')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        user = make_user('user')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_an_empty_token_lets_no_scraper_in(self):
+        self.assertEqual(self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer '}).status_code, 403)
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import home, register, register_role, activate, dashboard, register_therapist, client_dashboard, therapist_dashboard, schedule_appointment, confirm_appointment
+from .views import home, register, register_role, activate, dashboard, register_therapist, client_dashboard, therapist_dashboard, schedule_appointment, confirm_appointment, free_slots, free_therapists, resource_catalog, caseload_analytics, update_goal_progress, client_dashboard_async, dashboard_section, therapist_dashboard_async, schedule_appointment_async, message_events, mark_messages_read, message_thread, confirm_selected_appointments, request_timings, metrics, autocomplete_therapists, autocomplete_receivers
 
 urlpatterns = [
     path('', home, name='home'),
@@ -10,6 +10,23 @@ urlpatterns = [
     path('dashboard/', dashboard, name='dashboard'),
     path('client_dashboard/', client_dashboard, name='client_dashboard'),
     path('therapist_dashboard/', therapist_dashboard, name='therapist_dashboard'),
+    path('dashboard/<str:role>/sections/<str:section>/', dashboard_section, name='dashboard_section'),
+    path('async/client_dashboard/', client_dashboard_async, name='client_dashboard_async'),
+    path('async/therapist_dashboard/', therapist_dashboard_async, name='therapist_dashboard_async'),
+    path('async/schedule_appointment/', schedule_appointment_async, name='schedule_appointment_async'),
+    path('messages/<int:thread_id>/', message_thread, name='message_thread'),
+    path('messages/events/', message_events, name='message_events'),
+    path('messages/read/', mark_messages_read, name='mark_messages_read'),
+    path('caseload/', caseload_analytics, name='caseload_analytics'),
+    path('goals/<int:goal_id>/progress/', update_goal_progress, name='update_goal_progress'),
+    path('resources/', resource_catalog, name='resource_catalog'),
     path('schedule_appointment/', schedule_appointment, name='schedule_appointment'),
+    path('therapists/<int:therapist_id>/free_slots/', free_slots, name='free_slots'),
+    path('therapists/free/', free_therapists, name='free_therapists'),
+    path('autocomplete/therapists/', autocomplete_therapists, name='autocomplete_therapists'),
+    path('autocomplete/receivers/', autocomplete_receivers, name='autocomplete_receivers'),
+    path('confirm_appointments/', confirm_selected_appointments, name='confirm_selected_appointments'),
     path('confirm_appointment/<int:appointment_id>/', confirm_appointment, name='confirm_appointment'),
+    path('profiling/routes/', request_timings, name='request_timings'),
+    path('metrics/', metrics, name='metrics'),
 ]
@@ -1,34 +1,53 @@
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth.models import User
-from django.utils.encoding import force_str, force_bytes
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.template.loader import render_to_string
-from django.core.mail import send_mail
-from django.http import HttpResponse
-from .forms import UserForm, ProfileForm, ClientProfileForm, TherapistProfileForm, GoalForm, ResourceForm, MessageForm, PrivacySettingForm, FeedbackForm, AppointmentForm
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+from django.contrib.auth.models import User
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_decode
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
+from django.views.decorators.http import require_POST
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.utils.dateparse import parse_datetime
+from .forms import UserForm, ProfileForm, ClientProfileForm, TherapistProfileForm, GoalForm, GoalProgressForm, ResourceForm, MessageForm, ReplyForm, PrivacySettingForm, FeedbackForm, AppointmentForm
 from .tokens import account_activation_token
 from datetime import datetime
 from django.utils import timezone
-from .models import Appointment, Goal, Resource, Message, PrivacySetting, Feedback
+from .models import Appointment, ClientProfile, Goal, InboxEntry, PrivacySetting
+from .availability import book_appointment, book_series, confirm_appointments, next_free_slots, therapists_free_at
+from .matching import match_therapists
+from .directory import counterpart_ids, search_users
+from .mail import queue_verification_email
+import asyncio
+from asgiref.sync import sync_to_async
+from .dashboards import ABOVE_THE_FOLD, DASHBOARD_SECTIONS, adashboard_fragments, dashboard_fragments, fan_out, page_cursors, report_query_count
+from .catalog import MAX_CATALOG_PAGE, resource_page
+from .media import can_access, serve_file
+from .progress import caseload
+from .events import get_broker, sse_frame, user_channel
+from .messaging import mark_read, send_message, unread_count
+from .pagination import InvalidCursor, KeysetPaginator
+from .profiling import WINDOW_SECONDS, WINDOWS, route_summaries
+from .metrics import ACTIVATIONS, REGISTRATIONS, VERIFICATION_EMAILS, registry
+import hmac
+
+THREAD_PAGE_SIZE = 50
 
 def send_verification_email(user, request):
-    mail_subject = 'Activate your account.'
-    message = render_to_string('core/acc_active_email.html', {
-        'user': user,
-        'domain': request.META['HTTP_HOST'],
-        'uid': urlsafe_base64_encode(force_bytes(user.pk)),
-        'token': account_activation_token.make_token(user),
-    })
-    to_email = user.email
-    send_mail(mail_subject, message, 'happytheraconnect@gmail.com', [to_email])
+    # Queued rather than sent, the process_mail_queue worker delivers it
+    queue_verification_email(user, request.get_host())
+    VERIFICATION_EMAILS.inc()
 
 def register(request):
     if request.method == 'POST':
         user_form = UserForm(request.POST)
         profile_form = ProfileForm(request.POST)
-        client_form = ClientProfileForm(request.POST)
+        client_form = ClientProfileForm(request.POST, request.FILES)
         if user_form.is_valid() and profile_form.is_valid() and client_form.is_valid():
             user = user_form.save(commit=False)
             user.is_active = False  # Deactivate account till it is confirmed
@@ -41,11 +60,8 @@ def register(request):
             client_profile.profile = profile
             client_profile.save()
             send_verification_email(user, request)
+            REGISTRATIONS.inc('client')
             return HttpResponse('Please confirm your email address to complete the registration')
-        else:
-            print(user_form.errors)
-            print(profile_form.errors)
-            print(client_form.errors)
     else:
         user_form = UserForm()
         profile_form = ProfileForm()
@@ -62,8 +78,10 @@ def activate(request, uidb64, token):
         user.is_active = True
         user.save()
         login(request, user)
+        ACTIVATIONS.inc('ok')
         return redirect('dashboard')
     else:
+        ACTIVATIONS.inc('invalid')
         return HttpResponse('Activation link is invalid!')
 
 def register_role(request, user_id):
@@ -112,6 +130,7 @@ def register_therapist(request):
             therapist_profile.profile = profile
             therapist_profile.save()
             send_verification_email(user, request)
+            REGISTRATIONS.inc('therapist')
             return HttpResponse('Please confirm your email address to complete the registration')
     else:
         user_form = UserForm()
@@ -126,30 +145,42 @@ def home(request):
 def dashboard(request):
     return render(request, 'core/dashboard.html')
 
-@login_required
-def client_dashboard(request):
-    # Fetching upcoming and past appointments
-    upcoming_appointments = Appointment.objects.filter(client=request.user, date__gte=timezone.now()).order_by('date')
-    past_appointments = Appointment.objects.filter(client=request.user, date__lt=timezone.now()).order_by('-date')
-
-    # Fetching the therapist associated with the client
-    therapist = request.user.appointments.first().therapist if request.user.appointments.exists() else None
+def _section_forms(role, section, user):
+    # Only the forms of the sections being rendered are built
+    if section == 'goals' and role == 'client':
+        return {'goal_form': GoalForm()}
+    if section == 'resources':
+        return {'resource_form': ResourceForm()}
+    if section == 'messages':
+        return {'message_form': MessageForm()}
+    if section == 'feedback' and role == 'client':
+        return {'feedback_form': FeedbackForm(client=user)}
+    return {}
 
-    # Fetching the goals associated with the client
-    goals = Goal.objects.filter(client=request.user).order_by('-start_date')
+def _render_panel(request, role, section, fragment, forms=None):
+    context = {'role': role, 'section': section, 'fragment': fragment}
+    context.update(forms or _section_forms(role, section, request.user))
+    return render_to_string('core/dashboard_panel.html', context, request=request)
 
-    # Fetching all resources
-    resources = Resource.objects.all()
+def _eager_sections(request, forms):
+    # Above the fold, any list paged through by a link, and a section whose form has errors to show
+    return set(ABOVE_THE_FOLD) | set(page_cursors(request.GET)) | set(forms)
 
-    # Fetching sent and received messages
-    sent_messages = Message.objects.filter(sender=request.user).order_by('-timestamp')
-    received_messages = Message.objects.filter(receiver=request.user).order_by('-timestamp')
-
-    # Fetching or creating privacy settings for the client
-    privacy_setting, created = PrivacySetting.objects.get_or_create(client=request.user)
+def _render_dashboard(request, role, fragments, forms):
+    # Sections without a fragment become placeholders the page fetches from dashboard_section
+    panels = {}
+    for section in DASHBOARD_SECTIONS[role]:
+        if section in fragments:
+            html = _render_panel(request, role, section, fragments[section], forms.get(section))
+        else:
+            html = render_to_string('core/lazy_section.html', {'url': reverse('dashboard_section', args=[role, section])})
+        panels[section] = mark_safe(html)
+    return render(request, f'core/{role}_dashboard.html', {'panels': panels})
 
-    # Fetching feedback
-    feedbacks = Feedback.objects.filter(client=request.user).order_by('-timestamp')
+@login_required
+@report_query_count
+def client_dashboard(request):
+    forms = {}  # Bound forms of a failed submission, by section
 
     # Handling form submissions
     if request.method == 'POST':
@@ -160,79 +191,46 @@ def client_dashboard(request):
                 new_goal.client = request.user
                 new_goal.save()
                 return redirect('client_dashboard')
+            forms['goals'] = {'goal_form': goal_form}
         elif 'resource_form' in request.POST:
             resource_form = ResourceForm(request.POST, request.FILES)
             if resource_form.is_valid():
                 resource_form.save()
                 return redirect('client_dashboard')
+            forms['resources'] = {'resource_form': resource_form}
         elif 'message_form' in request.POST:
-            message_form = MessageForm(request.POST)
+            message_form = MessageForm(request.POST, user=request.user)
             if message_form.is_valid():
-                new_message = message_form.save(commit=False)
-                new_message.sender = request.user
-                new_message.save()
+                # Starts a new thread; replies are sent from the thread page
+                send_message(request.user, **message_form.cleaned_data)
                 return redirect('client_dashboard')
+            forms['messages'] = {'message_form': message_form}
         elif 'privacy_form' in request.POST:
+            privacy_setting, created = PrivacySetting.objects.get_or_create(client=request.user)
             privacy_form = PrivacySettingForm(request.POST, instance=privacy_setting)
             if privacy_form.is_valid():
                 privacy_form.save()
                 return redirect('client_dashboard')
+            forms['privacy'] = {'privacy_form': privacy_form}
         elif 'feedback_form' in request.POST:
-            feedback_form = FeedbackForm(request.POST)
+            feedback_form = FeedbackForm(request.POST, client=request.user)
             if feedback_form.is_valid():
                 new_feedback = feedback_form.save(commit=False)
                 new_feedback.client = request.user
+                new_feedback.therapist = new_feedback.appointment.therapist
                 new_feedback.save()
                 return redirect('client_dashboard')
-    else:
-        goal_form = GoalForm()
-        resource_form = ResourceForm()
-        message_form = MessageForm()
-        privacy_form = PrivacySettingForm(instance=privacy_setting)
-        feedback_form = FeedbackForm()
-
-    # Rendering the client dashboard template
-    return render(request, 'core/client_dashboard.html', {
-        'upcoming_appointments': upcoming_appointments,
-        'past_appointments': past_appointments,
-        'therapist': therapist,
-        'goals': goals,
-        'resources': resources,
-        'sent_messages': sent_messages,
-        'received_messages': received_messages,
-        'privacy_setting': privacy_setting,
-        'feedbacks': feedbacks,
-        'goal_form': goal_form,
-        'resource_form': resource_form,
-        'message_form': message_form,
-        'privacy_form': privacy_form,
-        'feedback_form': feedback_form
-    })
+            forms['feedback'] = {'feedback_form': feedback_form}
+
+    # Sections come from the per-user fragment cache, only the ones that changed hit the database
+    sections = _eager_sections(request, forms)
+    fragments = dashboard_fragments('client', request.user, sections=sections, cursors=page_cursors(request.GET))
+    return _render_dashboard(request, 'client', fragments, forms)
 
 @login_required
+@report_query_count
 def therapist_dashboard(request):
-    # Fetching upcoming and past appointments
-    upcoming_appointments = Appointment.objects.filter(therapist=request.user, date__gte=timezone.now()).order_by('date')
-    past_appointments = Appointment.objects.filter(therapist=request.user, date__lt=timezone.now()).order_by('-date')
-
-    # Fetching the therapist profile
-    therapist_profile = request.user.therapistprofile
-
-    # Fetching the goals of clients associated with the therapist
-    client_goals = Goal.objects.filter(client__appointments__therapist=request.user).order_by('-start_date')
-
-    # Fetching all resources
-    resources = Resource.objects.all()
-
-    # Fetching sent and received messages
-    sent_messages = Message.objects.filter(sender=request.user).order_by('-timestamp')
-    received_messages = Message.objects.filter(receiver=request.user).order_by('-timestamp')
-
-    # Fetching or creating privacy settings for the therapist
-    privacy_setting, created = PrivacySetting.objects.get_or_create(client=request.user)
-
-    # Fetching feedback from clients
-    feedbacks = Feedback.objects.filter(client__appointments__therapist=request.user).order_by('-timestamp')
+    forms = {}  # Bound forms of a failed submission, by section
 
     # Handling form submissions
     if request.method == 'POST':
@@ -241,59 +239,277 @@ def therapist_dashboard(request):
             if resource_form.is_valid():
                 resource_form.save()
                 return redirect('therapist_dashboard')
+            forms['resources'] = {'resource_form': resource_form}
         elif 'message_form' in request.POST:
-            message_form = MessageForm(request.POST)
+            message_form = MessageForm(request.POST, user=request.user)
             if message_form.is_valid():
-                new_message = message_form.save(commit=False)
-                new_message.sender = request.user
-                new_message.save()
+                # Starts a new thread; replies are sent from the thread page
+                send_message(request.user, **message_form.cleaned_data)
                 return redirect('therapist_dashboard')
+            forms['messages'] = {'message_form': message_form}
         elif 'privacy_form' in request.POST:
+            privacy_setting, created = PrivacySetting.objects.get_or_create(client=request.user)
             privacy_form = PrivacySettingForm(request.POST, instance=privacy_setting)
             if privacy_form.is_valid():
                 privacy_form.save()
                 return redirect('therapist_dashboard')
-    else:
-        resource_form = ResourceForm()
-        message_form = MessageForm()
-        privacy_form = PrivacySettingForm(instance=privacy_setting)
-
-    # Rendering the therapist dashboard template
-    return render(request, 'core/therapist_dashboard.html', {
-        'upcoming_appointments': upcoming_appointments,
-        'past_appointments': past_appointments,
-        'therapist_profile': therapist_profile,
-        'client_goals': client_goals,
-        'resources': resources,
-        'sent_messages': sent_messages,
-        'received_messages': received_messages,
-        'privacy_setting': privacy_setting,
-        'feedbacks': feedbacks,
-        'resource_form': resource_form,
-        'message_form': message_form,
-        'privacy_form': privacy_form
+            forms['privacy'] = {'privacy_form': privacy_form}
+
+    # Sections come from the per-user fragment cache, only the ones that changed hit the database
+    sections = _eager_sections(request, forms)
+    fragments = dashboard_fragments('therapist', request.user, sections=sections, cursors=page_cursors(request.GET))
+    return _render_dashboard(request, 'therapist', fragments, forms)
+
+@login_required
+@report_query_count
+def dashboard_section(request, role, section):
+    """One dashboard section on its own, fetched by the dashboard page when it is about to be seen."""
+    if section not in DASHBOARD_SECTIONS.get(role, {}):
+        raise Http404
+    fragments = dashboard_fragments(role, request.user, sections=[section], cursors=page_cursors(request.GET))
+    return HttpResponse(_render_panel(request, role, section, fragments[section]))
+
+# Async variants for ASGI servers. Submissions save files and send signals, so they still go
+# through the sync views on the shared sync thread; the page itself is loaded concurrently.
+
+@login_required
+async def client_dashboard_async(request):
+    if request.method == 'POST':
+        return await sync_to_async(client_dashboard)(request)
+    user = await request.auser()
+    fragments = await adashboard_fragments('client', user, sections=_eager_sections(request, {}), cursors=page_cursors(request.GET))
+    return await sync_to_async(_render_dashboard)(request, 'client', fragments, {})
+
+@login_required
+async def therapist_dashboard_async(request):
+    if request.method == 'POST':
+        return await sync_to_async(therapist_dashboard)(request)
+    user = await request.auser()
+    fragments = await adashboard_fragments('therapist', user, sections=_eager_sections(request, {}), cursors=page_cursors(request.GET))
+    return await sync_to_async(_render_dashboard)(request, 'therapist', fragments, {})
+
+def _recommended_therapists(user):
+    client_profile = ClientProfile.objects.filter(profile__user=user).first()
+    return [therapist for score, therapist in match_therapists(client_profile)] if client_profile else []
+
+@login_required
+async def schedule_appointment_async(request):
+    if request.method == 'POST':
+        # Booking locks the therapist row inside a transaction, that stays on the sync thread
+        return await sync_to_async(schedule_appointment)(request)
+    user = await request.auser()
+    form = AppointmentForm()
+    # Therapists are looked up as the client types, the recommendations are the only query
+    (recommended,) = await fan_out([(_recommended_therapists, user)])
+    return await sync_to_async(render)(request, 'core/schedule_appointment.html', {'form': form, 'recommended': recommended})
+
+async def _message_stream(user):
+    keepalive = getattr(settings, 'EVENT_STREAM_KEEPALIVE', 15)
+    async with get_broker().subscribe(user_channel(user.pk)) as subscription:
+        # Subscribed before counting, so no change can fall between the two
+        count = await sync_to_async(unread_count)(user.pk)
+        yield 'retry: 5000\n' + sse_frame({'type': 'unread', 'data': {'count': count}})
+        while not subscription.overflowed:
+            try:
+                event = await subscription.get(timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+            else:
+                yield sse_frame(event)
+        # Events were dropped; the browser reconnects and starts again from a fresh count
+        yield sse_frame({'type': 'resync', 'data': {}})
+
+async def message_events(request):
+    """Server-sent events with the user's new messages and unread count."""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponseForbidden()
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be tied up for as long as the stream stays open
+        return HttpResponse('Event streams need an ASGI server.', status=501, content_type='text/plain')
+    response = StreamingHttpResponse(_message_stream(user), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+def message_thread(request, thread_id):
+    # Only participants have an inbox row for the thread
+    entry = get_object_or_404(InboxEntry.objects.select_related('thread', 'other'), user=request.user, thread_id=thread_id)
+    form = ReplyForm(request.POST or None)
+    if request.method == 'POST' and form.is_valid():
+        send_message(request.user, entry.other, entry.thread.subject, form.cleaned_data['body'], thread=entry.thread)
+        return redirect('message_thread', thread_id=thread_id)
+    if entry.unread_count:
+        mark_read(request.user, thread=entry.thread)
+    # Newest messages first, older ones are further pages
+    paginator = KeysetPaginator(entry.thread.messages.select_related('sender'), ('-timestamp', '-id'), per_page=THREAD_PAGE_SIZE)
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        page = paginator.page()
+    return render(request, 'core/message_thread.html', {
+        'thread': entry.thread,
+        'other': entry.other,
+        'messages': page,
+        'form': form
     })
 
+@login_required
+@require_POST
+def mark_messages_read(request):
+    ids = request.POST.getlist('ids')
+    try:
+        message_ids = [int(value) for value in ids] if ids else None
+    except ValueError:
+        return HttpResponseBadRequest('Invalid message id')
+    mark_read(request.user, message_ids)
+    return JsonResponse({'unread': unread_count(request.user.pk)})
+
+@login_required
+def resource_catalog(request):
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 1
+    if page > MAX_CATALOG_PAGE:
+        raise Http404
+    context = resource_page(request.GET.get('q', ''), page)
+    return render(request, 'core/resource_catalog.html', context)
+
+@login_required
+def caseload_analytics(request):
+    # Read from the per-client rollups, the goals themselves are only touched for stalled ones
+    if not hasattr(request.user, 'profile') or request.user.profile.role != 'therapist':
+        raise Http404
+    return render(request, 'core/caseload.html', caseload(request.user))
+
+@login_required
+def update_goal_progress(request, goal_id):
+    goal = get_object_or_404(Goal.objects.select_related('client'), id=goal_id)
+    # The owner needs no lookup, anyone else has to be one of the client's therapists
+    is_owner = goal.client_id == request.user.id
+    is_therapist = not is_owner and Appointment.objects.filter(client_id=goal.client_id, therapist=request.user).exists()
+    if not is_owner and not is_therapist:
+        raise Http404
+    form = GoalProgressForm(request.POST or None, instance=goal)
+    if request.method == 'POST' and form.is_valid():
+        form.save()
+        return redirect('caseload_analytics' if is_therapist else 'client_dashboard')
+    return render(request, 'core/update_goal_progress.html', {'goal': goal, 'form': form})
+
+@login_required
+def protected_media(request, name):
+    # Every media file goes through the ownership check, never straight off the disk
+    if not can_access(request.user, name):
+        raise Http404
+    try:
+        return serve_file(request, name)
+    except (FileNotFoundError, SuspiciousFileOperation):
+        raise Http404
+
 @login_required
 def schedule_appointment(request):
     if request.method == 'POST':
         form = AppointmentForm(request.POST)
         if form.is_valid():
-            appointment = form.save(commit=False)
-            appointment.client = request.user
-            appointment.save()
-            return redirect('client_dashboard')
+            data = form.cleaned_data
+            try:
+                if data['repeat'] and data['occurrences'] > 1:
+                    book_series(request.user, data['therapist'], data['date'], data['occurrences'], data['repeat'], data['notes'])
+                else:
+                    book_appointment(request.user, data['therapist'], data['date'], data['notes'])
+            except ValidationError as e:
+                form.add_error('date', e)
+            else:
+                return redirect('client_dashboard')
     else:
         form = AppointmentForm()
 
-    return render(request, 'core/schedule_appointment.html', {'form': form})
+    # Suggesting the therapists whose specializations best fit the client's issues
+    recommended = _recommended_therapists(request.user)
+
+    return render(request, 'core/schedule_appointment.html', {'form': form, 'recommended': recommended})
+
+def _parse_moment(value):
+    # ValueError for anything that is not a real date and time, including ones like Feb 30
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(f'{value!r} is not an ISO 8601 date and time')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+@login_required
+def free_slots(request, therapist_id):
+    therapist = get_object_or_404(User, id=therapist_id, profile__role='therapist')
+    try:
+        after = _parse_moment(request.GET.get('after')) or timezone.now()
+    except ValueError:
+        return HttpResponseBadRequest('after must be an ISO 8601 date and time')
+    try:
+        count = min(int(request.GET.get('count', 5)), 50)
+    except ValueError:
+        return HttpResponseBadRequest('count must be a number')
+    slots = next_free_slots(therapist, count=count, after=after)
+    return JsonResponse({'therapist': therapist.username, 'slots': [slot.isoformat() for slot in slots]})
+
+@login_required
+def free_therapists(request):
+    try:
+        start = _parse_moment(request.GET.get('at'))
+    except ValueError:
+        start = None
+    if start is None:
+        return HttpResponseBadRequest('at must be an ISO 8601 date and time')
+    therapists = therapists_free_at(start)
+    return JsonResponse({'at': start.isoformat(), 'therapists': [{'id': t.id, 'username': t.username} for t in therapists]})
+
+def _user_choices(users):
+    return JsonResponse({'results': [{'id': user.id, 'username': user.username, 'name': user.get_full_name()} for user in users]})
+
+@login_required
+def autocomplete_therapists(request):
+    return _user_choices(search_users(request.GET.get('q', ''), role='therapist'))
+
+@login_required
+def autocomplete_receivers(request):
+    # Messages go to the people one already sees or talks to, not to anyone on the site
+    return _user_choices(search_users(request.GET.get('q', ''), among=counterpart_ids(request.user)))
 
 @login_required
 def confirm_appointment(request, appointment_id):
-    appointment = get_object_or_404(Appointment, id=appointment_id, therapist=request.user)
     if request.method == 'POST':
-        appointment.confirmed = True
-        appointment.save()
+        # A conditional UPDATE, nothing to fetch; it only touches the therapist's own appointment
+        if not confirm_appointments(request.user, [appointment_id]) and not Appointment.objects.filter(id=appointment_id, therapist=request.user).exists():
+            raise Http404
         return redirect('therapist_dashboard')
 
+    appointment = get_object_or_404(Appointment.objects.select_related('client'), id=appointment_id, therapist=request.user)
     return render(request, 'core/confirm_appointment.html', {'appointment': appointment})
+
+@login_required
+@require_POST
+def confirm_selected_appointments(request):
+    try:
+        appointment_ids = [int(value) for value in request.POST.getlist('appointment')]
+    except ValueError:
+        return HttpResponseBadRequest('Invalid appointment id')
+    confirm_appointments(request.user, appointment_ids)
+    return redirect('therapist_dashboard')
+
+@staff_member_required
+def request_timings(request):
+    # Latency histograms of this worker process only, in milliseconds
+    return JsonResponse({'window_seconds': WINDOW_SECONDS * WINDOWS, 'routes': route_summaries()})
+
+def metrics(request):
+    # Scrapers send METRICS_TOKEN as a bearer token, people can look while logged in as staff
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorization = request.headers.get('Authorization', '')
+    scraper = bool(token) and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+    if not scraper and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
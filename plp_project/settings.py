@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -60,6 +61,8 @@ JAZZMIN_SETTINGS = {
 }
 
 MIDDLEWARE = [
+    # First, so its timings cover all the other middleware too
+    'core.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,8 +78,15 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compiled templates are kept for the life of the process; runserver's autoreloader
+            # still resets them when a template changes
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -101,6 +111,42 @@ DATABASES = {
 }
 
 
+# Cache
+# Local memory by default, point DJANGO_CACHE_BACKEND at django.core.cache.backends.filebased.FileBasedCache
+# or django.core.cache.backends.redis.RedisCache to share dashboard fragments between workers.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('DJANGO_CACHE_LOCATION', 'theraconnect'),
+    }
+}
+
+DASHBOARD_FRAGMENT_TIMEOUT = 60 * 60  # Fragments are invalidated by signals, this only bounds memory use
+# Worker threads (and so database connections) async dashboards use to load sections concurrently
+DASHBOARD_FANOUT_WORKERS = int(os.environ.get('DASHBOARD_FANOUT_WORKERS', 32))
+
+# Pub/sub behind the message event stream; the in-process broker serves a single ASGI process
+EVENT_BROKER = os.environ.get('EVENT_BROKER', 'core.events.InProcessBroker')
+EVENT_STREAM_KEEPALIVE = 15  # Seconds between keepalive comments on idle streams
+
+# Request profiling, see core.profiling. With DEBUG, or for staff, responses get a Server-Timing
+# header; a sample of requests is profiled and the profiles of slow ones are written to PROFILING_DUMP_DIR.
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0.01))
+PROFILING_SLOW_MS = float(os.environ.get('PROFILING_SLOW_MS', 500))
+PROFILING_DUMP_DIR = os.environ.get('PROFILING_DUMP_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILING_DUMP_INTERVAL = 60  # Seconds, at most one profile per route in this time
+PROFILING_SERVER_TIMING = True
+PROFILING_TEMPLATES = DEBUG  # Time template and form rendering, this wraps Template.render process-wide
+
+# Prometheus metrics on /metrics/, scraped with METRICS_TOKEN as a bearer token. With several
+# worker processes point METRICS_DIR at a directory they share so every scrape sees them all;
+# one directory per host, workers remove the files of dead processes found in it.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = 5  # Seconds between a worker's writes to METRICS_DIR
+AUTOCOMPLETE_LIMIT = 10  # Users returned per keystroke by the receiver and therapist lookups
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -146,11 +192,32 @@ import os
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Uploads are checked for size and type while they stream in, see core.storage
+FILE_UPLOAD_HANDLERS = [
+    'core.storage.LimitedUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+UPLOAD_MAX_SIZE = 10 * 1024 * 1024  # 10 MB per file
+# Media files are only served after core.views.protected_media checked who is asking. Behind nginx set
+# MEDIA_ACCEL_REDIRECT_PREFIX to an `internal` location aliased to MEDIA_ROOT, behind Apache/lighttpd
+# set MEDIA_SENDFILE, and the bytes are sent by the front-end server instead of a worker.
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv('MEDIA_ACCEL_REDIRECT_PREFIX')
+MEDIA_SENDFILE = os.getenv('MEDIA_SENDFILE') == '1'
 SECURE_BROWSER_XSS_FILTER = True
 X_FRAME_OPTIONS = 'DENY'
 SECURE_CONTENT_TYPE_NOSNIFF = True
 # Email settings for Gmail
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'  # SMTP backend
+# Registration mail is queued in the database and delivered by `manage.py process_mail_queue`.
+# Set EMAIL_BACKEND to django.core.mail.backends.filebased.EmailBackend or .console.EmailBackend
+# to have the worker write mail locally instead of talking to Gmail.
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')  # SMTP backend
+EMAIL_FILE_PATH = os.getenv('EMAIL_FILE_PATH', os.path.join(BASE_DIR, 'sent_emails'))
+EMAIL_TIMEOUT = 10
+MAIL_QUEUE_MAX_ATTEMPTS = 8
+MAIL_QUEUE_RETRY_DELAY = 30  # Seconds, doubled on every failed attempt
+# `manage.py send_appointment_reminders` mails both sides this many minutes before a session
+APPOINTMENT_REMINDER_LEAD_TIMES = [24 * 60, 60]
 EMAIL_HOST = 'smtp.gmail.com'  # Gmail's SMTP server
 EMAIL_PORT = 587  # Port for TLS
 EMAIL_USE_TLS = True  # Use TLS encryption
@@ -15,15 +15,15 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
+
+from core.views import protected_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('core.urls')),
     path('grappelli/', include('grappelli.urls')), # Grappelli URLS
+    # Media is served with an ownership check in every environment, see core.media
+    re_path(r'^%s(?P<name>.+)$' % settings.MEDIA_URL.lstrip('/'), protected_media, name='protected_media'),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)